@@ -0,0 +1,239 @@
+"""Streaming alert detection, evaluated as readings are written.
+
+Every batch passes through AlertEngine.evaluate() inside the write
+transaction (see ingest.py). Each series (one per location for crowd
+density and CO2 level) keeps a fixed handful of numbers: an EWMA of the
+value and of its variance, plus the last value and ts. Against that state
+a reading can raise:
+
+    high_density    density above 70% (the dashboard's "high" rule)
+    anomaly         density more than Z_THRESHOLD standard deviations from
+                    the location's EWMA, or flagged anomalous by the sensor;
+                    the reading's anomaly column is set accordingly
+    density_spike   density moved DENSITY_SPIKE or more within SPIKE_WINDOW
+    high_co2        CO2 level above 500 ppm
+    co2_rising      CO2 rose CO2_RISE ppm or more within SPIKE_WINDOW
+
+Alerts are deduplicated per (type, location): while one is within
+COOLDOWN of its last occurrence, repeats only bump its count, value and
+last_ts. /api/alerts reads the active ones through the last_ts index.
+"""
+
+import math
+import os
+import time
+from datetime import datetime
+
+# Rule thresholds (density is stored as a 0-1 fraction)
+HIGH_DENSITY = 0.70
+HIGH_CO2 = 500
+Z_THRESHOLD = 3.0
+DENSITY_SPIKE = 0.30
+CO2_RISE = 100
+SPIKE_WINDOW_MS = 5 * 60000
+EWMA_ALPHA = 0.05
+WARMUP_READINGS = 30
+MIN_STD = 0.02
+
+COOLDOWN_MS = int(os.environ.get('CROWD_ALERT_COOLDOWN_S', 600)) * 1000
+ACTIVE_MS = int(os.environ.get('CROWD_ALERT_ACTIVE_S', 900)) * 1000
+MAX_ACTIVE = 50
+
+PRIORITIES = {
+    'high_density': 'high',
+    'anomaly': 'medium',
+    'density_spike': 'medium',
+    'high_co2': 'medium',
+    'co2_rising': 'low',
+}
+
+ACTIVE_SQL = '''
+    SELECT id, type, location, value, priority, first_ts, last_ts, occurrences
+    FROM alerts
+    WHERE last_ts >= ?
+    ORDER BY last_ts DESC
+    LIMIT ?
+'''
+
+
+def create_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY,
+        type TEXT NOT NULL,
+        location TEXT NOT NULL,
+        value REAL,
+        priority TEXT NOT NULL,
+        first_ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        occurrences INTEGER NOT NULL DEFAULT 1
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alerts_last_ts ON alerts (last_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alerts_location ON alerts (location, type, last_ts)')
+
+
+def ensure(conn):
+    create_tables(conn)
+
+
+class Series:
+    """EWMA mean/variance and the previous reading of one series"""
+    __slots__ = ('n', 'mean', 'var', 'last_ts', 'last_value')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.last_ts = None
+        self.last_value = None
+
+    def update(self, value):
+        """Fold in a value; returns its z-score against the state before it"""
+        if self.n == 0:
+            self.mean = value
+            z = 0.0
+        else:
+            delta = value - self.mean
+            z = delta / max(math.sqrt(self.var), MIN_STD)
+            self.mean += EWMA_ALPHA * delta
+            self.var = (1 - EWMA_ALPHA) * (self.var + EWMA_ALPHA * delta * delta)
+        self.n += 1
+        return z
+
+
+class AlertEngine:
+    def __init__(self):
+        self.series = {}
+        # (type, location) -> [alert id, last_ts] of the alert still cooling down
+        self.open = None
+        self.stats = {'evaluated': 0, 'raised': 0, 'suppressed': 0, 'eval_ms_total': 0.0}
+
+    def _load_open(self, conn, now_ms):
+        # Pick up cooldowns from before a restart
+        self.open = {}
+        for alert_id, kind, location, last_ts in conn.execute(
+                'SELECT id, type, location, last_ts FROM alerts WHERE last_ts >= ?', (now_ms - COOLDOWN_MS,)):
+            self.open[(kind, location)] = [alert_id, last_ts]
+
+    def _series(self, key):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = Series()
+        return series
+
+    def _crowd(self, row, fired):
+        location, value, ts = row['location'], row['density'], row['ts']
+        series = self._series(('density', location))
+        previous, previous_ts = series.last_value, series.last_ts
+        z = series.update(value)
+        if previous_ts is None or ts >= previous_ts:
+            series.last_value, series.last_ts = value, ts
+
+        if value > HIGH_DENSITY:
+            fired(row, 'high_density', round(value * 100, 1))
+        if (series.n > WARMUP_READINGS and abs(z) >= Z_THRESHOLD) or row.get('anomaly'):
+            row['anomaly'] = 1
+            fired(row, 'anomaly', round(value * 100, 1))
+        if previous is not None and 0 <= ts - previous_ts <= SPIKE_WINDOW_MS and abs(value - previous) >= DENSITY_SPIKE:
+            fired(row, 'density_spike', round((value - previous) * 100, 1))
+
+    def _carbon(self, row, fired):
+        location, value, ts = row['location'], row['co2_level'], row['ts']
+        series = self._series(('co2_level', location))
+        previous, previous_ts = series.last_value, series.last_ts
+        series.update(value)
+        if previous_ts is None or ts >= previous_ts:
+            series.last_value, series.last_ts = value, ts
+
+        if value > HIGH_CO2:
+            fired(row, 'high_co2', round(value, 1))
+        if previous is not None and 0 <= ts - previous_ts <= SPIKE_WINDOW_MS and value - previous >= CO2_RISE:
+            fired(row, 'co2_rising', round(value - previous, 1))
+
+    def evaluate(self, conn, table, rows):
+        """Run the rules over a batch (oldest first) and write the alerts it raises"""
+        if table == 'crowd_data':
+            check = self._crowd
+        elif table == 'carbon_data':
+            check = self._carbon
+        else:
+            return 0
+        started = time.perf_counter()
+        if self.open is None:
+            self._load_open(conn, max(row['ts'] for row in rows))
+
+        raised = {}
+
+        def fired(row, kind, value):
+            key = (kind, row['location'])
+            hit = raised.get(key)
+            if hit is None:
+                raised[key] = [value, row['ts'], row['ts'], 1]
+            else:
+                hit[0] = value
+                hit[1] = min(hit[1], row['ts'])
+                hit[2] = max(hit[2], row['ts'])
+                hit[3] += 1
+
+        for row in sorted(rows, key=lambda r: r['ts']):
+            check(row, fired)
+
+        updates = []
+        for key, (value, first_ts, last_ts, count) in raised.items():
+            current = self.open.get(key)
+            if current is not None and first_ts - current[1] < COOLDOWN_MS:
+                updates.append((value, last_ts, count, current[0]))
+                current[1] = max(current[1], last_ts)
+                self.stats['suppressed'] += count
+            else:
+                kind, location = key
+                alert_id = conn.execute(
+                    'INSERT INTO alerts (type, location, value, priority, first_ts, last_ts, occurrences) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (kind, location, value, PRIORITIES[kind], first_ts, last_ts, count)).lastrowid
+                self.open[key] = [alert_id, last_ts]
+                self.stats['raised'] += 1
+                self.stats['suppressed'] += count - 1
+        if updates:
+            conn.executemany('UPDATE alerts SET value = ?, last_ts = MAX(last_ts, ?), occurrences = occurrences + ? '
+                             'WHERE id = ?', updates)
+
+        self.stats['evaluated'] += len(rows)
+        self.stats['eval_ms_total'] += (time.perf_counter() - started) * 1000
+        return len(raised)
+
+    def reset(self):
+        self.series.clear()
+        self.open = None
+
+
+engine = AlertEngine()
+
+
+def evaluate(conn, table, rows):
+    return engine.evaluate(conn, table, rows)
+
+
+def active(conn, now_ms=None, limit=MAX_ACTIVE):
+    """Alerts seen within ACTIVE_MS, newest first, for /api/alerts"""
+    now_ms = now_ms or int(time.time() * 1000)
+    return [{
+        'id': alert_id,
+        'type': kind,
+        'location': location,
+        'value': value,
+        'priority': priority,
+        'timestamp': datetime.fromtimestamp(last_ts / 1000).isoformat(),
+        'first_seen': datetime.fromtimestamp(first_ts / 1000).isoformat(),
+        'occurrences': occurrences,
+    } for alert_id, kind, location, value, priority, first_ts, last_ts, occurrences
+        in conn.execute(ACTIVE_SQL, (now_ms - ACTIVE_MS, limit))]
+
+
+def stats():
+    s = dict(engine.stats)
+    s['series'] = len(engine.series)
+    s['open_alerts'] = len(engine.open or ())
+    s['readings_per_second'] = round(s['evaluated'] / (s['eval_ms_total'] / 1000), 1) if s['eval_ms_total'] else 0.0
+    return s
@@ -245,8 +245,13 @@ function createMiniChart(canvasId, color) {
 }
 
 // Initialize real-time connection
+let lastEventId = null;
+
 function initRealTimeConnection() {
-    eventSource = new EventSource('/stream');
+    // The browser resends Last-Event-ID on its own reconnects; when we
+    // rebuild the EventSource ourselves, pass it along so the server replays
+    const url = lastEventId ? `/stream?last_event_id=${encodeURIComponent(lastEventId)}` : '/stream';
+    eventSource = new EventSource(url);
     
     eventSource.onopen = function() {
         console.log('✅ Real-time connection established');
@@ -254,6 +259,9 @@ function initRealTimeConnection() {
     };
     
     eventSource.onmessage = function(event) {
+        if (event.lastEventId) {
+            lastEventId = event.lastEventId;
+        }
         const data = JSON.parse(event.data);
         handleRealTimeData(data);
     };
@@ -262,8 +270,10 @@ function initRealTimeConnection() {
         console.log('❌ Real-time connection lost');
         updateLiveIndicator('disconnected');
         
-        // Try to reconnect after 5 seconds
-        setTimeout(initRealTimeConnection, 5000);
+        // EventSource retries by itself; only rebuild it once it has given up
+        if (eventSource.readyState === EventSource.CLOSED) {
+            setTimeout(initRealTimeConnection, 5000);
+        }
     };
 }
 
@@ -288,29 +298,15 @@ function handleRealTimeData(data) {
 // Load initial data
 async function loadInitialData() {
     try {
-        // Load real-time metrics
-        const metrics = await fetch('/api/realtime-metrics').then(r => r.json());
-        updateMetrics(metrics);
-        
-        // Load live graph data
-        const liveData = await fetch('/api/live-graph').then(r => r.json());
-        updateLiveGraphs(liveData);
+        // One round trip for every dashboard section
+        const snapshot = await fetch('/api/dashboard?format=columnar').then(r => r.json());
         
-        // Load location data
-        const locations = await fetch('/api/location-data').then(r => r.json());
-        updateMap(locations);
-        
-        // Load alerts
-        const alerts = await fetch('/api/alerts').then(r => r.json());
-        updateAlerts(alerts);
-        
-        // Load system status
-        const status = await fetch('/api/system-status').then(r => r.json());
-        updateSystemStatus(status);
-        
-        // Load daily trends
-        const trends = await fetch('/api/daily-trends').then(r => r.json());
-        updateDailyTrends(trends);
+        updateMetrics(snapshot);
+        updateLiveGraphs(snapshot.graph);
+        updateMap(snapshot.locations);
+        updateAlerts(snapshot.alerts);
+        updateSystemStatus(snapshot.status);
+        updateDailyTrends(snapshot.trends);
         
     } catch (error) {
         console.error('Error loading initial data:', error);
@@ -389,13 +385,39 @@ function updateLiveCharts(data) {
     trendChart.update('none');
 }
 
+// Bucket labels (HH:MM) for a columnar time base: start + i * step, in
+// the server's local time
+function columnarTimeLabels(time) {
+    const labels = new Array(time.count);
+    for (let i = 0; i < time.count; i++) {
+        labels[i] = new Date(time.start + i * time.step + time.utc_offset).toISOString().substring(11, 16);
+    }
+    return labels;
+}
+
+// Day labels (MM-DD) from a columnar start date
+function columnarDayLabels(start, count, stepDays) {
+    const first = Date.parse(start + 'T00:00:00Z');
+    const labels = new Array(count);
+    for (let i = 0; i < count; i++) {
+        labels[i] = new Date(first + i * stepDays * 86400000).toISOString().substring(5, 10);
+    }
+    return labels;
+}
+
 // Update live graphs from API
 async function updateLiveGraphs(liveData) {
-    // Update crowd graph
-    const crowdGraph = liveData.crowd_graph || [];
-    const labels = crowdGraph.map(d => d.time);
-    const crowdData = crowdGraph.map(d => d.density);
-    const co2Data = liveData.co2_graph.map(d => d.co2);
+    let labels, crowdData, co2Data;
+    if (liveData.format === 'columnar') {
+        labels = columnarTimeLabels(liveData.time);
+        crowdData = liveData.crowd_graph.density;
+        co2Data = liveData.co2_graph.co2;
+    } else {
+        const crowdGraph = liveData.crowd_graph || [];
+        labels = crowdGraph.map(d => d.time);
+        crowdData = crowdGraph.map(d => d.density);
+        co2Data = liveData.co2_graph.map(d => d.co2);
+    }
     
     charts.liveTrend.data.labels = labels;
     charts.liveTrend.data.datasets[0].data = crowdData;
@@ -418,8 +440,8 @@ function updateMap(locations) {
         }
     });
     
-    // Add new markers
-    locations.forEach(location => {
+    // Add new markers (locations without registered coordinates are skipped)
+    locations.filter(location => location.lat != null && location.lng != null).forEach(location => {
         const color = location.status === 'high' ? '#f72585' : 
                      location.status === 'medium' ? '#ff9e00' : '#4cc9f0';
         
@@ -465,7 +487,8 @@ function updateAlerts(alerts) {
         
         const icon = alert.type === 'high_density' ? 'bi-people-fill' :
                     alert.type === 'anomaly' ? 'bi-exclamation-triangle-fill' :
-                    alert.type === 'high_co2' ? 'bi-cloud-fill' : 'bi-bell-fill';
+                    alert.type === 'high_co2' || alert.type === 'co2_rising' ? 'bi-cloud-fill' :
+                    alert.type === 'density_spike' ? 'bi-graph-up-arrow' : 'bi-bell-fill';
         
         const alertTime = new Date(alert.timestamp).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'});
         
@@ -494,11 +517,12 @@ function updateAlerts(alerts) {
 
 // Update system status
 function updateSystemStatus(status) {
-    const freshness = status.database.freshness_minutes || 0;
+    // null when the database holds no readings yet
+    const freshness = status.database.freshness_minutes;
     document.getElementById('data-freshness').textContent = 
-        `Data: ${freshness} min ago`;
+        freshness === null ? 'Data: none' : `Data: ${Math.round(freshness)} min ago`;
     document.getElementById('data-freshness').className = 
-        `badge ${freshness < 2 ? 'bg-success' : freshness < 5 ? 'bg-warning' : 'bg-danger'} me-2`;
+        `badge ${freshness === null ? 'bg-danger' : freshness < 2 ? 'bg-success' : freshness < 5 ? 'bg-warning' : 'bg-danger'} me-2`;
     
     document.getElementById('system-status').textContent = 
         `System: ${status.overall_status}`;
@@ -522,7 +546,7 @@ async function loadHistoricalAnalysis() {
     const days = document.getElementById('analysis-days').value;
     
     try {
-        const response = await fetch(`/api/historical-analysis?days=${days}`);
+        const response = await fetch(`/api/historical-analysis?days=${days}&format=columnar`);
         const data = await response.json();
         
         updateHistoricalChart(data);
@@ -539,8 +563,18 @@ function updateHistoricalChart(data) {
         charts.historical.destroy();
     }
     
-    const dailyData = data.daily_trends || [];
-    const labels = dailyData.map(d => d.date.substring(5)); // Remove year
+    let labels, crowdDensity, co2Level;
+    if (data.format === 'columnar') {
+        const daily = data.daily_trends;
+        labels = columnarDayLabels(daily.start, daily.crowd_density.length, daily.step_days);
+        crowdDensity = daily.crowd_density;
+        co2Level = daily.co2_level;
+    } else {
+        const dailyData = data.daily_trends || [];
+        labels = dailyData.map(d => d.date.substring(5)); // Remove year
+        crowdDensity = dailyData.map(d => d.crowd_density);
+        co2Level = dailyData.map(d => d.co2_level);
+    }
     
     charts.historical = new Chart(historicalCtx, {
         type: 'line',
@@ -549,7 +583,7 @@ function updateHistoricalChart(data) {
             datasets: [
                 {
                     label: 'Crowd Density (%)',
-                    data: dailyData.map(d => d.crowd_density),
+                    data: crowdDensity,
                     borderColor: chartColors.primary,
                     backgroundColor: chartColors.primary + '20',
                     tension: 0.4,
@@ -557,7 +591,7 @@ function updateHistoricalChart(data) {
                 },
                 {
                     label: 'CO₂ Level (ppm)',
-                    data: dailyData.map(d => d.co2_level),
+                    data: co2Level,
                     borderColor: chartColors.warning,
                     backgroundColor: chartColors.warning + '20',
                     tension: 0.4,
@@ -597,7 +631,7 @@ async function updateCharts() {
     const minutes = document.getElementById('time-range').value;
     
     try {
-        const response = await fetch(`/api/live-graph?minutes=${minutes}`);
+        const response = await fetch(`/api/live-graph?minutes=${minutes}&format=columnar`);
         const data = await response.json();
         updateLiveGraphs(data);
     } catch (error) {
@@ -656,7 +690,9 @@ function getAlertTitle(type) {
     const titles = {
         'high_density': 'High Crowd Density',
         'anomaly': 'Crowd Anomaly',
-        'high_co2': 'High CO₂ Level'
+        'high_co2': 'High CO₂ Level',
+        'density_spike': 'Sudden Crowd Change',
+        'co2_rising': 'Rising CO₂ Level'
     };
     return titles[type] || 'Alert';
 }
@@ -1,370 +1,592 @@
-from flask import Flask, render_template, jsonify, request, Response
+from flask import Blueprint, Flask, current_app, render_template, jsonify, request, Response
 from flask_cors import CORS
-import sqlite3
-import json
-import random
-from datetime import datetime, timedelta
-import pandas as pd
+import io
+import os
+from datetime import datetime
 import time
-import threading
 
-app = Flask(__name__)
-CORS(app)
+import alerts
+import broadcaster
+import dashboard
+import database
+import export
+import forecast
+import heatmap
+import hot_store
+import ingest
+import locations
+import metrics
+import migrate
+import profiler
+import realtime_updater
+import response_cache
+import retention
+import rollups
+import scenarios
+import sensors
+import serialization
+import sliding_window
+import timeseries
 
-# Database connection
-def get_db_connection():
-    conn = sqlite3.connect('crowd_mobility.db', check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Settings, each overridable with a CROWD_<NAME> environment variable (parsed
+# as JSON where possible, so CROWD_PORT=5001 is an int) or create_app(config)
+DEFAULT_CONFIG = {
+    # 'standalone' migrates the schema and writes in-process; 'reader' is one
+    # of several serve.py workers, which send writes to WRITER_ADDRESS
+    'ROLE': 'standalone',
+    'WRITER_ADDRESS': None,
+    'WRITER_AUTHKEY': None,
+    'HOST': '0.0.0.0',
+    'PORT': 5000,
+    'STREAM_INTERVAL': 5.0,
+    'INGEST_QUEUE_TIMEOUT': 10.0,
+    'INGEST_COMMIT_TIMEOUT': 30.0,
+    'INGEST_MAX_ERRORS': 50,
+}
+ROLES = ('standalone', 'reader')
+
+api = Blueprint('api', __name__)
+
+# In-memory views behind the read endpoints: this process's own, or in a
+# serve.py worker proxies for the writer process's (see ingest_server.py),
+# so a deployment keeps one copy however many workers it runs
+views = {
+    'window': sliding_window.metrics_window,
+    'hot': hot_store.hot_store,
+    'forecast': forecast.forecaster,
+}
+
+# Request latency and SQL time per endpoint (see metrics.py), plus the
+# sampled SQL profiler (see profiler.py); registered before compression so
+# the timing includes it
+def endpoint_name():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def start_request_timer():
+    metrics.begin_request()
+    profiler.profiler.begin(endpoint_name(), request.method)
+
+def record_request_metrics(response):
+    metrics.end_request(endpoint_name(), request.method, response.status_code)
+    profiler.profiler.end(response.status_code)
+    return response
+
+def record_failed_request(error):
+    # A request whose exception propagates never reaches after_request; both
+    # recorders ignore a request they have already finished
+    metrics.end_request(endpoint_name(), request.method, 500)
+    profiler.profiler.end(500)
+
+def compress_response(response):
+    return serialization.compress_response(response, request.headers.get('Accept-Encoding'))
 
 # Initialize database
-def init_database():
+def init_database(role='standalone'):
     try:
         # Just check if database exists, create_database.py should be run separately
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
+        with database.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            tables = cursor.fetchall()
         
         if len(tables) == 0:
             print("⚠️ Database is empty. Please run create_database.py first")
+        elif role == 'reader':
+            # The writer process owns the schema, retention, the in-memory views
+            # and the forecasts; this worker only reads them
+            return
         else:
+            # Older databases predate epoch-ms timestamps and the rollup tables
+            with database.write_connection() as conn:
+                migrate.migrate(conn)
+                rollups.ensure(conn)
+                locations.ensure(conn)
+                sensors.ensure(conn)
+                alerts.ensure(conn)
+            
+            # Load the 5-minute metrics window and keep it fed
+            sliding_window.start()
+            
+            # Recent readings as in-memory columns, loaded in the background
+            hot_store.start()
+            
+            # Per-location density forecasts, fitted in a process pool
+            forecast.start()
+            
+            # Expire old day partitions and rollups in the background
+            retention.start()
             print(f"✅ Database initialized with {len(tables)} tables")
-        
-        conn.close()
     except Exception as e:
         print(f"❌ Error: {e}")
 
 # Home page
-@app.route('/')
+@api.route('/')
 def index():
     return render_template('index.html')
 
+def metrics_window():
+    # Another process's commits reach the cache watermark before the
+    # follower's next poll; catch up so they aren't cached as stale
+    window = views['window']
+    if window.ready and window.behind(response_cache.response_cache.watermark.current()):
+        window.sync()
+    return window
+
+def current_metrics():
+    # Served from the in-memory sliding window once it is loaded
+    window = metrics_window()
+    if window.ready:
+        return dashboard.Snapshot(None, window=window).realtime_metrics()
+    with database.read_connection() as conn:
+        return dashboard.Snapshot(conn).realtime_metrics()
+
+def hot_tier():
+    # Catch up with commits the cache watermark has seen, as current_metrics() does
+    store = views['hot']
+    if store.ready and store.behind(response_cache.response_cache.watermark.current()):
+        store.sync()
+    return store
+
+# One producer builds each stream tick for every /stream client
+stream_broadcaster = broadcaster.Broadcaster(current_metrics, interval=5.0)
+
+# Readings posted to /api/ingest share one group-commit writer: this one in
+# a standalone process, the writer process's (via IngestClient) in a worker
+ingest_daemon = realtime_updater.IngestionDaemon()
+
+def ingest_writer():
+    return current_app.extensions['ingest_writer']
+
+# Polled routes are cached until new readings commit (or the TTL runs out)
+cached = response_cache.cached
+
 # Real-time metrics
-@app.route('/api/realtime-metrics')
+@api.route('/api/realtime-metrics')
+@cached(ttl=5)
 def get_realtime_metrics():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get latest crowd data
-    cursor.execute('''
-        SELECT AVG(density) as avg_density, 
-               COUNT(CASE WHEN anomaly = 1 THEN 1 END) as anomalies,
-               COUNT(*) as total_readings
-        FROM crowd_data 
-        WHERE timestamp > datetime('now', '-5 minutes')
-    ''')
-    crowd_stats = cursor.fetchone()
-    
-    # Get latest mobility data
-    cursor.execute('''
-        SELECT COUNT(DISTINCT vehicle_type) as vehicle_types,
-               SUM(co2_emission) as total_co2,
-               COUNT(*) as trips
-        FROM mobility_data 
-        WHERE timestamp > datetime('now', '-5 minutes')
-    ''')
-    mobility_stats = cursor.fetchone()
-    
-    # Get latest carbon data
-    cursor.execute('''
-        SELECT AVG(co2_level) as avg_co2,
-               COUNT(*) as readings
-        FROM carbon_data 
-        WHERE timestamp > datetime('now', '-5 minutes')
-    ''')
-    carbon_stats = cursor.fetchone()
-    
-    conn.close()
-    
-    # Calculate metrics
-    crowd_density = round((crowd_stats['avg_density'] or 0.5) * 100, 1)
-    anomalies = crowd_stats['anomalies'] or 0
-    vehicle_count = mobility_stats['vehicle_types'] or 5
-    total_co2 = round(mobility_stats['total_co2'] or 25.5, 2)
-    avg_co2 = round(carbon_stats['avg_co2'] or 450, 1)
-    
-    # Determine status
-    crowd_status = 'high' if crowd_density > 70 else 'normal'
-    co2_status = 'high' if avg_co2 > 500 else 'normal'
-    
-    metrics = {
-        'timestamp': datetime.now().isoformat(),
-        'crowd': {
-            'density': crowd_density,
-            'anomalies': anomalies,
-            'readings': crowd_stats['total_readings'] or 10,
-            'status': crowd_status
-        },
-        'mobility': {
-            'vehicle_types': vehicle_count,
-            'total_co2': total_co2,
-            'trips': mobility_stats['trips'] or 15,
-            'status': 'busy' if total_co2 > 30 else 'normal'
-        },
-        'carbon': {
-            'level': avg_co2,
-            'readings': carbon_stats['readings'] or 8,
-            'status': co2_status
-        }
-    }
-    
-    return jsonify(metrics)
+    return jsonify(current_metrics())
 
 # Live graph data
-@app.route('/api/live-graph')
+@api.route('/api/live-graph')
+@cached(ttl=5)
 def get_live_graph():
     minutes = request.args.get('minutes', 30, type=int)
+    step = request.args.get('step', 300, type=int)
+    fill = request.args.get('fill', 'none')
+    if fill not in timeseries.FILL_MODES:
+        return jsonify({'error': f"fill must be one of {', '.join(timeseries.FILL_MODES)}"}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Generate time points
-    times = []
-    crowd_data = []
-    co2_data = []
-    
-    for i in range(minutes, 0, -5):
-        time_point = datetime.now() - timedelta(minutes=i)
-        time_str = time_point.strftime('%H:%M')
-        
-        # Simulate crowd data
-        base_density = 50 + random.uniform(-20, 20)
-        if 8 <= time_point.hour <= 10 or 17 <= time_point.hour <= 20:
-            base_density += random.uniform(10, 30)
-        
-        # Simulate CO2 data
-        base_co2 = 25 + random.uniform(-10, 10)
-        if 8 <= time_point.hour <= 10 or 17 <= time_point.hour <= 20:
-            base_co2 += random.uniform(5, 15)
-        
-        times.append(time_str)
-        crowd_data.append(max(0, min(100, base_density)))
-        co2_data.append(max(0, base_co2))
-    
-    # Get vehicle distribution
-    cursor.execute('''
-        SELECT vehicle_type, COUNT(*) as count
-        FROM mobility_data 
-        WHERE timestamp > datetime('now', '-1 hour')
-        GROUP BY vehicle_type
-    ''')
-    
-    vehicle_dist = []
-    for row in cursor.fetchall():
-        vehicle_dist.append({
-            'vehicle': row['vehicle_type'],
-            'count': row['count']
-        })
-    
-    # If no real data, add sample data
-    if not vehicle_dist:
-        vehicle_dist = [
-            {'vehicle': 'Car', 'count': 25},
-            {'vehicle': 'Bus', 'count': 15},
-            {'vehicle': 'EV', 'count': 10},
-            {'vehicle': 'Bike', 'count': 8},
-            {'vehicle': 'Metro', 'count': 12}
-        ]
-    
-    conn.close()
+    try:
+        columnar = serialization.parse_format(request.args.get('format')) == 'columnar'
+        with database.read_connection() as conn:
+            graph = dashboard.Snapshot(
+                conn, minutes=minutes, step=step, fill=fill,
+                location=request.args.get('location'),
+                vehicle_type=request.args.get('vehicle_type'),
+                columnar=columnar,
+                hot=hot_tier()
+            ).graph()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'crowd_graph': [{'time': t, 'density': d} for t, d in zip(times, crowd_data)],
-        'co2_graph': [{'time': t, 'co2': c} for t, c in zip(times, co2_data)],
-        'vehicle_distribution': vehicle_dist,
-        'time_range': minutes
-    })
+    return jsonify(graph)
 
 # Daily trends
-@app.route('/api/daily-trends')
+@api.route('/api/daily-trends')
+@cached(ttl=60)
 def get_daily_trends():
     days = request.args.get('days', 7, type=int)
     
-    # Generate daily trend data
-    days_list = []
-    for i in range(days, -1, -1):
-        day = datetime.now() - timedelta(days=i)
-        days_list.append(day.strftime('%Y-%m-%d'))
-    
-    # Generate crowd trends by hour
-    crowd_trends = []
-    for hour in range(24):
-        base_density = 40 + random.uniform(-10, 10)
-        if 8 <= hour <= 10:
-            base_density += 20
-        elif 17 <= hour <= 20:
-            base_density += 25
-        
-        crowd_trends.append({
-            'hour': hour,
-            'density': max(0, min(100, base_density))
-        })
-    
-    # Generate mobility trends
-    mobility_trends = {}
-    for day in days_list:
-        mobility_trends[day] = [
-            {'vehicle_type': 'Car', 'trips': random.randint(20, 40)},
-            {'vehicle_type': 'Bus', 'trips': random.randint(15, 30)},
-            {'vehicle_type': 'EV', 'trips': random.randint(10, 25)},
-            {'vehicle_type': 'Bike', 'trips': random.randint(5, 20)}
-        ]
+    try:
+        with database.read_connection() as conn:
+            trends = dashboard.Snapshot(conn, days=days).trends()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'crowd_trends': crowd_trends,
-        'mobility_trends': mobility_trends,
-        'days': days
-    })
+    return jsonify(trends)
 
 # Location data
-@app.route('/api/location-data')
+@api.route('/api/location-data')
+@cached(ttl=5)
 def get_location_data():
-    locations = [
-        {"name": "Stadium Main Gate", "density": random.randint(60, 90), "anomalies": random.randint(0, 2), 
-         "lat": 12.9784, "lng": 77.5994, "status": "high"},
-        {"name": "Parking Lot A", "density": random.randint(40, 70), "anomalies": random.randint(0, 1), 
-         "lat": 12.9778, "lng": 77.6003, "status": "medium"},
-        {"name": "Metro Station", "density": random.randint(50, 80), "anomalies": random.randint(0, 1), 
-         "lat": 12.9780, "lng": 77.6010, "status": "medium"},
-        {"name": "Bus Terminal", "density": random.randint(55, 85), "anomalies": random.randint(0, 2), 
-         "lat": 12.9795, "lng": 77.5995, "status": "high"},
-        {"name": "Food Court", "density": random.randint(30, 60), "anomalies": 0, 
-         "lat": 12.9782, "lng": 77.5985, "status": "low"}
-    ]
+    # ?bbox=west,south,east,north limits it to the sensors in a map viewport
+    try:
+        bbox = sensors.parse_bbox(request.args['bbox']) if 'bbox' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    with database.read_connection() as conn:
+        locations = dashboard.Snapshot(conn, bbox=bbox).locations()
     
     return jsonify(locations)
 
-# Alerts
-@app.route('/api/alerts')
-def get_alerts():
-    alerts = []
+# Crowd density forecast for one location; precomputed by forecast.py,
+# so not response-cached
+@api.route('/api/forecast')
+def get_forecast():
+    location = request.args.get('location')
+    if not location:
+        return jsonify({'error': 'location is required', 'locations': views['forecast'].locations()}), 400
+    
+    try:
+        result = views['forecast'].forecast(location, request.args.get('hours', 24, type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except KeyError:
+        return jsonify({'error': f"no forecast for {location!r}"}), 404
+    except realtime_updater.QueueFull:
+        # A worker's forecasts come from the writer process, which is restarting
+        result = None
+    if result is None:
+        return jsonify({'error': 'forecast models are still being fitted'}), 503
+    
+    return jsonify(result)
+
+# Forecast fit time, prediction latency and freshness
+@api.route('/api/forecast-stats')
+def get_forecast_stats():
+    return jsonify(views['forecast'].stats())
+
+# Modal-shift CO2 scenarios over recent trips (see scenarios.py). GET prices
+# one shift from the query string, POST a batch:
+# {"hours": 168, "scenarios": [{"name": ..., "shifts": [{"from", "to", "share", "routes", "hours"}]}]}
+# Results are cached per watermark by the engine, not the response cache,
+# which can't tell POST bodies apart
+@api.route('/api/scenarios', methods=['GET', 'POST'])
+def get_scenarios():
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({'error': 'expected a JSON object with a list of scenarios'}), 400
+        batch = body.get('scenarios')
+        hours = body.get('hours', scenarios.DEFAULT_HOURS)
+    else:
+        batch = [{'name': 'query', 'shifts': [{
+            'from': request.args.get('from'),
+            'to': request.args.get('to'),
+            'share': request.args.get('share', 1.0),
+            'routes': request.args.getlist('route') or None,
+        }]}]
+        hours = request.args.get('hours', scenarios.DEFAULT_HOURS)
+        if isinstance(hours, str):
+            hours = int(hours) if hours.lstrip('-').isdigit() else hours
     
-    # Generate some random alerts
-    if random.random() > 0.3:
-        alerts.append({
-            'type': 'high_density',
-            'location': 'Stadium Main Gate',
-            'value': random.randint(75, 95),
-            'timestamp': datetime.now().isoformat(),
-            'priority': 'high'
-        })
+    try:
+        if isinstance(hours, bool) or not isinstance(hours, int):
+            raise ValueError('hours must be an integer')
+        with database.read_connection() as conn:
+            result = scenarios.engine.run(conn, batch, hours=hours,
+                                          watermark=response_cache.response_cache.watermark.current(),
+                                          hot=hot_tier())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if random.random() > 0.5:
-        alerts.append({
-            'type': 'anomaly',
-            'location': random.choice(['Parking Lot A', 'Metro Station']),
-            'timestamp': datetime.now().isoformat(),
-            'priority': 'medium'
-        })
+    return jsonify(result)
+
+# Grid heatmap of recent crowd density over a map viewport
+@api.route('/api/heatmap')
+@cached(ttl=5)
+def get_heatmap():
+    try:
+        bbox = sensors.parse_bbox(request.args.get('bbox'))
+        with database.read_connection() as conn:
+            result = heatmap.heatmap.view(
+                conn, bbox,
+                zoom=request.args.get('zoom', 16, type=int),
+                minutes=request.args.get('minutes', 15, type=int),
+                watermark=response_cache.response_cache.watermark.current()
+            )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if random.random() > 0.7:
-        alerts.append({
-            'type': 'high_co2',
-            'location': 'Bus Terminal',
-            'value': random.randint(520, 600),
-            'timestamp': datetime.now().isoformat(),
-            'priority': 'medium'
-        })
+    return jsonify(result)
+
+# Alerts
+@api.route('/api/alerts')
+@cached(ttl=5)
+def get_alerts():
+    with database.read_connection() as conn:
+        alerts = dashboard.Snapshot(conn).alerts()
     
     return jsonify(alerts)
 
 # System status
-@app.route('/api/system-status')
+@api.route('/api/system-status')
 def get_system_status():
-    status = {
-        'database': {
-            'status': 'online',
-            'last_update': datetime.now().isoformat(),
-            'freshness_minutes': random.randint(0, 2)
-        },
-        'data_streams': {
-            'crowd': {'status': 'active', 'updates_per_hour': random.randint(45, 60)},
-            'mobility': {'status': 'active', 'updates_per_hour': random.randint(30, 45)}
-        },
-        'alerts': {
-            'active_alerts': random.randint(0, 3),
-            'status': 'normal'
-        },
-        'overall_status': 'healthy'
-    }
+    with database.read_connection() as conn:
+        status = dashboard.Snapshot(conn).status()
     
     return jsonify(status)
 
 # Historical analysis
-@app.route('/api/historical-analysis')
+@api.route('/api/historical-analysis')
+@cached(ttl=60)
 def get_historical_analysis():
     days = request.args.get('days', 30, type=int)
+    try:
+        dashboard.bounded('days', days, 0, dashboard.MAX_DAYS)
+        columnar = serialization.parse_format(request.args.get('format')) == 'columnar'
+        with database.read_connection() as conn:
+            history = dashboard.Snapshot(conn, history_days=days, columnar=columnar).history()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Generate daily data
-    daily_data = []
-    for i in range(days, -1, -1):
-        day = datetime.now() - timedelta(days=i)
-        daily_data.append({
-            'date': day.strftime('%Y-%m-%d'),
-            'crowd_density': 50 + random.uniform(-15, 15),
-            'co2_level': 450 + random.uniform(-50, 50),
-            'vehicle_diversity': random.randint(4, 7)
-        })
+    return jsonify(history)
+
+# Batched dashboard snapshot (all sections in one round trip)
+@api.route('/api/dashboard')
+@cached(ttl=5)
+def get_dashboard():
+    try:
+        sections = dashboard.parse_sections(request.args.get('sections'))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'available': list(dashboard.SECTIONS + dashboard.OPTIONAL_SECTIONS)}), 400
     
-    # Generate hourly patterns
-    hourly_data = []
-    for hour in range(24):
-        base_density = 40 + random.uniform(-10, 10)
-        if 8 <= hour <= 10:
-            base_density += 25
-        elif 17 <= hour <= 20:
-            base_density += 30
-        
-        hourly_data.append({
-            'hour': hour,
-            'crowd_density': max(0, min(100, base_density)),
-            'co2_level': 400 + random.uniform(-50, 50) + (25 if 8 <= hour <= 10 or 17 <= hour <= 20 else 0)
-        })
+    try:
+        columnar = serialization.parse_format(request.args.get('format')) == 'columnar'
+        with database.read_connection() as conn:
+            snapshot = dashboard.Snapshot(
+                conn,
+                window=metrics_window(),
+                hot=hot_tier(),
+                columnar=columnar,
+                minutes=request.args.get('minutes', 30, type=int),
+                step=request.args.get('step', 300, type=int),
+                days=request.args.get('days', 7, type=int),
+                history_days=request.args.get('history_days', 30, type=int)
+            )
+            result = snapshot.collect(sections)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'daily_trends': daily_data,
-        'hourly_patterns': hourly_data,
-        'analysis_period': days
-    })
+    return jsonify(result)
 
 # Health check
-@app.route('/api/health')
+@api.route('/api/health')
 def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'json_encoder': current_app.config['JSON_ENCODER'],
+        'role': current_app.config['ROLE'],
+        'pid': os.getpid()
+    })
+
+# Prometheus metrics
+@api.route('/metrics')
+def get_metrics():
+    with database.read_connection() as conn:
+        body = metrics.render(conn)
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-cache'})
+
+# Sampled SQL profile: costliest statements per endpoint and recent slow ones
+@api.route('/api/sql-profile')
+def get_sql_profile():
+    return jsonify(profiler.profiler.report(limit=request.args.get('limit', 20, type=int)))
+
+# Hot tier statistics: rows held and memory per million readings
+@api.route('/api/hot-store-stats')
+def get_hot_store_stats():
+    return jsonify(views['hot'].stats())
+
+# Connection pool statistics
+@api.route('/api/db-stats')
+def get_db_stats():
+    return jsonify(database.pool_stats())
+
+# Alert engine statistics
+@api.route('/api/alert-stats')
+def get_alert_stats():
+    return jsonify(alerts.stats())
+
+# Response cache statistics
+@api.route('/api/cache-stats')
+def get_cache_stats():
+    return jsonify(response_cache.response_cache.stats())
+
+# Partition and retention statistics
+@api.route('/api/storage-stats')
+def get_storage_stats():
+    with database.read_connection() as conn:
+        return jsonify(retention.storage_stats(conn))
+
+# Stream fan-out statistics
+@api.route('/api/stream-stats')
+def get_stream_stats():
+    return jsonify(stream_broadcaster.stats())
+
+# Bulk ingestion of crowd, mobility and carbon readings
+@api.route('/api/ingest', methods=['POST'])
+def ingest_readings():
+    started = time.perf_counter()
+    writer = ingest_writer()
+    config = current_app.config
+    wait = request.args.get('wait', 'true').lower() not in ('0', 'false', 'no')
+    
+    # NDJSON is read line by line off the socket; arrays are parsed whole
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/ndjson'):
+        # werkzeug's stream reads a byte at a time when iterated; buffer it
+        records = ingest.iter_records(io.BufferedReader(request.stream, 1 << 16), lines=True)
+    else:
+        records = ingest.iter_records(request.get_data())
+    
+    batch = {table: [] for table in ingest.TABLES}
+    pending = 0
+    accepted = 0
+    rejected = 0
+    by_type = dict.fromkeys(ingest.RECORD_TYPES, 0)
+    errors = []
+    first_ticket = None
+    ticket = 0
+    
+    def result(**extra):
+        elapsed = time.perf_counter() - started
+        return dict({
+            'accepted': accepted,
+            'rejected': rejected,
+            'by_type': by_type,
+            'errors': errors,
+            'seconds': round(elapsed, 4),
+            'rows_per_second': round(accepted / elapsed, 1) if elapsed else None,
+        }, **extra)
+    
+    try:
+        for number, record, error in records:
+            if error is None:
+                try:
+                    table, row = ingest.validate(record)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                rejected += 1
+                if len(errors) < config['INGEST_MAX_ERRORS']:
+                    errors.append({'record': number, 'error': error})
+                continue
+            
+            batch[table].append(row)
+            by_type[record['type']] += 1
+            pending += 1
+            if pending >= writer.batch_size:
+                ticket = writer.submit(*batch.values(), timeout=config['INGEST_QUEUE_TIMEOUT'])
+                first_ticket = first_ticket or ticket - pending + 1
+                accepted += pending
+                batch = {table: [] for table in ingest.TABLES}
+                pending = 0
+        if pending:
+            ticket = writer.submit(*batch.values(), timeout=config['INGEST_QUEUE_TIMEOUT'])
+            first_ticket = first_ticket or ticket - pending + 1
+            accepted += pending
+    except ValueError as e:
+        return jsonify(result(error=str(e))), 400
+    except realtime_updater.QueueFull as e:
+        # Rows queued before the writer fell behind are still written
+        return jsonify(result(error=str(e))), 503, {'Retry-After': '1'}
+    
+    if not wait or not accepted:
+        return jsonify(result(committed=False)), 200 if accepted or not rejected else 400
+    if not writer.wait_committed(ticket, config['INGEST_COMMIT_TIMEOUT']):
+        return jsonify(result(committed=False, error='timed out waiting for the commit')), 202
+    if writer.failed(first_ticket, ticket):
+        return jsonify(result(committed=False, error=writer.stats()['last_error'])), 500
+    if writer is not ingest_daemon:
+        # Committed by the writer process: let this worker's cache see it now
+        response_cache.response_cache.watermark.bump()
+    return jsonify(result(committed=True))
+
+# Ingestion queue statistics
+@api.route('/api/ingest-stats')
+def get_ingest_stats():
+    return jsonify(ingest_writer().stats())
+
+# Raw history as CSV or Parquet, streamed in id order
+@api.route('/api/export/<table>')
+def export_table(table):
+    try:
+        job = export.Export.from_args(table, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    slot = export.acquire()
+    if slot is None:
+        return jsonify({'error': 'too many exports running, retry shortly'}), 429, {'Retry-After': '30'}
+    response = Response(job.stream(slot), mimetype=export.MIMETYPES[job.format], headers={
+        'Content-Disposition': f'attachment; filename="{job.filename()}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
     })
+    # Also frees the slot when the client goes away before the body starts
+    response.call_on_close(slot.release)
+    return response
+
+# Export statistics
+@api.route('/api/export-stats')
+def get_export_stats():
+    return jsonify(export.stats())
 
 # Real-time stream
-@app.route('/stream')
+@api.route('/stream')
 def stream():
-    def event_stream():
-        while True:
-            # Generate real-time data
-            data = {
-                'timestamp': datetime.now().isoformat(),
-                'crowd': [{
-                    'location': random.choice(['Main Gate', 'Parking Lot', 'Metro Station']),
-                    'density': random.uniform(0.4, 0.9),
-                    'timestamp': datetime.now().isoformat()
-                }],
-                'mobility': [{
-                    'vehicle_type': random.choice(['Car', 'Bus', 'EV']),
-                    'co2_emission': random.uniform(1, 5),
-                    'timestamp': datetime.now().isoformat()
-                }]
-            }
-            
-            yield f"data: {json.dumps(data)}\n\n"
-            time.sleep(5)  # Send data every 5 seconds
+    # EventSource resends Last-Event-ID on reconnect; manual reconnects pass it as a query arg
+    last_event_id = broadcaster.parse_last_event_id(
+        request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    subscriber = stream_broadcaster.subscribe(last_event_id)
+    
+    return Response(stream_broadcaster.stream(subscriber), mimetype="text/event-stream",
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def create_app(config=None):
+    """Build the app from DEFAULT_CONFIG, CROWD_* environment variables and `config`"""
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.from_prefixed_env('CROWD')
+    app.config.update(config or {})
+    if app.config['ROLE'] not in ROLES:
+        raise ValueError(f"ROLE must be one of {', '.join(ROLES)}")
     
-    return Response(event_stream(), mimetype="text/event-stream")
+    CORS(app)
+    app.config['JSON_ENCODER'] = serialization.install(app, app.config.get('JSON_ENCODER'))
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    app.after_request(compress_response)
+    app.teardown_request(record_failed_request)
+    app.register_blueprint(api)
+    
+    if app.config['WRITER_ADDRESS']:
+        import ingest_server
+        authkey = app.config['WRITER_AUTHKEY']
+        writer = ingest_server.IngestClient(app.config['WRITER_ADDRESS'],
+                                            authkey.encode() if isinstance(authkey, str) else authkey)
+        views['window'] = ingest_server.RemoteView(writer, 'window')
+        views['hot'] = ingest_server.RemoteView(writer, 'hot')
+        views['forecast'] = ingest_server.RemoteView(writer, 'forecast')
+    else:
+        writer = ingest_daemon
+    app.extensions['ingest_writer'] = writer
+    stream_broadcaster.interval = app.config['STREAM_INTERVAL']
+    
+    # Component stats exported on /metrics
+    ingest.subscribe(metrics.ingested)
+    metrics.watch('writer', writer.stats)
+    metrics.watch('db_pool', database.pool_stats)
+    metrics.watch('stream', stream_broadcaster.stats)
+    metrics.watch('cache', response_cache.response_cache.stats)
+    metrics.watch('alerts', alerts.stats)
+    metrics.watch('hot_store', views['hot'].stats)
+    metrics.watch('heatmap', heatmap.stats)
+    metrics.watch('forecast', views['forecast'].stats)
+    metrics.watch('scenarios', scenarios.stats)
+    return app
+
+app = create_app()
+json_encoder = app.config['JSON_ENCODER']
 
 if __name__ == '__main__':
     print("🚀 Starting Crowd Mobility Analyzer...")
-    init_database()
-    print("🌐 Server starting on http://127.0.0.1:5000")
+    init_database(app.config['ROLE'])
+    print(f"🌐 Server starting on http://127.0.0.1:{app.config['PORT']}")
     print("📡 Real-time dashboard available")
-    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
+    # python app.py keeps its debug default unless CROWD_DEBUG says otherwise
+    debug = app.config['DEBUG'] if 'CROWD_DEBUG' in os.environ else True
+    app.run(debug=debug, host=app.config['HOST'], port=app.config['PORT'], threaded=True)
\ No newline at end of file
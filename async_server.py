@@ -0,0 +1,323 @@
+"""asyncio serving mode for the streaming and read-only API routes.
+
+`app.run(threaded=True)` spends an OS thread per open /stream connection.
+Here /stream is served on the event loop: the shared broadcaster hands each
+frame to the loop once and every client coroutine just awaits its own small
+queue, so an idle SSE client costs a socket and a few KB. Other GET routes
+run the Flask app through WSGI on a bounded thread pool, which keeps DB reads
+off the loop. Streamed bodies such as /api/export go out chunked, pulled on
+a small pool of their own. Writes (POST etc.) stay on the threaded/WSGI server.
+
+    python async_server.py --port 5000 --workers 8
+"""
+
+import argparse
+import asyncio
+import io
+import resource
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import broadcaster
+
+MAX_HEADER_BYTES = 16 * 1024
+
+
+class StreamClient:
+    __slots__ = ('queue', 'dropped', 'writer')
+
+    def __init__(self, queue_size, writer):
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+        self.writer = writer
+
+
+class StreamHub:
+    """Per-loop fan-out of broadcaster frames to asyncio clients"""
+
+    def __init__(self, loop, source, queue_size=8, max_dropped=60, keepalive=15.0):
+        self.loop = loop
+        self.source = source
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self.keepalive = keepalive
+        self.clients = set()
+        self.stats = {'frames_sent': 0, 'frames_coalesced': 0, 'clients_dropped': 0, 'peak_clients': 0}
+        source.add_sink(self._on_frame)
+
+    def _on_frame(self, event_id, frame):
+        # Called on the producer thread; hop onto the loop once per frame
+        self.loop.call_soon_threadsafe(self._dispatch, frame)
+
+    def _dispatch(self, frame):
+        for client in list(self.clients):
+            queue = client.queue
+            if queue.full():
+                queue.get_nowait()
+                client.dropped += 1
+                self.stats['frames_coalesced'] += 1
+                if client.dropped > self.max_dropped:
+                    self.stats['clients_dropped'] += 1
+                    self.clients.discard(client)
+                    client.writer.close()
+                    continue
+            else:
+                # Only frames coalesced in a row count towards max_dropped
+                client.dropped = 0
+            queue.put_nowait(frame)
+            self.stats['frames_sent'] += 1
+
+    async def serve(self, writer, last_event_id):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"X-Accel-Buffering: no\r\n"
+            b"Connection: keep-alive\r\n"
+            b"Access-Control-Allow-Origin: *\r\n\r\n"
+        )
+        writer.write(f"retry: {int(self.source.interval * 1000)}\n\n".encode())
+        if last_event_id is not None:
+            for frame in self.source.replay_since(last_event_id):
+                writer.write(frame)
+
+        client = StreamClient(self.queue_size, writer)
+        self.clients.add(client)
+        self.stats['peak_clients'] = max(self.stats['peak_clients'], len(self.clients))
+        try:
+            await writer.drain()
+            while client in self.clients:
+                try:
+                    frame = await asyncio.wait_for(client.queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    frame = b": keepalive\n\n"
+                writer.write(frame)
+                await writer.drain()
+        finally:
+            self.clients.discard(client)
+
+
+class AsyncServer:
+    def __init__(self, flask_app, source, workers=8, queue_limit=None, stream_workers=2):
+        self.flask_app = flask_app
+        self.source = source
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+        # Streamed bodies (exports) are pulled on their own threads so a
+        # long download never holds an API worker
+        self.stream_executor = ThreadPoolExecutor(max_workers=stream_workers, thread_name_prefix='body')
+        # Bound how many requests may wait for a worker; the rest wait on the socket
+        self.slots = asyncio.Semaphore(queue_limit or workers * 4)
+        self.hub = None
+        self.host = None
+        self.port = None
+        self.connections = 0
+        self.requests = 0
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        if len(head) > MAX_HEADER_BYTES:
+            raise ValueError('request header too large')
+        lines = head.decode('latin-1').split("\r\n")
+        method, target, version = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        body = b''
+        length = int(headers.get('content-length') or 0)
+        if length:
+            body = await reader.readexactly(length)
+        return method, target, version, headers, body
+
+    def _environ(self, method, target, version, headers, body):
+        url = urlsplit(target)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': '',
+            'CONTENT_LENGTH': str(len(body)),
+            'CONTENT_TYPE': headers.get('content-type', ''),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            if name not in ('content-type', 'content-length'):
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    def _call_wsgi(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        result = self.flask_app(environ, start_response)
+        # A 200 without Content-Length is a streamed body: hand back the
+        # iterator and let _respond_streamed() pull it chunk by chunk
+        if response['status'].startswith('200') and not any(
+                name.lower() == 'content-length' for name, _ in response['headers']):
+            return response['status'], response['headers'], result
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], body
+
+    async def _respond(self, writer, status, headers, body, keep_alive):
+        lines = [f"HTTP/1.1 {status}"]
+        for name, value in headers:
+            if name.lower() not in ('content-length', 'connection'):
+                lines.append(f"{name}: {value}")
+        lines.append(f"Content-Length: {len(body)}")
+        lines.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    async def _respond_streamed(self, writer, status, headers, result, keep_alive):
+        """Chunked transfer of a WSGI body iterator, with socket backpressure"""
+        loop = asyncio.get_running_loop()
+        lines = [f"HTTP/1.1 {status}"]
+        for name, value in headers:
+            if name.lower() not in ('content-length', 'connection', 'transfer-encoding'):
+                lines.append(f"{name}: {value}")
+        lines.append("Transfer-Encoding: chunked")
+        lines.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        body = iter(result)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.stream_executor, next, body, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                    await writer.drain()
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.stream_executor, result.close)
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    method, target, version, headers, body = await self._read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except (ValueError, asyncio.LimitOverrunError):
+                    await self._respond(writer, '400 Bad Request', [], b'', False)
+                    return
+                self.requests += 1
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                path = urlsplit(target).path
+                if path == '/stream' and method == 'GET':
+                    last_event_id = broadcaster.parse_last_event_id(
+                        headers.get('last-event-id') or _query_arg(target, 'last_event_id'))
+                    await self.hub.serve(writer, last_event_id)
+                    return
+                if method not in ('GET', 'HEAD', 'OPTIONS'):
+                    await self._respond(writer, '405 Method Not Allowed', [('Allow', 'GET, HEAD, OPTIONS')],
+                                        b'writes are served by the threaded server\n', keep_alive)
+                    continue
+
+                environ = self._environ(method, target, version, headers, body)
+                async with self.slots:
+                    loop = asyncio.get_running_loop()
+                    status, response_headers, response_body = await loop.run_in_executor(
+                        self.executor, self._call_wsgi, environ)
+                if not isinstance(response_body, bytes):
+                    if method == 'HEAD':
+                        if hasattr(response_body, 'close'):
+                            response_body.close()
+                        response_body = b''
+                    else:
+                        await self._respond_streamed(writer, status, response_headers, response_body, keep_alive)
+                        if not keep_alive:
+                            return
+                        continue
+                await self._respond(writer, status, response_headers,
+                                    b'' if method == 'HEAD' else response_body, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, host, port, backlog=4096):
+        self.host, self.port = host, port
+        self.hub = StreamHub(asyncio.get_running_loop(), self.source)
+        server = await asyncio.start_server(self.handle, host, port, backlog=backlog, limit=MAX_HEADER_BYTES)
+        print(f"🌐 Async server on http://{host}:{port} (stream interval {self.source.interval}s)")
+        async with server:
+            await server.serve_forever()
+
+    def stats(self):
+        hub = self.hub.stats if self.hub else {}
+        return dict(hub, connections=self.connections, requests=self.requests,
+                    stream_clients=len(self.hub.clients) if self.hub else 0)
+
+
+def _query_arg(target, name):
+    for part in urlsplit(target).query.split('&'):
+        key, _, value = part.partition('=')
+        if key == name:
+            return value
+    return None
+
+
+def raise_fd_limit():
+    """Each SSE client is a socket; lift the soft fd limit to the hard limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the dashboard API and /stream on asyncio')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=8, help='threads for DB-backed API routes')
+    parser.add_argument('--stream-interval', type=float, default=5.0, help='seconds between stream ticks')
+    args = parser.parse_args(argv)
+
+    import app
+
+    print(f"📂 File descriptor limit: {raise_fd_limit()}")
+    app.init_database()
+    app.stream_broadcaster.interval = args.stream_interval
+    server = AsyncServer(app.app, app.stream_broadcaster, workers=args.workers)
+
+    # Expose the async-side counters next to the broadcaster's own
+    app.app.add_url_rule('/api/async-stats', 'async_stats', lambda: server.stats())
+
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping async server...")
+    finally:
+        server.executor.shutdown(wait=False, cancel_futures=True)
+        server.stream_executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Measure how many readings per second the alert engine evaluates.
+
+Feeds synthetic crowd and CO2 readings for N locations through
+alerts.AlertEngine against an in-memory alerts table, in batches the size
+the ingestion daemon commits, and reports readings/s and alerts raised.
+
+    python benchmarks/alert_bench.py --readings 1000000 --locations 100
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import alerts  # noqa: E402
+
+
+def make_batches(readings, locations, batch_size, seed):
+    """Crowd and carbon row dicts, one reading per location per second"""
+    rng = np.random.default_rng(seed)
+    names = [f"Zone {i}" for i in range(locations)]
+    start = int(time.time() * 1000)
+    density = np.clip(rng.normal(0.45, 0.08, readings), 0, 1)
+    # Sprinkle in outliers so the anomaly path is exercised too
+    spikes = rng.random(readings) < 0.002
+    density[spikes] = np.clip(density[spikes] + 0.45, 0, 1)
+    co2 = rng.normal(430, 40, readings)
+    ts = start + (np.arange(readings) // locations) * 1000
+    crowd, carbon = [], []
+    for i in range(readings):
+        location = names[i % locations]
+        crowd.append({'location': location, 'density': float(density[i]), 'ts': int(ts[i]), 'anomaly': 0})
+        carbon.append({'location': location, 'co2_level': float(co2[i]), 'ts': int(ts[i])})
+    return ([crowd[i:i + batch_size] for i in range(0, readings, batch_size)],
+            [carbon[i:i + batch_size] for i in range(0, readings, batch_size)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readings', type=int, default=500000, help='readings per table')
+    parser.add_argument('--locations', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON here')
+    args = parser.parse_args()
+
+    crowd, carbon = make_batches(args.readings, args.locations, args.batch_size, args.seed)
+    conn = sqlite3.connect(':memory:')
+    alerts.create_tables(conn)
+    engine = alerts.AlertEngine()
+
+    results = {}
+    for table, batches in (('crowd_data', crowd), ('carbon_data', carbon)):
+        started = time.perf_counter()
+        for batch in batches:
+            engine.evaluate(conn, table, batch)
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        results[table] = {'readings': args.readings, 'seconds': round(elapsed, 3),
+                          'readings_per_second': round(args.readings / elapsed)}
+
+    results['series'] = len(engine.series)
+    results['alerts_raised'] = engine.stats['raised']
+    results['alerts_suppressed'] = engine.stats['suppressed']
+    results['alert_rows'] = conn.execute('SELECT COUNT(*) FROM alerts').fetchone()[0]
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
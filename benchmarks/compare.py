@@ -0,0 +1,83 @@
+"""Compare two endpoint_bench.py (or serve_bench.py) result files and flag regressions.
+
+Rows are matched on (size, kind, route, mode, concurrency). Latency
+percentiles regress when they grow, throughput figures when they shrink,
+by more than --threshold (relative) and --min-ms (absolute, for latency).
+
+    python benchmarks/compare.py before.json after.json --threshold 0.15
+"""
+
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'startup_ms', 'import_ms')
+HIGHER_IS_BETTER = ('rps', 'rows_per_second', 'clients_with_event')
+
+
+def key(result):
+    return (result['size'], result['kind'], result['route'], result.get('mode', ''),
+            result.get('concurrency', ''))
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report, {key(result): result for result in report['results']}
+
+
+def compare(before, after, threshold, min_ms):
+    """[(key, metric, old, new, change, regressed)] for every metric both runs have"""
+    rows = []
+    for k in sorted(set(before) & set(after), key=lambda k: tuple(map(str, k))):
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = before[k].get(metric), after[k].get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            if metric in LOWER_IS_BETTER:
+                regressed = change > threshold and new - old > min_ms
+            else:
+                regressed = change < -threshold
+            rows.append((k, metric, old, new, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative change that counts')
+    parser.add_argument('--min-ms', type=float, default=0.5, help='ignore latency changes smaller than this')
+    parser.add_argument('--all', action='store_true', help='print every row, not just changes')
+    args = parser.parse_args()
+
+    before_report, before = load(args.before)
+    after_report, after = load(args.after)
+    print(f"before: {before_report['meta'].get('commit')} ({before_report['meta']['created']})")
+    print(f"after:  {after_report['meta'].get('commit')} ({after_report['meta']['created']})")
+    for size in sorted(set(before_report['fixtures']) & set(after_report['fixtures'])):
+        if before_report['fixtures'][size]['rows'] != after_report['fixtures'][size]['rows']:
+            print(f"⚠️ {size} fixtures differ: {before_report['fixtures'][size]['rows']:,} vs "
+                  f"{after_report['fixtures'][size]['rows']:,} rows")
+
+    rows = compare(before, after, args.threshold, args.min_ms)
+    regressions = 0
+    for (size, kind, route, mode, concurrency), metric, old, new, change, regressed in rows:
+        regressions += regressed
+        if not (args.all or regressed or abs(change) > args.threshold):
+            continue
+        improved = (-change if metric in LOWER_IS_BETTER else change) > args.threshold
+        marker = '❌' if regressed else ('✅' if improved else '  ')
+        label = f"{size} {kind} {route} {mode} {concurrency}".strip()
+        print(f"{marker} {label:<78} {metric:>17} {old:>10} -> {new:>10} ({change:+.1%})")
+
+    missing = sorted(set(before) - set(after), key=str)
+    for k in missing:
+        print(f"⚠️ missing from after: {' '.join(map(str, k))}")
+    print(f"\n{regressions} regression(s) over {len(rows)} compared figures")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""Latency and throughput of every API route on fixture databases.
+
+For each fixture size (see fixtures.py) this measures, on a fresh copy:
+
+    client   every GET /api/* route (plus /metrics) through the Flask test
+             client, with the response cache cleared before each request
+             (miss) and warm (hit)
+    export   rows/s streaming the crowd table out of /api/export
+    ingest   rows/s through the group-commit daemon and POST /api/ingest
+    http     the same routes over keep-alive HTTP against async_server.py
+             at each --concurrency level
+    sse      /stream fan-out: clients that got an event and server RSS per
+             connection (see sse_loadtest.py)
+
+Results go to --output as JSON; compare two runs with compare.py.
+
+    python benchmarks/endpoint_bench.py --sizes 100k,1m --output before.json
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures  # noqa: E402
+import sse_loadtest  # noqa: E402
+
+# Extra query strings for routes whose defaults don't exercise the heavy path
+VARIANTS = {
+    '/api/live-graph': ['', '?minutes=1440&step=60', '?minutes=1440&step=60&format=columnar'],
+    '/api/historical-analysis': ['', '?days=30&format=columnar'],
+    '/api/dashboard': ['', '?format=columnar'],
+    # The fixture venue, at street and district zoom
+    '/api/heatmap': ['?bbox=77.598,12.976,77.602,12.980&zoom=18', '?bbox=77.5,12.9,77.7,13.0&zoom=12&minutes=60'],
+}
+SKIP = {'/api/ingest', '/stream'}
+
+
+def summarize(latencies, seconds=None, errors=0):
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (None, None, None)
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(float(p50), 3) if p50 is not None else None,
+        'p95_ms': round(float(p95), 3) if p95 is not None else None,
+        'p99_ms': round(float(p99), 3) if p99 is not None else None,
+        'mean_ms': round(float(ms.mean()), 3) if len(ms) else None,
+        'max_ms': round(float(ms.max()), 3) if len(ms) else None,
+    }
+    if seconds:
+        summary['rps'] = round(len(latencies) / seconds, 1)
+    return summary
+
+
+def routes(flask_app):
+    """Every parameterless GET route under /api plus /metrics, with VARIANTS"""
+    found = []
+    for rule in sorted(flask_app.url_map.iter_rules(), key=lambda r: r.rule):
+        if 'GET' not in rule.methods or rule.arguments or rule.rule in SKIP:
+            continue
+        if rule.rule.startswith('/api/') or rule.rule == '/metrics':
+            found.extend(rule.rule + query for query in VARIANTS.get(rule.rule, ['']))
+    return found
+
+
+# In-process measurements (run in a child with CROWD_DB_PATH set)
+def run_client(requests, ingest_seconds):
+    import app
+    import realtime_updater
+    import response_cache
+
+    app.init_database()
+    client = app.app.test_client()
+    headers = {'Accept-Encoding': 'gzip'}
+    results = []
+    for url in routes(app.app):
+        for mode in ('miss', 'hit'):
+            latencies, errors = [], 0
+            client.get(url, headers=headers)
+            for _ in range(requests):
+                if mode == 'miss':
+                    response_cache.response_cache.clear()
+                started = time.perf_counter()
+                response = client.get(url, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code >= 400
+            results.append(dict(kind='client', route=url, mode=mode, **summarize(latencies, errors=errors)))
+
+    # Streaming export of the whole crowd table, both formats when pyarrow is there
+    import export
+    for fmt in export.FORMATS:
+        if fmt == 'parquet' and not export.HAVE_PYARROW:
+            continue
+        started = time.perf_counter()
+        response = client.get(f'/api/export/crowd_data?format={fmt}')
+        size = sum(len(block) for block in response.response)
+        response.close()
+        elapsed = time.perf_counter() - started
+        rows = export.stats()['last']['rows']
+        results.append({'kind': 'export', 'route': f'/api/export/crowd_data?format={fmt}', 'rows': rows,
+                        'bytes': size, 'rows_per_second': round(rows / elapsed, 1)})
+
+    # Group-commit daemon: producers queue simulated rounds as fast as they can
+    daemon = app.ingest_daemon
+    before = daemon.stats()['committed']
+    started = time.perf_counter()
+    while time.perf_counter() - started < ingest_seconds:
+        daemon.submit(*realtime_updater.simulate_readings())
+    daemon.flush()
+    elapsed = time.perf_counter() - started
+    committed = daemon.stats()['committed'] - before
+    results.append({'kind': 'ingest', 'route': 'daemon', 'rows': committed,
+                    'rows_per_second': round(committed / elapsed, 1)})
+
+    # POST /api/ingest with 1000-record NDJSON bodies
+    now = time.time()
+    body = '\n'.join(json.dumps({'type': 'crowd', 'location': f'Zone {i % 50}', 'density': 0.5,
+                                 'timestamp': now}) for i in range(1000))
+    rows, latencies = 0, []
+    started = time.perf_counter()
+    while time.perf_counter() - started < ingest_seconds:
+        t = time.perf_counter()
+        response = client.post('/api/ingest', data=body, content_type='application/x-ndjson')
+        latencies.append(time.perf_counter() - t)
+        rows += response.json['accepted']
+    elapsed = time.perf_counter() - started
+    results.append(dict({'kind': 'ingest', 'route': 'POST /api/ingest', 'rows': rows,
+                         'rows_per_second': round(rows / elapsed, 1)}, **summarize(latencies)))
+    daemon.stop()
+    return {'routes': routes(app.app), 'results': results}
+
+
+# Over HTTP against async_server.py
+def http_load(host, port, url, concurrency, requests):
+    """Spread `requests` GETs over `concurrency` keep-alive connections"""
+    latencies, errors, seconds = http_latencies(host, port, url, concurrency, requests)
+    return summarize(latencies, seconds, errors)
+
+
+def http_latencies(host, port, url, concurrency, requests):
+    """(latencies, errors, seconds) of http_load(), unsummarized"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    per_client = max(1, requests // concurrency)
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        mine, failed = [], 0
+        for _ in range(per_client):
+            started = time.perf_counter()
+            try:
+                conn.request('GET', url, headers={'Accept-Encoding': 'gzip'})
+                response = conn.getresponse()
+                response.read()
+                failed += response.status >= 400
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=60)
+            mine.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def start_server(db_path, port, stream_interval=1.0):
+    env = dict(os.environ, CROWD_DB_PATH=db_path)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'async_server.py'), '--host', '127.0.0.1', '--port', str(port),
+         '--stream-interval', str(stream_interval)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1)
+            return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('async_server.py did not come up')
+
+
+def run_http(db_path, urls, args):
+    server = start_server(db_path, args.port)
+    results = []
+    try:
+        for url in urls:
+            for concurrency in args.concurrency:
+                http_load('127.0.0.1', args.port, url, concurrency, concurrency)   # warm up
+                summary = http_load('127.0.0.1', args.port, url, concurrency, args.requests)
+                results.append(dict(kind='http', route=url, mode='hit', concurrency=concurrency, **summary))
+        if args.sse_clients:
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            baseline = sse_loadtest.rss_kb(server.pid)
+            fanout = asyncio.run(sse_loadtest.run('127.0.0.1', args.port, args.sse_clients, 500, args.sse_hold))
+            peak = sse_loadtest.rss_kb(server.pid)
+            results.append(dict(fanout, kind='sse', route='/stream', clients=args.sse_clients,
+                                server_rss_mb=round(peak / 1024, 1),
+                                rss_per_connection_kb=round((peak - baseline) / max(1, fanout['clients_with_event']), 2)))
+    finally:
+        server.terminate()
+        server.wait(10)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_levels(value):
+    return [int(level) for level in value.split(',') if level.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=fixtures.parse_sizes, default=['100k', '1m'],
+                        help=f"comma-separated, from {', '.join(fixtures.SIZES)}")
+    parser.add_argument('--fixtures', default=fixtures.DEFAULT_DIR, help='fixture directory')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route and mode')
+    parser.add_argument('--concurrency', type=parse_levels, default=[1, 8, 32])
+    parser.add_argument('--ingest-seconds', type=float, default=5.0)
+    parser.add_argument('--sse-clients', type=int, default=1000, help='0 skips the fan-out test')
+    parser.add_argument('--sse-hold', type=float, default=30.0)
+    parser.add_argument('--port', type=int, default=5078)
+    parser.add_argument('--skip-http', action='store_true')
+    parser.add_argument('--output', help='write results as JSON here')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # Child: the app reads CROWD_DB_PATH at import, so each fixture runs in its own process
+        sys.path.insert(0, ROOT)
+        with open(args.worker, 'w') as f:
+            json.dump(run_client(args.requests, args.ingest_seconds), f)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='endpoint_bench_')
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'requests': args.requests,
+        },
+        'fixtures': {},
+        'results': [],
+    }
+    try:
+        for size in args.sizes:
+            fixture, meta = fixtures.build(size, args.fixtures)
+            report['fixtures'][size] = {key: meta[key] for key in ('rows', 'tables', 'history', 'bytes')}
+
+            copy = os.path.join(workdir, f'{size}.db')
+            shutil.copy(fixture, copy)
+            part = os.path.join(workdir, f'{size}.json')
+            print(f"⏱️  {size}: test client and ingest...")
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', part,
+                            '--requests', str(args.requests), '--ingest-seconds', str(args.ingest_seconds)],
+                           cwd=ROOT, env=dict(os.environ, CROWD_DB_PATH=copy), check=True,
+                           stdout=subprocess.DEVNULL)
+            with open(part) as f:
+                measured = json.load(f)
+            results = measured['results']
+
+            if not args.skip_http:
+                print(f"⏱️  {size}: HTTP at concurrency {args.concurrency}...")
+                shutil.copy(fixture, copy)
+                for suffix in ('-wal', '-shm'):
+                    if os.path.exists(copy + suffix):
+                        os.remove(copy + suffix)
+                results += run_http(copy, measured['routes'], args)
+
+            for result in results:
+                result['size'] = size
+            report['results'] += results
+            print_results(size, results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+
+def print_results(size, results):
+    print(f"\n{size}: {'route':<58} {'mode':>5} {'conc':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}")
+    for r in results:
+        if r['kind'] in ('client', 'http'):
+            print(f"{r['kind']:>6} {r['route']:<58} {r['mode']:>5} {r.get('concurrency', ''):>5} "
+                  f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r.get('rps', ''):>9}"
+                  + (f"  ({r['errors']} errors)" if r['errors'] else ''))
+        elif r['kind'] in ('ingest', 'export'):
+            print(f"{r['kind']:>6} {r['route']:<58} {r['rows_per_second']:>12,.0f} rows/s")
+        else:
+            print(f"   sse {r['clients_with_event']}/{r['clients']} clients, "
+                  f"{r['rss_per_connection_kb']} KB/connection, {r['server_rss_mb']} MB RSS")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Build and cache fixture databases of a given size for the benchmarks.
+
+Fixtures are made by create_database.py with the history scaled so the
+three reading tables hold roughly the requested number of rows over
+FIXTURE_DAYS days (inside the retention window, so nothing is archived
+while a benchmark runs). Recent-window routes need readings up to the
+present, so a fixture older than --max-age hours is rebuilt.
+
+    python benchmarks/fixtures.py --sizes 100k,1m,10m
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZES = {'100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+FIXTURE_DAYS = 29
+LOCATIONS = 10
+SEED = 42
+DEFAULT_DIR = os.path.join(tempfile.gettempdir(), 'crowd_bench_fixtures')
+
+
+def parse_sizes(value):
+    sizes = [size.strip().lower() for size in value.split(',') if size.strip()]
+    for size in sizes:
+        if size not in SIZES:
+            raise ValueError(f"size must be one of {', '.join(SIZES)}")
+    return sizes
+
+
+def history_for(rows):
+    """create_crowd_mobility_db() arguments giving about `rows` readings"""
+    # Per hour: LOCATIONS*r crowd rows, 2r trips and r carbon readings
+    hours = (FIXTURE_DAYS + 0.5) * 24
+    r = max(1, math.ceil(rows / (hours * (LOCATIONS + 3))))
+    return {'days': FIXTURE_DAYS, 'locations': LOCATIONS, 'rows_per_hour': r,
+            'trips_per_hour': 2 * r, 'carbon_per_hour': r, 'seed': SEED}
+
+
+def paths(size, directory):
+    return os.path.join(directory, f'fixture_{size}.db'), os.path.join(directory, f'fixture_{size}.json')
+
+
+def load_meta(size, directory=DEFAULT_DIR):
+    db_path, meta_path = paths(size, directory)
+    if not (os.path.exists(db_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def build(size, directory=DEFAULT_DIR, rebuild=False, max_age_hours=24):
+    """Path of an up-to-date fixture, creating it if needed; returns (path, meta)"""
+    db_path, meta_path = paths(size, directory)
+    meta = load_meta(size, directory)
+    if meta and not rebuild and time.time() - meta['created'] < max_age_hours * 3600:
+        return db_path, meta
+
+    os.makedirs(directory, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import create_database
+
+    history = history_for(SIZES[size])
+    print(f"🧪 Building {size} fixture ({history})...")
+    started = time.perf_counter()
+    create_database.create_crowd_mobility_db(path=db_path, **history)
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    rows = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('crowd_data', 'mobility_data', 'carbon_data')}
+    conn.close()
+
+    meta = {
+        'size': size,
+        'rows': sum(rows.values()),
+        'tables': rows,
+        'history': history,
+        'created': time.time(),
+        'build_seconds': round(time.perf_counter() - started, 1),
+        'bytes': os.path.getsize(db_path),
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"✅ {size} fixture: {meta['rows']:,} rows, {meta['bytes'] / 1e6:.0f} MB in {meta['build_seconds']}s")
+    return db_path, meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=list(SIZES))
+    parser.add_argument('--dir', default=DEFAULT_DIR, help='where fixtures are kept')
+    parser.add_argument('--rebuild', action='store_true')
+    parser.add_argument('--max-age', type=float, default=24, help='hours before a fixture is rebuilt')
+    args = parser.parse_args()
+    for size in args.sizes:
+        path, meta = build(size, args.dir, args.rebuild, args.max_age)
+        print(f"{size:>5}  {meta['rows']:>11,} rows  {path}")
+
+
+if __name__ == '__main__':
+    main()
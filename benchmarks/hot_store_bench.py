@@ -0,0 +1,162 @@
+"""Hot tier (hot_store.py) vs SQLite for recent-window queries.
+
+On a fresh copy of each fixture database this measures:
+
+    load     seconds to load the last --hours of readings into memory
+    memory   bytes held, per table and per million readings
+    query    median latency of timeseries.bucketed() over SQLite and from
+             the hot store, for the live-graph series at several windows
+             (the results are checked to match)
+
+Results use endpoint_bench.py's JSON layout, so compare.py diffs two runs.
+
+    python benchmarks/hot_store_bench.py --sizes 100k,1m --output hot.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import endpoint_bench  # noqa: E402
+import fixtures  # noqa: E402
+
+# (series, minutes, step, filters)
+QUERIES = [
+    ('density', 60, 60, None),
+    ('density', 1440, 60, None),
+    ('density', 600, 60, {'location': 'Metro Station'}),
+    ('co2', 1440, 300, None),
+    ('co2', 1440, 60, {'vehicle_type': 'Bus'}),
+    ('co2_level', 1440, 300, None),
+]
+
+
+def timed(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return result, round(statistics.median(times) * 1000, 3)
+
+
+def measure(args):
+    """Worker process (CROWD_DB_PATH set to a fixture copy): the results for one database"""
+    import database
+    import hot_store
+    import timeseries
+
+    results = []
+    store = hot_store.HotStore(args.hours)
+    store.rebuild()
+    stats = store.stats()
+    results.append({'kind': 'load', 'route': 'hot_store', 'rows': stats['rows'],
+                    'load_seconds': stats['load_seconds'], 'bytes': stats['bytes'],
+                    'bytes_per_million_rows': stats['bytes_per_million_rows']})
+    for table, figures in stats['tables'].items():
+        results.append({'kind': 'memory', 'route': table, 'rows': figures['rows'], 'bytes': figures['bytes'],
+                        'bytes_per_million_rows': figures['bytes_per_million_rows']})
+
+    now = time.time()
+    with database.read_connection() as conn:
+        for series, minutes, step, filters in QUERIES:
+            grid = timeseries.Grid(now - 60, minutes, step)
+            query = f"{series} {minutes}m/{step}s" + ''.join(f' {k}={v}' for k, v in (filters or {}).items())
+            cold, sql_ms = timed(lambda: timeseries.bucketed(conn, grid, series, filters), args.repeats)
+            hot, hot_ms = timed(lambda: timeseries.bucketed(conn, grid, series, filters, store), args.repeats)
+            match = bool(np.allclose(cold, hot, rtol=1e-5, atol=1e-3, equal_nan=True))
+            for mode, ms in (('sqlite', sql_ms), ('hot', hot_ms)):
+                results.append({'kind': 'query', 'route': query, 'mode': mode, 'p50_ms': ms, 'match': match})
+    stats = store.stats()
+    results.append({'kind': 'fallthrough', 'route': 'hot_store', 'hot_queries': stats['hot_queries'],
+                    'fallthroughs': stats['fallthroughs']})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=fixtures.parse_sizes, default=['100k', '1m'],
+                        help=f"comma-separated, from {', '.join(fixtures.SIZES)}")
+    parser.add_argument('--fixtures', default=fixtures.DEFAULT_DIR, help='fixture directory')
+    parser.add_argument('--hours', type=float, default=25, help='window held in memory')
+    parser.add_argument('--repeats', type=int, default=50, help='runs per query and path')
+    parser.add_argument('--output', help='write results as JSON here')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker, 'w') as f:
+            json.dump(measure(args), f)
+        return
+
+    report = {
+        'meta': {
+            'commit': endpoint_bench.git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+        },
+        'fixtures': {},
+        'results': [],
+    }
+    workdir = tempfile.mkdtemp(prefix='hot_store_bench_')
+    try:
+        for size in args.sizes:
+            fixture, meta = fixtures.build(size, args.fixtures)
+            report['fixtures'][size] = {key: meta[key] for key in ('rows', 'tables', 'history', 'bytes')}
+            copy = os.path.join(workdir, f'{size}.db')
+            shutil.copy(fixture, copy)
+            part = os.path.join(workdir, f'{size}.json')
+            print(f"⏱️  {size}...")
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', part, '--hours', str(args.hours),
+                            '--repeats', str(args.repeats)],
+                           cwd=ROOT, env=dict(os.environ, CROWD_DB_PATH=copy), check=True)
+            with open(part) as f:
+                results = json.load(f)
+            for result in results:
+                result['size'] = size
+            report['results'] += results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(report['results'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+
+def print_results(results):
+    for r in results:
+        if r['kind'] == 'load':
+            print(f"\n{r['size']}: {r['rows']:,} readings loaded in {r['load_seconds']} s, "
+                  f"{r['bytes']:,} bytes ({r['bytes_per_million_rows'] or 0:,} per million readings)")
+        elif r['kind'] == 'memory':
+            print(f"  {r['route']:<16} {r['rows']:>10,} rows {r['bytes_per_million_rows'] or 0:>12,} B/1M")
+        elif r['kind'] == 'query' and r['mode'] == 'hot':
+            sql = next(s for s in results if s['kind'] == 'query' and s['mode'] == 'sqlite'
+                       and s['route'] == r['route'] and s['size'] == r['size'])
+            print(f"  {r['route']:<44} sqlite {sql['p50_ms']:>9} ms  hot {r['p50_ms']:>9} ms"
+                  + ('' if r['match'] else '  (MISMATCH)'))
+        elif r['kind'] == 'fallthrough' and r['fallthroughs']:
+            print(f"  ⚠️ {r['fallthroughs']} queries fell through to SQLite")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Compare payload size and encode time for the large GET responses.
+
+Builds the live-graph and historical-analysis payloads from a copy of the
+database in both row and columnar form, then times each JSON encoder on
+them and reports raw, gzip and (if installed) brotli sizes.
+
+    python benchmarks/serialization_bench.py --minutes 10080 --step 60
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=os.path.join(ROOT, 'crowd_mobility.db'))
+    parser.add_argument('--minutes', type=int, default=7 * 24 * 60, help='live-graph window')
+    parser.add_argument('--step', type=int, default=61, help='live-graph step in seconds')
+    parser.add_argument('--days', type=int, default=365, help='historical-analysis days')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='write results as JSON here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='serialization_bench_')
+    db_path = os.path.join(workdir, 'crowd_mobility.db')
+    shutil.copy(args.db, db_path)
+    os.environ['CROWD_DB_PATH'] = db_path
+    sys.path.insert(0, ROOT)
+
+    import app
+    import dashboard
+    import database
+    import migrate
+    import serialization
+
+    with database.write_connection() as conn:
+        migrate.migrate(conn)
+
+    payloads = {}
+    with database.read_connection() as conn:
+        for fmt in serialization.FORMATS:
+            columnar = fmt == 'columnar'
+            snapshot = dashboard.Snapshot(conn, minutes=args.minutes, step=args.step, columnar=columnar,
+                                          history_days=args.days)
+            payloads[f'live-graph {fmt}'] = snapshot.graph()
+            payloads[f'historical-analysis {fmt}'] = snapshot.history()
+
+    results = []
+    for name, payload in payloads.items():
+        row = {'payload': name}
+        for encoder, provider in serialization.ENCODERS.items():
+            provider = provider(app.app)
+            with app.app.app_context():
+                row[f'{encoder}_ms'] = round(best_of(lambda: provider.response(payload).get_data(),
+                                                     args.repeat), 3)
+        with app.app.app_context():
+            body = app.app.json.response(payload).get_data()
+        row['bytes'] = len(body)
+        row['gzip_bytes'] = len(serialization.compress(body, 'gzip'))
+        row['gzip_ms'] = round(best_of(lambda: serialization.compress(body, 'gzip'), args.repeat), 3)
+        if serialization.brotli is not None:
+            row['br_bytes'] = len(serialization.compress(body, 'br'))
+            row['br_ms'] = round(best_of(lambda: serialization.compress(body, 'br'), args.repeat), 3)
+        results.append(row)
+
+    columns = list(dict.fromkeys(key for row in results for key in row))
+    print('  '.join(f'{c:>28}' if c == 'payload' else f'{c:>11}' for c in columns))
+    for row in results:
+        print('  '.join(f'{str(row.get(c, "")):>28}' if c == 'payload' else f'{str(row.get(c, "")):>11}'
+                        for c in columns))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'encoder_in_use': app.json_encoder, 'results': results}, f, indent=2)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
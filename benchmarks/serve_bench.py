@@ -0,0 +1,197 @@
+"""Startup time and multi-core throughput: `python app.py` vs serve.py workers.
+
+On a fresh copy of a fixture database this measures, for the single
+process (`python app.py`, debug off) and for serve.py at each --workers
+count:
+
+    import     time to import the app module in a fresh interpreter
+    startup    process launch until /api/health answers
+    http       GET throughput and latency per route at each --concurrency
+               level, with the load spread over --client-processes so the
+               client is not the bottleneck
+
+The routes include uncached ones (/api/system-status, /metrics), which do
+real work on every request and show how far reads scale across cores.
+Results use endpoint_bench.py's JSON layout, so compare.py diffs two runs.
+
+    python benchmarks/serve_bench.py --workers 2,4 --concurrency 8,32 --output serve.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import endpoint_bench  # noqa: E402
+import fixtures  # noqa: E402
+
+ROUTES = [
+    '/api/health',
+    '/api/system-status',
+    '/metrics',
+    '/api/dashboard',
+    '/api/live-graph?minutes=1440&step=60',
+]
+IMPORT_SNIPPET = 'import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)'
+
+
+def import_ms(db_path, repeats):
+    """Median wall time of `import app` in a fresh interpreter"""
+    env = dict(os.environ, CROWD_DB_PATH=db_path)
+    times = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, env=env, check=True,
+                             capture_output=True, text=True).stdout
+        times.append(float(out.strip().splitlines()[-1]) * 1000)
+    return round(statistics.median(times), 1)
+
+
+def launch(workers, db_path, port):
+    """Start the server (workers=0 is `python app.py`); returns (process, startup seconds)"""
+    env = dict(os.environ, CROWD_DB_PATH=db_path, CROWD_PORT=str(port), CROWD_HOST='127.0.0.1',
+               CROWD_DEBUG='false')
+    if workers:
+        command = [sys.executable, os.path.join(ROOT, 'serve.py'), '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(workers)]
+    else:
+        command = [sys.executable, os.path.join(ROOT, 'app.py')]
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    while time.perf_counter() - started < 60:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1)
+            return server, time.perf_counter() - started
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.01)
+    server.kill()
+    raise RuntimeError(f"{' '.join(command[1:])} did not come up")
+
+
+def stop(server):
+    server.terminate()
+    try:
+        server.wait(30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def _client(job):
+    return endpoint_bench.http_latencies(*job)
+
+
+def load(pool, port, url, concurrency, requests, processes):
+    """Run http_load's client across `processes` processes; one summary for all of them"""
+    processes = min(processes, concurrency)
+    jobs = [('127.0.0.1', port, url, concurrency // processes + (i < concurrency % processes),
+             requests // processes) for i in range(processes)]
+    started = time.perf_counter()
+    parts = pool.map(_client, jobs)
+    seconds = time.perf_counter() - started
+    latencies = [latency for part in parts for latency in part[0]]
+    return endpoint_bench.summarize(latencies, seconds, sum(part[1] for part in parts))
+
+
+def run_mode(workers, db_path, args, pool):
+    mode = f'prefork-{workers}' if workers else 'single'
+    print(f"⏱️  {mode}...")
+    results = []
+    startups = []
+    for _ in range(args.repeats):
+        server, seconds = launch(workers, db_path, args.port)
+        startups.append(seconds * 1000)
+        stop(server)
+    results.append({'kind': 'startup', 'route': '/api/health', 'mode': mode, 'concurrency': '',
+                    'startup_ms': round(statistics.median(startups), 1)})
+
+    server, _ = launch(workers, db_path, args.port)
+    try:
+        for url in ROUTES:
+            for concurrency in args.concurrency:
+                load(pool, args.port, url, concurrency, concurrency, args.client_processes)   # warm up
+                summary = load(pool, args.port, url, concurrency, args.requests, args.client_processes)
+                results.append(dict(kind='http', route=url, mode=mode, concurrency=concurrency, **summary))
+    finally:
+        stop(server)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=fixtures.parse_sizes, default=['100k'], help='fixture size')
+    parser.add_argument('--fixtures', default=fixtures.DEFAULT_DIR, help='fixture directory')
+    parser.add_argument('--workers', type=endpoint_bench.parse_levels, default=[2, os.cpu_count() or 1],
+                        help='serve.py worker counts to compare with the single process')
+    parser.add_argument('--concurrency', type=endpoint_bench.parse_levels, default=[8, 32])
+    parser.add_argument('--requests', type=int, default=1000, help='requests per route and level')
+    parser.add_argument('--client-processes', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=3, help='launches averaged for startup and import time')
+    parser.add_argument('--port', type=int, default=5079)
+    parser.add_argument('--output', help='write results as JSON here')
+    args = parser.parse_args()
+
+    size = args.size[0]
+    fixture, meta = fixtures.build(size, args.fixtures)
+    workdir = tempfile.mkdtemp(prefix='serve_bench_')
+    db_path = os.path.join(workdir, f'{size}.db')
+    shutil.copy(fixture, db_path)
+    report = {
+        'meta': {
+            'commit': endpoint_bench.git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'requests': args.requests,
+        },
+        'fixtures': {size: {key: meta[key] for key in ('rows', 'tables', 'history', 'bytes')}},
+        'results': [],
+    }
+    try:
+        report['results'].append({'kind': 'import', 'route': 'app', 'mode': '', 'concurrency': '',
+                                  'import_ms': import_ms(db_path, args.repeats)})
+        with multiprocessing.Pool(args.client_processes) as pool:
+            for workers in [0] + sorted(set(args.workers)):
+                report['results'] += run_mode(workers, db_path, args, pool)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for result in report['results']:
+        result['size'] = size
+    print_results(report['results'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+
+def print_results(results):
+    for r in results:
+        if r['kind'] == 'import':
+            print(f"import app: {r['import_ms']} ms")
+        elif r['kind'] == 'startup':
+            print(f"{r['mode']:>12} startup: {r['startup_ms']} ms")
+    print(f"\n{'mode':>12} {'route':<40} {'conc':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}")
+    for r in results:
+        if r['kind'] == 'http':
+            print(f"{r['mode']:>12} {r['route']:<40} {r['concurrency']:>5} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+                  f"{r['p99_ms']:>9} {r['rps']:>9}" + (f"  ({r['errors']} errors)" if r['errors'] else ''))
+
+
+if __name__ == '__main__':
+    main()
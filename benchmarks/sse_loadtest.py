@@ -0,0 +1,149 @@
+"""Open thousands of idle /stream connections and report what the server holds.
+
+Starts async_server.py on a copy of the database (or targets a running
+server with --url and --pid), ramps up N EventSource-style clients, waits
+until each has received at least one event, then prints the connection
+count reached and the server's RSS.
+
+    python benchmarks/sse_loadtest.py --clients 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+async def sse_client(host, port, state, ready):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        state['failed'] += 1
+        return
+    writer.write(f"GET /stream HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    state['connected'] += 1
+    got_event = False
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'data:'):
+                state['events'] += 1
+                if not got_event:
+                    got_event = True
+                    ready.release()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        state['connected'] -= 1
+        if not got_event:
+            state['failed'] += 1
+        writer.close()
+
+
+async def run(host, port, clients, ramp, hold):
+    state = {'connected': 0, 'events': 0, 'failed': 0}
+    ready = asyncio.Semaphore(0)
+    tasks = []
+    started = time.perf_counter()
+    for i in range(clients):
+        tasks.append(asyncio.create_task(sse_client(host, port, state, ready)))
+        if ramp and i % ramp == ramp - 1:
+            await asyncio.sleep(0.05)
+
+    # Wait until every client has seen at least one event (or give up)
+    deadline = time.perf_counter() + hold
+    received = 0
+    while received < clients and time.perf_counter() < deadline:
+        try:
+            await asyncio.wait_for(ready.acquire(), max(0.01, deadline - time.perf_counter()))
+            received += 1
+        except asyncio.TimeoutError:
+            break
+    elapsed = time.perf_counter() - started
+    snapshot = dict(state, clients_with_event=received, seconds=round(elapsed, 2))
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--ramp', type=int, default=500, help='clients opened per 50 ms step')
+    parser.add_argument('--hold', type=float, default=60.0, help='seconds to wait for first events')
+    parser.add_argument('--interval', type=float, default=2.0, help='stream tick for a spawned server')
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--pid', type=int, help='pid of an already running server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--output', help='write results as JSON here')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    server = None
+    workdir = None
+    pid = args.pid
+    if pid is None:
+        workdir = tempfile.mkdtemp(prefix='sse_loadtest_')
+        db_path = os.path.join(workdir, 'crowd_mobility.db')
+        shutil.copy(os.path.join(ROOT, 'crowd_mobility.db'), db_path)
+        env = dict(os.environ, CROWD_DB_PATH=db_path)
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'async_server.py'), '--host', args.host,
+             '--port', str(args.port), '--stream-interval', str(args.interval)],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+        pid = server.pid
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(f'http://{args.host}:{args.port}/api/health', timeout=1)
+                break
+            except OSError:
+                time.sleep(0.1)
+
+    try:
+        baseline = rss_kb(pid)
+        result = asyncio.run(run(args.host, args.port, args.clients, args.ramp, args.hold))
+        # run() measured while all clients were still connected
+        peak = rss_kb(pid)
+        result.update({
+            'clients_requested': args.clients,
+            'server_rss_baseline_mb': round(baseline / 1024, 1),
+            'server_rss_mb': round(peak / 1024, 1),
+            'rss_per_connection_kb': round((peak - baseline) / max(1, result['clients_with_event']), 2),
+        })
+        print(json.dumps(result, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, indent=2)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Single-producer fan-out for the /stream SSE endpoint.
+
+One thread builds each tick, serializes it once and hands the same bytes to
+every subscriber through a small bounded queue. A subscriber that falls
+behind has its oldest frames coalesced away (it only ever needs the latest
+metrics), and one that stays behind for max_dropped frames in a row is
+disconnected so it cannot hold memory or stall anyone else. Recent frames
+are kept in a replay buffer so reconnecting EventSource clients resume from
+Last-Event-ID (with at most a queue's worth of the frames they missed).
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+
+class Subscriber:
+    def __init__(self, queue_size, max_dropped):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.max_dropped = max_dropped
+        # Frames coalesced in a row; back to 0 whenever a frame fits
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+
+    def offer(self, frame):
+        """Queue a frame without ever blocking the producer"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            self.dropped = 0
+            return True
+        except queue.Full:
+            pass
+        # Coalesce: the newest frame supersedes the oldest queued one
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.dropped += 1
+        self.coalesced += 1
+        if self.dropped > self.max_dropped:
+            self.closed = True
+            return False
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            pass
+        return True
+
+
+class Broadcaster:
+    def __init__(self, build_payload, interval=5.0, replay_size=120,
+                 queue_size=8, max_dropped=60, keepalive=15.0):
+        self.build_payload = build_payload
+        self.interval = interval
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self.keepalive = keepalive
+
+        self._replay = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._sinks = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_id = 0
+
+        self._stats = {
+            'events': 0,
+            'frames_sent': 0,
+            'frames_coalesced': 0,
+            'clients_dropped': 0,
+            'build_ms_last': 0.0,
+        }
+
+    # Producer
+    def _next_id(self):
+        # Millisecond ids keep increasing across restarts, so a stale
+        # Last-Event-ID from a previous process never replays garbage
+        self._last_id = max(self._last_id + 1, int(time.time() * 1000))
+        return self._last_id
+
+    def publish(self, payload):
+        """Serialize a payload once and fan it out to every subscriber"""
+        event_id = self._next_id()
+        frame = f"id: {event_id}\ndata: {json.dumps(payload)}\n\n".encode()
+        with self._lock:
+            self._replay.append((event_id, frame))
+            subscribers = list(self._subscribers)
+            sinks = list(self._sinks)
+        for sink in sinks:
+            sink(event_id, frame)
+        dropped = 0
+        for sub in subscribers:
+            before = sub.coalesced
+            if not sub.offer(frame):
+                dropped += 1
+                self._remove(sub)
+            self._stats['frames_coalesced'] += sub.coalesced - before
+        self._stats['events'] += 1
+        self._stats['frames_sent'] += len(subscribers) - dropped
+        self._stats['clients_dropped'] += dropped
+        return event_id
+
+    def _run(self):
+        while True:
+            started = time.perf_counter()
+            try:
+                self.publish(self.build_payload())
+            except Exception as e:
+                print(f"❌ Stream tick failed: {e}")
+            self._stats['build_ms_last'] = round((time.perf_counter() - started) * 1000, 3)
+            time.sleep(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    # Subscribers
+    def add_sink(self, sink):
+        """Register sink(event_id, frame), called from the producer for every frame.
+
+        Used by the asyncio server, which does its own per-client fan-out.
+        """
+        with self._lock:
+            self._sinks.append(sink)
+        self.start()
+
+    def replay_since(self, last_event_id):
+        with self._lock:
+            return [frame for event_id, frame in self._replay if event_id > last_event_id]
+
+    def subscribe(self, last_event_id=None):
+        self.start()
+        sub = Subscriber(self.queue_size, self.max_dropped)
+        with self._lock:
+            if last_event_id is not None:
+                # Only the newest missed frames fit the queue; older ones would just be coalesced
+                missed = [frame for event_id, frame in self._replay if event_id > last_event_id]
+                for frame in missed[-self.queue_size:]:
+                    sub.queue.put_nowait(frame)
+            self._subscribers.add(sub)
+        return sub
+
+    def _remove(self, sub):
+        sub.closed = True
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def stream(self, sub):
+        """Generator of SSE bytes for one client"""
+        try:
+            yield f"retry: {int(self.interval * 1000)}\n\n".encode()
+            while not sub.closed:
+                try:
+                    yield sub.queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+        finally:
+            self._remove(sub)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+            replay = len(self._replay)
+        return dict(self._stats, subscribers=subscribers, replay_buffer=replay,
+                    last_event_id=self._last_id, interval=self.interval)
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
@@ -1,292 +1,271 @@
+import argparse
 import sqlite3
-import random
 from datetime import datetime, timedelta
 import time
-import threading
 import sys
 
-def create_crowd_mobility_db():
-    print("🚀 Creating crowd_mobility.db database...")
+import numpy as np
+
+import alerts
+import database
+import emissions
+import ingest
+import locations
+import migrate
+import partitions
+import realtime_updater
+import retention
+import rollups
+import sensors
+
+def create_crowd_mobility_db(path=None, **history):
+    """Create a fresh database; keyword arguments go to generate_historical_data()"""
+    path = path or database.DB_PATH
+    print(f"🚀 Creating {path} database...")
     
-    conn = sqlite3.connect('crowd_mobility.db', check_same_thread=False)
+    conn = sqlite3.connect(path, check_same_thread=False)
     cursor = conn.cursor()
     
-    # Drop existing tables if they exist
+    # Bulk-load settings: no journal or fsync while the fresh file is filled
+    for pragma in BULK_LOAD_PRAGMAS:
+        cursor.execute(pragma)
+    
+    # Drop existing tables, views and day partitions if they exist
     print("📊 Creating fresh tables...")
-    cursor.execute('DROP TABLE IF EXISTS crowd_data')
-    cursor.execute('DROP TABLE IF EXISTS mobility_data')
-    cursor.execute('DROP TABLE IF EXISTS carbon_data')
+    old = cursor.execute('''
+        SELECT type, name FROM sqlite_master
+        WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'
+    ''').fetchall()
+    reading_tables = tuple(partitions.TABLES)
+    rollup_tables = {spec['table'] for spec in rollups.ROLLUPS.values()}
+    for kind, name in old:
+        if name.startswith(reading_tables) or name in rollup_tables or name in (
+                'partition_ids', 'locations', 'location_state', 'alerts'):
+            cursor.execute(f'DROP {kind.upper()} IF EXISTS {name}')
     
-    # Create tables with proper schema
-    cursor.execute('''
-    CREATE TABLE crowd_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        location TEXT NOT NULL,
-        density REAL NOT NULL,
-        timestamp DATETIME NOT NULL,
-        anomaly INTEGER DEFAULT 0,
-        emotion_score REAL DEFAULT 0.5,
-        category TEXT DEFAULT 'normal'
-    )
-    ''')
+    # Expired partitions are dropped, so let freed pages go back to the OS
+    retention.enable_incremental_vacuum(conn)
     
-    cursor.execute('''
-    CREATE TABLE mobility_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        vehicle_type TEXT NOT NULL,
-        route TEXT NOT NULL,
-        co2_emission REAL NOT NULL,
-        distance REAL NOT NULL,
-        timestamp DATETIME NOT NULL,
-        speed REAL DEFAULT 30.0,
-        status TEXT DEFAULT 'moving'
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE carbon_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        location TEXT NOT NULL,
-        co2_level REAL NOT NULL,
-        timestamp DATETIME NOT NULL,
-        source TEXT NOT NULL,
-        trend TEXT DEFAULT 'stable'
-    )
-    ''')
+    # Create tables with proper schema
+    migrate.create_tables(conn)
+    alerts.create_tables(conn)
     
     conn.commit()
     print("✅ Database structure created")
     
     # Generate initial historical data
-    generate_historical_data(conn, cursor)
+    generate_historical_data(conn, cursor, **history)
     
-    # Create indexes
-    cursor.execute("CREATE INDEX idx_crowd_timestamp ON crowd_data(timestamp)")
-    cursor.execute("CREATE INDEX idx_mobility_timestamp ON mobility_data(timestamp)")
-    cursor.execute("CREATE INDEX idx_carbon_timestamp ON carbon_data(timestamp)")
-    cursor.execute("CREATE INDEX idx_crowd_location ON crowd_data(location)")
+    # Create indexes after the load so inserts don't maintain them row by row
+    print("🗂️ Building indexes and rollups...")
+    for table in partitions.TABLES:
+        for day in partitions.days(conn, table):
+            partitions.create_indexes(conn, table, day)
+    
+    # Build minute/hour/day rollups from the generated history
+    rollups.backfill(conn)
+    locations.backfill(conn)
+    sensors.ensure(conn)
     
     conn.commit()
+    
+    # WAL is persistent, so readers and the updater stop blocking each other
+    cursor.execute("PRAGMA locking_mode = NORMAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute("PRAGMA journal_mode = WAL")
     conn.close()
-    print("✅ Database created successfully: crowd_mobility.db")
+    print(f"✅ Database created successfully: {path}")
     
     return True
 
-def generate_historical_data(conn, cursor):
-    """Generate 7 days of historical data"""
-    print("📅 Generating 7-day historical data...")
+BULK_LOAD_PRAGMAS = (
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA locking_mode = EXCLUSIVE',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -262144',
+)
+
+BASE_LOCATIONS = [
+    "Stadium Main Gate", "Stadium North Stand", "Stadium South Stand",
+    "VIP Entrance", "Parking Lot A", "Parking Lot B", "Metro Station",
+    "Bus Terminal", "Food Court", "Security Checkpoint"
+]
+
+
+def location_names(count):
+    """The ten venue locations, then numbered zones for larger synthetic venues"""
+    names = BASE_LOCATIONS[:count]
+    names += [f"Zone {i}" for i in range(len(names) + 1, count + 1)]
+    return names
+
+
+def generate_historical_data(conn, cursor, days=7, locations=10, rows_per_hour=1,
+                             trips_per_hour=2, carbon_per_hour=1, seed=None, end=None,
+                             batch_rows=250000):
+    """Generate `days` days of history plus today, batch-wise with NumPy"""
+    print(f"📅 Generating {days}-day historical data...")
+    rng = np.random.default_rng(seed)
     
-    locations = [
-        "Stadium Main Gate", "Stadium North Stand", "Stadium South Stand",
-        "VIP Entrance", "Parking Lot A", "Parking Lot B", "Metro Station",
-        "Bus Terminal", "Food Court", "Security Checkpoint"
-    ]
+    location_list = location_names(locations)
+    vehicle_types = np.array(emissions.VEHICLE_TYPES)
+    routes = np.array(["Route A", "Route B", "Route C", "Route D"])
+    sources = np.array(["Transport", "Energy", "Commercial", "Waste"])
+    statuses = np.array(['moving', 'idle', 'slow'])
+    trends = np.array(['increasing', 'stable', 'decreasing'])
     
-    vehicle_types = ["Car", "Bus", "EV", "Bike", "Metro", "Walking", "Taxi"]
-    routes = ["Route A", "Route B", "Route C", "Route D"]
-    sources = ["Transport", "Energy", "Commercial", "Waste"]
+    # Emission factors (see emissions.py)
+    factors = np.array([emissions.factor(v) for v in vehicle_types])
     
-    # Generate data for last 7 days
-    for day_offset in range(7, -1, -1):
-        base_date = datetime.now() - timedelta(days=day_offset)
+    # Location-specific density multipliers (low, high)
+    loc_names = np.array(location_list)
+    loc_low = np.ones(len(location_list))
+    loc_high = np.ones(len(location_list))
+    for i, location in enumerate(location_list):
+        if "Gate" in location or "Entrance" in location:
+            loc_low[i], loc_high[i] = 1.2, 1.8
+        elif "Parking" in location:
+            loc_low[i], loc_high[i] = 0.8, 1.2
+    
+    # Hour grid: from midnight `days` days back up to the current hour
+    # (or through the end of the --end day)
+    if end is None:
+        last_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+    else:
+        last_hour = datetime.combine(end, datetime.min.time()) + timedelta(hours=23)
+    first_hour = datetime.combine(last_hour.date() - timedelta(days=days), datetime.min.time())
+    total_hours = int((last_hour - first_hour) / timedelta(hours=1)) + 1
+    local_hours = [first_hour + timedelta(hours=i) for i in range(total_hours)]
+    hours = np.array([int(hour.timestamp() * 1000) for hour in local_hours], dtype=np.int64)
+    hour_of_day = np.array([hour.hour for hour in local_hours])
+    is_peak = ((8 <= hour_of_day) & (hour_of_day <= 10)) | ((17 <= hour_of_day) & (hour_of_day <= 20))
+    
+    # Batches never straddle a day, so each one fills a single partition
+    per_hour = locations * rows_per_hour + trips_per_hour + carbon_per_hour
+    hours_per_batch = max(1, batch_rows // max(1, per_hour))
+    batches = []
+    for h0 in range(total_hours):
+        day = local_hours[h0].date()
+        if batches and batches[-1][0] == day and len(batches[-1][1]) < hours_per_batch:
+            batches[-1][1].append(h0)
+        else:
+            batches.append((day, [h0]))
+    totals = {'crowd_data': 0, 'mobility_data': 0, 'carbon_data': 0}
+    next_id = {table: 1 for table in partitions.TABLES}
+    started = time.perf_counter()
+    
+    def insert(table, columns, n, values):
+        name = partitions.create_partition(conn, table, day, indexes=False)
+        ids = range(next_id[table], next_id[table] + n)
+        cursor.executemany(
+            f"INSERT INTO {name} (id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})",
+            zip(ids, *values))
+        next_id[table] += n
+        totals[table] += n
+    
+    for day, batch_hours in batches:
+        h = np.array(batch_hours)
+        
+        # Crowd data: rows_per_hour readings per location per hour
+        n = len(h) * locations * rows_per_hour
+        row_hour = np.repeat(h, locations * rows_per_hour)
+        row_loc = np.tile(np.arange(locations), len(h) * rows_per_hour)
+        density = rng.uniform(0.1, 0.6, n)
+        density *= np.where(is_peak[row_hour], rng.uniform(1.3, 2.0, n), 1.0)
+        density *= rng.uniform(loc_low[row_loc], loc_high[row_loc])
+        np.minimum(density, 1.0, out=density)
+        anomaly = (rng.random(n) < 0.02).astype(np.int64)
+        emotion_score = rng.uniform(0.4, 0.9, n)
+        ts = hours[row_hour] + rng.integers(0, 3600 * 1000, n)
+        insert('crowd_data', ('location', 'density', 'ts', 'anomaly', 'emotion_score', 'category'), n,
+               (loc_names[row_loc].tolist(), density.tolist(), ts.tolist(), anomaly.tolist(),
+                emotion_score.tolist(), ['historical'] * n))
         
-        # Generate crowd data for each hour
-        for hour in range(24):
-            timestamp = base_date.replace(hour=hour, minute=random.randint(0, 59), second=random.randint(0, 59))
-            
-            # Simulate peak hours (8-10 AM, 5-8 PM)
-            is_peak_hour = (8 <= hour <= 10) or (17 <= hour <= 20)
-            
-            for location in locations:
-                # Base density
-                base_density = random.uniform(0.1, 0.6)
-                
-                # Increase during peak hours
-                if is_peak_hour:
-                    base_density *= random.uniform(1.3, 2.0)
-                
-                # Location-specific adjustments
-                if "Gate" in location or "Entrance" in location:
-                    base_density *= random.uniform(1.2, 1.8)
-                elif "Parking" in location:
-                    base_density *= random.uniform(0.8, 1.2)
-                
-                density = min(1.0, base_density)
-                anomaly = 1 if random.random() < 0.02 else 0
-                emotion_score = random.uniform(0.4, 0.9)
-                category = 'historical'
-                
-                cursor.execute('''
-                INSERT INTO crowd_data (location, density, timestamp, anomaly, emotion_score, category)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ''', (location, density, timestamp, anomaly, emotion_score, category))
+        # Mobility data
+        n = len(h) * trips_per_hour
+        row_hour = np.repeat(h, trips_per_hour)
+        vehicle = rng.integers(0, len(vehicle_types), n)
+        distance = np.round(rng.uniform(1, 25, n), 2)
+        co2_emission = np.round(factors[vehicle] * distance, 2)
+        ts = hours[row_hour] + rng.integers(0, 3600 * 1000, n)
+        insert('mobility_data', ('vehicle_type', 'route', 'co2_emission', 'distance', 'ts', 'speed', 'status'), n,
+               (vehicle_types[vehicle].tolist(), routes[rng.integers(0, len(routes), n)].tolist(),
+                co2_emission.tolist(), distance.tolist(), ts.tolist(),
+                rng.uniform(20, 80, n).tolist(), statuses[rng.integers(0, len(statuses), n)].tolist()))
         
-        # Generate mobility data
-        for _ in range(50):
-            vehicle = random.choice(vehicle_types)
-            route = random.choice(routes)
-            distance = round(random.uniform(1, 25), 2)
-            
-            # Emission factors
-            emission_factors = {
-                "Car": 0.2, "Bus": 0.1, "EV": 0.05, "Bike": 0.01,
-                "Metro": 0.05, "Walking": 0.0, "Taxi": 0.25
-            }
-            
-            co2_emission = round(emission_factors[vehicle] * distance, 2)
-            timestamp = base_date.replace(
-                hour=random.randint(0, 23),
-                minute=random.randint(0, 59),
-                second=random.randint(0, 59)
-            )
-            speed = random.uniform(20, 80)
-            status = random.choice(['moving', 'idle', 'slow'])
-            
-            cursor.execute('''
-            INSERT INTO mobility_data (vehicle_type, route, co2_emission, distance, timestamp, speed, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (vehicle, route, co2_emission, distance, timestamp, speed, status))
+        # Carbon data, higher during peak hours
+        n = len(h) * carbon_per_hour
+        row_hour = np.repeat(h, carbon_per_hour)
+        co2_level = rng.uniform(300, 600, n)
+        co2_level *= np.where(is_peak[row_hour], rng.uniform(1.2, 1.5, n), 1.0)
+        ts = hours[row_hour] + rng.integers(0, 3600 * 1000, n)
+        insert('carbon_data', ('location', 'co2_level', 'ts', 'source', 'trend'), n,
+               (loc_names[rng.integers(0, locations, n)].tolist(), np.round(co2_level, 2).tolist(),
+                ts.tolist(), sources[rng.integers(0, len(sources), n)].tolist(),
+                trends[rng.integers(0, len(trends), n)].tolist()))
         
-        # Generate carbon data
-        for _ in range(30):
-            location = random.choice(locations)
-            source = random.choice(sources)
-            
-            # Base CO2 levels with daily patterns
-            base_co2 = random.uniform(300, 600)
-            
-            # Increase during peak hours
-            hour = random.randint(0, 23)
-            if 8 <= hour <= 10 or 17 <= hour <= 20:
-                base_co2 *= random.uniform(1.2, 1.5)
-            
-            co2_level = round(base_co2, 2)
-            timestamp = base_date.replace(
-                hour=hour,
-                minute=random.randint(0, 59),
-                second=random.randint(0, 59)
-            )
-            trend = random.choice(['increasing', 'stable', 'decreasing'])
-            
-            cursor.execute('''
-            INSERT INTO carbon_data (location, co2_level, timestamp, source, trend)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (location, co2_level, timestamp, source, trend))
+        conn.commit()
     
+    for table, last_id in next_id.items():
+        cursor.execute('UPDATE partition_ids SET last_id = ? WHERE tbl = ?', (last_id - 1, table))
     conn.commit()
-    print(f"✅ Generated historical data for 7 days")
-    return True
+    
+    elapsed = time.perf_counter() - started
+    total = sum(totals.values())
+    print(f"✅ Generated {total:,} rows for {days} days in {elapsed:.1f}s "
+          f"({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    return totals
 
 def add_realtime_data():
     """Add real-time data point"""
     try:
-        conn = sqlite3.connect('crowd_mobility.db', check_same_thread=False)
-        cursor = conn.cursor()
-        
-        locations = ["Stadium Main Gate", "Parking Lot A", "Metro Station", "Bus Terminal"]
-        vehicle_types = ["Car", "Bus", "EV", "Bike", "Taxi"]
-        sources = ["Transport", "Energy", "Commercial"]
-        
         timestamp = datetime.now()
+        crowd_rows, mobility_rows, carbon_rows = realtime_updater.simulate_readings(timestamp)
         
-        # Add crowd data
-        for location in locations:
-            # Simulate real-time variations
-            base_hour_factor = 1.0
-            current_hour = timestamp.hour
-            
-            # Peak hours adjustment
-            if 8 <= current_hour <= 10:
-                base_hour_factor = 1.5
-            elif 17 <= current_hour <= 20:
-                base_hour_factor = 1.8
-            elif 0 <= current_hour <= 5:
-                base_hour_factor = 0.4
-            
-            base_density = random.uniform(0.3, 0.7) * base_hour_factor
-            density = min(1.0, base_density)
-            
-            # Random anomalies
-            anomaly = 1 if random.random() < 0.05 else 0
-            emotion_score = random.uniform(0.5, 0.9)
-            category = 'realtime'
-            
-            cursor.execute('''
-            INSERT INTO crowd_data (location, density, timestamp, anomaly, emotion_score, category)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (location, density, timestamp, anomaly, emotion_score, category))
+        # Write everything (and its rollups) through the shared writer in one transaction
+        ingest.store_readings(crowd_rows, mobility_rows, carbon_rows)
         
-        # Add mobility data
-        for _ in range(5):
-            vehicle = random.choice(vehicle_types)
-            route = f"Route {random.choice(['A', 'B', 'C', 'D'])}"
-            distance = round(random.uniform(5, 20), 2)
-            
-            emission_factors = {
-                "Car": 0.2, "Bus": 0.1, "EV": 0.05,
-                "Bike": 0.01, "Taxi": 0.25
-            }
-            
-            co2_emission = round(emission_factors[vehicle] * distance, 2)
-            speed = random.uniform(20, 60)
-            status = random.choice(['moving', 'idle', 'slow'])
-            
-            cursor.execute('''
-            INSERT INTO mobility_data (vehicle_type, route, co2_emission, distance, timestamp, speed, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (vehicle, route, co2_emission, distance, timestamp, speed, status))
-        
-        # Add carbon data
-        for location in locations[:2]:
-            source = random.choice(sources)
-            
-            # Real-time CO2 with variations
-            base_co2 = random.uniform(350, 550)
-            
-            # Time-based adjustments
-            if 8 <= current_hour <= 10 or 17 <= current_hour <= 20:
-                base_co2 *= 1.3
-            
-            co2_level = round(base_co2, 2)
-            trend = random.choice(['increasing', 'stable', 'decreasing'])
-            
-            cursor.execute('''
-            INSERT INTO carbon_data (location, co2_level, timestamp, source, trend)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (location, co2_level, timestamp, source, trend))
-        
-        conn.commit()
-        conn.close()
         print(f"✅ Added real-time data at {timestamp.strftime('%H:%M:%S')}")
         return True
     except Exception as e:
         print(f"❌ Error adding real-time data: {e}")
         return False
 
-def start_realtime_updater():
-    """Start thread to add real-time data every minute"""
-    def update_loop():
-        while True:
-            try:
-                add_realtime_data()
-            except Exception as e:
-                print(f"❌ Error in update loop: {e}")
-            time.sleep(60)  # Update every minute
-    
-    thread = threading.Thread(target=update_loop, daemon=True)
-    thread.start()
-    print("🚀 Real-time data updater started (updates every minute)")
+def start_realtime_updater(interval=60.0, rate=None):
+    """Feed simulated readings through the group-commit ingestion daemon"""
+    daemon, thread = realtime_updater.start(interval=interval, rate=rate)
+    cadence = f"{rate:,.0f} readings/s" if rate else f"every {interval:g}s"
+    print(f"🚀 Real-time data updater started ({cadence})")
     return thread
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Create crowd_mobility.db with synthetic history")
+    parser.add_argument('--db', help="database file (default: CROWD_DB_PATH or crowd_mobility.db)")
+    parser.add_argument('--days', type=int, default=7, help="days of history before today")
+    parser.add_argument('--locations', type=int, default=10, help="number of crowd locations")
+    parser.add_argument('--rows-per-hour', type=int, default=1, help="crowd readings per location per hour")
+    parser.add_argument('--trips-per-hour', type=int, default=2, help="mobility trips per hour")
+    parser.add_argument('--carbon-per-hour', type=int, default=1, help="carbon readings per hour")
+    parser.add_argument('--seed', type=int, help="random seed for reproducible data")
+    parser.add_argument('--end', type=lambda v: datetime.strptime(v, '%Y-%m-%d').date(),
+                        help="last day of history (YYYY-MM-DD); defaults to now")
+    parser.add_argument('--no-updater', action='store_true', help="exit after creating the database")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    # Create database first
-    create_crowd_mobility_db()
+    args = parse_args()
+    if args.db:
+        database.DB_PATH = args.db
     
-    # Start real-time updater
-    updater_thread = start_realtime_updater()
+    # Create database first
+    create_crowd_mobility_db(
+        days=args.days, locations=args.locations, rows_per_hour=args.rows_per_hour,
+        trips_per_hour=args.trips_per_hour, carbon_per_hour=args.carbon_per_hour,
+        seed=args.seed, end=args.end
+    )
     
     # Show database stats
-    conn = sqlite3.connect('crowd_mobility.db')
+    conn = sqlite3.connect(database.DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute("SELECT COUNT(*) FROM crowd_data")
@@ -304,6 +283,12 @@ if __name__ == "__main__":
     
     conn.close()
     
+    if args.no_updater:
+        sys.exit(0)
+    
+    # Start real-time updater
+    updater_thread = start_realtime_updater()
+    
     # Keep the script running
     print("\n🔄 Real-time data generator is running...")
     print("Press Ctrl+C to stop\n")
@@ -0,0 +1,379 @@
+from datetime import datetime, timedelta
+from functools import cached_property
+
+import alerts
+import locations
+import metrics
+import partitions
+import sensors
+import serialization
+import timeseries
+
+# Raw-table queries name their table as {crowd_data} etc.; raw() fills in
+# the day partitions the window touches (see partitions.py).
+
+# Sections served by /api/dashboard, in the order they are computed.
+# 'crowd', 'mobility' and 'carbon' are the three parts of /api/realtime-metrics.
+SECTIONS = ('crowd', 'mobility', 'carbon', 'graph', 'locations', 'alerts', 'status', 'trends')
+OPTIONAL_SECTIONS = ('history',)
+
+# Longest trends/history period; every day is one row of the response
+MAX_DAYS = 366
+# Longest live-graph window (a week); it is read from the raw readings
+MAX_MINUTES = 7 * 24 * 60
+
+CROWD_STATS_SQL = '''
+    SELECT AVG(density) as avg_density,
+           COUNT(CASE WHEN anomaly = 1 THEN 1 END) as anomalies,
+           COUNT(*) as total_readings
+    FROM {crowd_data}
+    WHERE ts > ?
+'''
+
+MOBILITY_STATS_SQL = '''
+    SELECT COUNT(DISTINCT vehicle_type) as vehicle_types,
+           SUM(co2_emission) as total_co2,
+           COUNT(*) as trips
+    FROM {mobility_data}
+    WHERE ts > ?
+'''
+
+CARBON_STATS_SQL = '''
+    SELECT AVG(co2_level) as avg_co2,
+           COUNT(*) as readings
+    FROM {carbon_data}
+    WHERE ts > ?
+'''
+
+HOURLY_CROWD_SQL = '''
+    SELECT CAST(substr(bucket, 12, 2) AS INTEGER) as hour,
+           SUM(total) / SUM(readings) as avg_density
+    FROM crowd_rollup
+    WHERE grain = 'hour' AND bucket >= ?
+    GROUP BY hour
+'''
+
+HOURLY_CARBON_SQL = '''
+    SELECT CAST(substr(bucket, 12, 2) AS INTEGER) as hour,
+           SUM(total) / SUM(readings) as avg_co2
+    FROM carbon_rollup
+    WHERE grain = 'hour' AND bucket >= ?
+    GROUP BY hour
+'''
+
+DAILY_TRIPS_SQL = '''
+    SELECT bucket as day, vehicle_type, SUM(readings) as trips
+    FROM mobility_rollup
+    WHERE grain = 'day' AND bucket >= ?
+    GROUP BY bucket, vehicle_type
+    ORDER BY bucket, trips DESC
+'''
+
+DAILY_CROWD_SQL = '''
+    SELECT bucket as day, SUM(total) / SUM(readings) as avg_density
+    FROM crowd_rollup
+    WHERE grain = 'day' AND bucket >= ?
+    GROUP BY bucket
+'''
+
+DAILY_CARBON_SQL = '''
+    SELECT bucket as day, SUM(total) / SUM(readings) as avg_co2
+    FROM carbon_rollup
+    WHERE grain = 'day' AND bucket >= ?
+    GROUP BY bucket
+'''
+
+DAILY_VEHICLE_DIVERSITY_SQL = '''
+    SELECT bucket as day, COUNT(DISTINCT vehicle_type) as vehicle_types
+    FROM mobility_rollup
+    WHERE grain = 'day' AND bucket >= ?
+    GROUP BY bucket
+'''
+
+# The unary + stops the planner walking all of (vehicle_type, ts) just to
+# skip the GROUP BY sort; a range on ts reads far fewer rows
+VEHICLE_DISTRIBUTION_SQL = '''
+    SELECT vehicle_type, COUNT(*) as count
+    FROM {mobility_data}
+    WHERE ts > ?
+    GROUP BY +vehicle_type
+'''
+
+
+def parse_sections(value):
+    """Turn a ?sections=crowd,alerts argument into a validated tuple"""
+    if not value:
+        return SECTIONS
+    requested = [s.strip() for s in value.split(',') if s.strip()]
+    unknown = [s for s in requested if s not in SECTIONS + OPTIONAL_SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(requested))
+
+
+def bounded(name, value, low, high):
+    """A query argument, or ValueError when it is outside [low, high]"""
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+class Snapshot:
+    """Dashboard data computed from one connection.
+
+    Every query result is cached on the instance, so sections that need the
+    same intermediate (e.g. the 5-minute crowd stats) only run it once.
+    """
+
+    def __init__(self, conn, minutes=30, days=7, history_days=30, step=300, fill='none', window=None,
+                 location=None, vehicle_type=None, columnar=False, hot=None, bbox=None):
+        self.conn = conn
+        self.window = window if window is not None and window.ready else None
+        # Recent raw readings from memory where it holds the range (hot_store.py)
+        self.hot = hot if hot is not None and hot.ready else None
+        self.minutes = bounded('minutes', minutes, 1, MAX_MINUTES)
+        self.step = step
+        self.fill = fill
+        self.days = bounded('days', days, 0, MAX_DAYS)
+        self.history_days = bounded('history_days', history_days, 0, MAX_DAYS)
+        self.location = location
+        self.vehicle_type = vehicle_type
+        # Map viewport (west, south, east, north) for locations()
+        self.bbox = bbox
+        # Series as parallel arrays plus a time base (?format=columnar)
+        self.columnar = columnar
+        self.now = datetime.now()
+        # Readings are stored with epoch-millisecond ts
+        self.now_ms = int(self.now.timestamp() * 1000)
+
+    def collect(self, sections=SECTIONS):
+        """Compute the requested sections inside a single read transaction"""
+        self.conn.execute('BEGIN')
+        try:
+            result = {'timestamp': self.now.isoformat()}
+            for section in sections:
+                result[section] = getattr(self, section)()
+            return result
+        finally:
+            self.conn.rollback()
+
+    def raw(self, sql, since_ms):
+        """Run a raw-table query over the partitions since `since_ms`"""
+        return self.conn.execute(partitions.expand(self.conn, sql, since_ms, self.now_ms), (since_ms,))
+
+    # Shared intermediates
+    @cached_property
+    def window_stats(self):
+        return self.window.stats()
+
+    @cached_property
+    def crowd_stats(self):
+        if self.window:
+            return self.window_stats['crowd']
+        return self.raw(CROWD_STATS_SQL, self.now_ms - 5 * 60000).fetchone()
+
+    @cached_property
+    def mobility_stats(self):
+        if self.window:
+            return self.window_stats['mobility']
+        return self.raw(MOBILITY_STATS_SQL, self.now_ms - 5 * 60000).fetchone()
+
+    @cached_property
+    def carbon_stats(self):
+        if self.window:
+            return self.window_stats['carbon']
+        return self.raw(CARBON_STATS_SQL, self.now_ms - 5 * 60000).fetchone()
+
+    @cached_property
+    def vehicle_distribution(self):
+        vehicle_dist = []
+        since_ms = self.now_ms - 60 * 60000
+        if self.hot and self.hot.covers(since_ms):
+            # ts > since_ms, like the SQL
+            counts = self.hot.aggregate('mobility_data', 'vehicle_type', since_ms + 1, fn='count',
+                                        by='vehicle_type')
+            rows = [{'vehicle_type': vehicle, 'count': counts[vehicle]} for vehicle in sorted(counts)]
+        else:
+            rows = self.raw(VEHICLE_DISTRIBUTION_SQL, since_ms).fetchall()
+        for row in rows:
+            vehicle_dist.append({
+                'vehicle': row['vehicle_type'],
+                'count': row['count']
+            })
+
+        # If no real data, add sample data
+        if not vehicle_dist:
+            vehicle_dist = [
+                {'vehicle': 'Car', 'count': 25},
+                {'vehicle': 'Bus', 'count': 15},
+                {'vehicle': 'EV', 'count': 10},
+                {'vehicle': 'Bike', 'count': 8},
+                {'vehicle': 'Metro', 'count': 12}
+            ]
+        return vehicle_dist
+
+    # Sections
+    def crowd(self):
+        crowd_density = round((self.crowd_stats['avg_density'] or 0.5) * 100, 1)
+        return {
+            'density': crowd_density,
+            'anomalies': self.crowd_stats['anomalies'] or 0,
+            'readings': self.crowd_stats['total_readings'] or 10,
+            'status': 'high' if crowd_density > 70 else 'normal'
+        }
+
+    def mobility(self):
+        total_co2 = round(self.mobility_stats['total_co2'] or 25.5, 2)
+        return {
+            'vehicle_types': self.mobility_stats['vehicle_types'] or 5,
+            'total_co2': total_co2,
+            'trips': self.mobility_stats['trips'] or 15,
+            'status': 'busy' if total_co2 > 30 else 'normal'
+        }
+
+    def carbon(self):
+        avg_co2 = round(self.carbon_stats['avg_co2'] or 450, 1)
+        return {
+            'level': avg_co2,
+            'readings': self.carbon_stats['readings'] or 8,
+            'status': 'high' if avg_co2 > 500 else 'normal'
+        }
+
+    def realtime_metrics(self):
+        return {
+            'timestamp': self.now.isoformat(),
+            'crowd': self.crowd(),
+            'mobility': self.mobility(),
+            'carbon': self.carbon()
+        }
+
+    def graph(self):
+        minutes = self.minutes
+        grid = timeseries.Grid(self.now_ms / 1000, minutes, self.step)
+        crowd_filter = {'location': self.location} if self.location else None
+        co2_filter = {'vehicle_type': self.vehicle_type} if self.vehicle_type else None
+
+        # Crowd density (%) and CO2 emitted per bucket, one GROUP BY (or hot store scan) each
+        density = timeseries.bucketed(self.conn, grid, 'density', crowd_filter, self.hot) * 100
+        density = timeseries.fill_gaps(density, self.fill)
+        co2 = timeseries.fill_gaps(timeseries.bucketed(self.conn, grid, 'co2', co2_filter, self.hot), 'zero')
+
+        crowd_data = timeseries.to_json_list(density, 1)
+        co2_data = timeseries.to_json_list(co2, 2)
+
+        if self.columnar:
+            # Labels are start + i * step shifted by utc_offset, formatted HH:MM
+            return {
+                'format': 'columnar',
+                'time': {'start': grid.start_s * 1000, 'step': grid.step * 1000, 'count': grid.size,
+                         'utc_offset': grid.utc_offset() * 1000},
+                'crowd_graph': {'density': crowd_data},
+                'co2_graph': {'co2': co2_data},
+                'vehicle_distribution': self.vehicle_distribution,
+                'time_range': minutes,
+                'step': self.step
+            }
+
+        times = grid.labels()
+        return {
+            'crowd_graph': [{'time': t, 'density': d} for t, d in zip(times, crowd_data)],
+            'co2_graph': [{'time': t, 'co2': c} for t, c in zip(times, co2_data)],
+            'vehicle_distribution': self.vehicle_distribution,
+            'time_range': minutes,
+            'step': self.step
+        }
+
+    def day_labels(self, days):
+        return [(self.now - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days, -1, -1)]
+
+    def trends(self):
+        days = self.days
+        days_list = self.day_labels(days)
+        since = days_list[0]
+
+        # Crowd trends by hour of day, from hourly rollups
+        hourly = {row['hour']: row['avg_density'] for row in self.conn.execute(HOURLY_CROWD_SQL, (since,))}
+        crowd_trends = []
+        for hour in range(24):
+            crowd_trends.append({
+                'hour': hour,
+                'density': round((hourly.get(hour) or 0) * 100, 1)
+            })
+
+        # Trips per vehicle type per day, from daily rollups
+        mobility_trends = {day: [] for day in days_list}
+        for row in self.conn.execute(DAILY_TRIPS_SQL, (since,)):
+            if row['day'] in mobility_trends:
+                mobility_trends[row['day']].append({'vehicle_type': row['vehicle_type'], 'trips': row['trips']})
+
+        return {
+            'crowd_trends': crowd_trends,
+            'mobility_trends': mobility_trends,
+            'days': days
+        }
+
+    def locations(self):
+        # One row per location from the materialized state (see locations.py),
+        # limited to the sensors in the viewport through their R-tree
+        names = None
+        if self.bbox is not None:
+            names = {name for _, name, _, _ in sensors.within(self.conn, self.bbox)}
+        return locations.current(self.conn, self.now, names)
+
+    @cached_property
+    def active_alerts(self):
+        # Raised on ingest by the alert engine (see alerts.py)
+        return alerts.active(self.conn, self.now_ms)
+
+    def alerts(self):
+        return self.active_alerts
+
+    def status(self):
+        # Real freshness, ingest rates and API latency (see metrics.py)
+        return metrics.system_status(self.conn, self.now_ms, active_alerts=len(self.active_alerts))
+
+    def history(self):
+        days = self.history_days
+        days_list = self.day_labels(days)
+        since = days_list[0]
+
+        # Daily data, from daily rollups
+        crowd = {row['day']: row['avg_density'] for row in self.conn.execute(DAILY_CROWD_SQL, (since,))}
+        carbon = {row['day']: row['avg_co2'] for row in self.conn.execute(DAILY_CARBON_SQL, (since,))}
+        diversity = {row['day']: row['vehicle_types'] for row in self.conn.execute(DAILY_VEHICLE_DIVERSITY_SQL, (since,))}
+        daily_data = []
+        for day in days_list:
+            daily_data.append({
+                'date': day,
+                'crowd_density': round(crowd[day] * 100, 1) if day in crowd else None,
+                'co2_level': round(carbon[day], 1) if day in carbon else None,
+                'vehicle_diversity': diversity.get(day, 0)
+            })
+
+        # Hourly patterns over the same period, from hourly rollups
+        hourly_crowd = {row['hour']: row['avg_density'] for row in self.conn.execute(HOURLY_CROWD_SQL, (since,))}
+        hourly_carbon = {row['hour']: row['avg_co2'] for row in self.conn.execute(HOURLY_CARBON_SQL, (since,))}
+        hourly_data = []
+        for hour in range(24):
+            hourly_data.append({
+                'hour': hour,
+                'crowd_density': round(hourly_crowd[hour] * 100, 1) if hour in hourly_crowd else None,
+                'co2_level': round(hourly_carbon[hour], 1) if hour in hourly_carbon else None
+            })
+
+        if self.columnar:
+            return {
+                'format': 'columnar',
+                'daily_trends': {'start': days_list[0], 'step_days': 1,
+                                 **serialization.to_columns(daily_data, ('crowd_density', 'co2_level',
+                                                                         'vehicle_diversity'))},
+                'hourly_patterns': {'start_hour': 0, 'step_hours': 1,
+                                    **serialization.to_columns(hourly_data, ('crowd_density', 'co2_level'))},
+                'analysis_period': days
+            }
+
+        return {
+            'daily_trends': daily_data,
+            'hourly_patterns': hourly_data,
+            'analysis_period': days
+        }
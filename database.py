@@ -0,0 +1,359 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from profiler import WRITE_PREFIXES, profiler
+
+DB_PATH = os.environ.get('CROWD_DB_PATH', 'crowd_mobility.db')
+
+# Pragmas shared by every connection. WAL lets the dashboard keep reading
+# while the updater writes; NORMAL sync is safe under WAL and avoids an
+# fsync per commit.
+COMMON_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 268435456',
+)
+READER_PRAGMAS = COMMON_PRAGMAS + (
+    'PRAGMA cache_size = -8000',
+    'PRAGMA query_only = ON',
+)
+WRITER_PRAGMAS = COMMON_PRAGMAS + (
+    'PRAGMA cache_size = -32000',
+)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds its execute/fetch time to the current request's SQL time"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.add_sql(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.add_sql(time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            metrics.add_sql(time.perf_counter() - started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            metrics.add_sql(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            metrics.add_sql(time.perf_counter() - started)
+
+
+class ProfiledCursor(TimedCursor):
+    """TimedCursor that also feeds the SQL profiler, iteration included"""
+
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        self._statement = statement = profiler.statement(self.connection, sql, parameters)
+        return self._run(statement, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._statement = statement = profiler.statement(self.connection, sql, None)
+        return self._run(statement, super().executemany, sql, seq_of_parameters)
+
+    def _run(self, statement, method, sql, parameters):
+        started, steps = time.perf_counter(), profiler.steps()
+        try:
+            return method(sql, parameters)
+        finally:
+            statement.seconds += time.perf_counter() - started
+            statement.steps += profiler.steps() - steps
+            if sql.lstrip()[:7].upper().startswith(WRITE_PREFIXES):
+                statement.changed = self.rowcount
+
+    def _fetch(self, method, *args):
+        started, steps = time.perf_counter(), profiler.steps()
+        try:
+            return method(*args)
+        finally:
+            if self._statement is not None:
+                self._statement.seconds += time.perf_counter() - started
+                self._statement.steps += profiler.steps() - steps
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        if row is not None and self._statement is not None:
+            self._statement.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(super().fetchmany, size)
+        if self._statement is not None:
+            self._statement.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        if self._statement is not None:
+            self._statement.rows += len(rows)
+        return rows
+
+    def __next__(self):
+        row = self._fetch(super().__next__)
+        if self._statement is not None:
+            self._statement.rows += 1
+        return row
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose shortcut execute() goes through a TimedCursor.
+
+    Rows pulled by iterating a cursor are not timed; fetch*() calls are.
+    Requests sampled by the profiler get a ProfiledCursor instead.
+    """
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = TimedCursor if profiler.current() is None else ProfiledCursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no read connection becomes free in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of reusable read connections plus one dedicated writer"""
+
+    def __init__(self, path=None, max_readers=8, timeout=5.0, cached_statements=256):
+        self.path = path or DB_PATH
+        self.max_readers = max_readers
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+        self._stats = {
+            'reader_acquisitions': 0,
+            'reader_waits': 0,
+            'reader_wait_ms_total': 0.0,
+            'reader_wait_ms_max': 0.0,
+            'reader_timeouts': 0,
+            'writer_acquisitions': 0,
+            'writer_wait_ms_total': 0.0,
+            'writer_wait_ms_max': 0.0,
+            'writer_rollbacks': 0,
+            'dedicated_readers': 0,
+        }
+
+    def _connect(self, pragmas):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=TimedConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def _get_writer(self):
+        if self._writer is None:
+            conn = self._connect(WRITER_PRAGMAS)
+            conn.execute('PRAGMA journal_mode = WAL')
+            self._writer = conn
+        return self._writer
+
+    def _acquire_reader(self):
+        try:
+            return self._idle.get_nowait(), 0.0
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise PoolTimeout('connection pool is closed')
+            first = self._created == 0
+            create = self._created < self.max_readers
+            if create:
+                self._created += 1
+
+        if create:
+            try:
+                # Make sure the file is in WAL mode before the first reader
+                # opens it; journal_mode is persistent so this runs once.
+                if first:
+                    with self._writer_lock:
+                        self._get_writer()
+                return self._connect(READER_PRAGMAS), 0.0
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats['reader_timeouts'] += 1
+            raise PoolTimeout(f'no read connection free after {self.timeout}s')
+        return conn, (time.perf_counter() - start) * 1000
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection for the duration of the block"""
+        conn, waited_ms = self._acquire_reader()
+        with self._lock:
+            self._stats['reader_acquisitions'] += 1
+            if waited_ms:
+                self._stats['reader_waits'] += 1
+                self._stats['reader_wait_ms_total'] += waited_ms
+                self._stats['reader_wait_ms_max'] = max(self._stats['reader_wait_ms_max'], waited_ms)
+        profiler.attach(conn, 'reader', waited_ms)
+        try:
+            yield conn
+        finally:
+            profiler.detach(conn)
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    @contextmanager
+    def dedicated_reader(self):
+        """Read-only connection outside the pool for long scans (exports), closed afterwards"""
+        with self._lock:
+            self._stats['dedicated_readers'] += 1
+        conn = self._connect(READER_PRAGMAS)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def writer(self):
+        """Hold the single writer connection; commits on success, rolls back on error"""
+        start = time.perf_counter()
+        with self._writer_lock:
+            waited_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._stats['writer_acquisitions'] += 1
+                self._stats['writer_wait_ms_total'] += waited_ms
+                self._stats['writer_wait_ms_max'] = max(self._stats['writer_wait_ms_max'], waited_ms)
+            conn = self._get_writer()
+            profiler.attach(conn, 'writer', waited_ms)
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                with self._lock:
+                    self._stats['writer_rollbacks'] += 1
+                raise
+            finally:
+                profiler.detach(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            created = self._created
+        idle = self._idle.qsize()
+        acquisitions = stats['reader_acquisitions']
+        stats.update({
+            'path': self.path,
+            'max_readers': self.max_readers,
+            'readers_open': created,
+            'readers_idle': idle,
+            'readers_in_use': created - idle,
+            'reader_wait_ms_avg': round(stats['reader_wait_ms_total'] / acquisitions, 3) if acquisitions else 0.0,
+            'writer_open': self._writer is not None,
+        })
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide pool, created on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    max_readers=int(os.environ.get('CROWD_DB_READERS', 8)),
+                )
+    return _pool
+
+
+def read_connection():
+    return get_pool().reader()
+
+
+def dedicated_read_connection():
+    return get_pool().dedicated_reader()
+
+
+def write_connection():
+    return get_pool().writer()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
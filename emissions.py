@@ -0,0 +1,31 @@
+"""Emission factors per vehicle type, in kg CO2 per km.
+
+The one registry for every producer of mobility readings (create_database.py,
+the realtime simulator) and for the scenario engine (scenarios.py), which
+prices trips moved to another mode with these factors.
+"""
+
+FACTORS = {
+    "Car": 0.2,
+    "Bus": 0.1,
+    "EV": 0.05,
+    "Bike": 0.01,
+    "Metro": 0.05,
+    "Walking": 0.0,
+    "Taxi": 0.25,
+}
+
+VEHICLE_TYPES = tuple(FACTORS)
+
+
+def factor(vehicle_type):
+    """kg CO2 per km for a vehicle type"""
+    try:
+        return FACTORS[vehicle_type]
+    except KeyError:
+        raise ValueError(f"no emission factor for {vehicle_type!r} (known: {', '.join(VEHICLE_TYPES)})")
+
+
+def co2_for(vehicle_type, distance):
+    """kg CO2 of one trip, rounded as stored in mobility_data"""
+    return round(factor(vehicle_type) * distance, 2)
@@ -0,0 +1,330 @@
+"""Streaming export of raw readings as CSV or Parquet.
+
+/api/export/<table> walks the table in id order over the day partitions
+that overlap the requested time range. Each page of PAGE_ROWS rows is a
+new statement, so a long export never pins one WAL snapshot. Rows come
+off the cursor CHUNK_ROWS at a time with fetchmany(). Each chunk becomes a
+block of CSV, and for Parquet (needs pyarrow, imported on the first Parquet
+export) chunks are batched into row groups of PARQUET_ROW_GROUP rows.
+Memory stays flat however large the export is.
+
+Exports read on their own connection rather than one from the pool, and
+only MAX_CONCURRENT run at once. Every row carries its id. A broken
+download resumes with ?after_id=<last id received>. Filters: since/until
+(ISO or epoch s/ms, until exclusive), location, vehicle_type, route,
+source, depending on the table; limit caps the row count.
+
+    curl -o crowd.csv 'http://localhost:5000/api/export/crowd_data?since=2026-02-01&location=Metro%20Station'
+    curl -o carbon.parquet 'http://localhost:5000/api/export/carbon?format=parquet'
+"""
+
+import csv
+import importlib.util
+import io
+import os
+import threading
+import time
+
+import database
+import ingest
+import partitions
+
+HAVE_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+FORMATS = ('csv', 'parquet')
+CHUNK_ROWS = int(os.environ.get('CROWD_EXPORT_CHUNK_ROWS', 5000))
+PAGE_ROWS = 200_000
+PARQUET_ROW_GROUP = 100_000
+MAX_CONCURRENT = int(os.environ.get('CROWD_EXPORT_MAX', 2))
+
+ALIASES = {table.split('_')[0]: table for table in partitions.TABLES}
+
+FILTERS = {
+    'crowd_data': ('location',),
+    'mobility_data': ('vehicle_type', 'route'),
+    'carbon_data': ('location', 'source'),
+}
+
+MIMETYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# since/until must be local datetimes partition pruning can convert: 1970 to 9999
+MAX_TS = 253402214400000
+
+_slots = threading.BoundedSemaphore(MAX_CONCURRENT)
+
+_stats_lock = threading.Lock()
+_stats = {'exports': 0, 'completed': 0, 'failed': 0, 'active': 0, 'rows': 0, 'bytes': 0, 'seconds': 0.0,
+          'last': None}
+
+
+class Slot:
+    """One of the MAX_CONCURRENT export slots; release() may be called more than once"""
+
+    def __init__(self):
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if not self._released:
+                self._released = True
+                _slots.release()
+
+
+def acquire():
+    """A Slot, or None when MAX_CONCURRENT exports are already running"""
+    return Slot() if _slots.acquire(blocking=False) else None
+
+
+def resolve_table(name):
+    table = ALIASES.get(name, name)
+    if table not in partitions.TABLES:
+        raise ValueError(f"table must be one of {', '.join(partitions.TABLES)}")
+    return table
+
+
+def parse_format(value):
+    value = value or 'csv'
+    if value not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if value == 'parquet' and not HAVE_PYARROW:
+        raise ValueError('parquet export needs the pyarrow package installed')
+    return value
+
+
+def parse_time(value):
+    try:
+        ts = ingest.to_ms(float(value))
+    except ValueError:
+        ts = ingest.to_ms(value)
+    if not 0 <= ts <= MAX_TS:
+        raise ValueError('out of range')
+    return ts
+
+
+def parse_count(value):
+    """A non-negative integer query argument, or None when absent"""
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise ValueError
+    return int(value)
+
+
+class Export:
+    def __init__(self, table, fmt='csv', since_ms=None, until_ms=None, filters=None, after_id=0, limit=None,
+                 chunk_rows=CHUNK_ROWS):
+        self.table = table
+        self.format = fmt
+        self.since_ms = since_ms
+        self.until_ms = until_ms
+        self.filters = filters or {}
+        self.after_id = after_id
+        self.limit = limit
+        self.chunk_rows = chunk_rows
+        self.columns = partitions.column_names(table)
+        self.rows = 0
+        self.bytes = 0
+        self.last_id = after_id
+        self.seconds = 0.0
+
+    @classmethod
+    def from_args(cls, name, args):
+        """Build an export from /api/export query arguments; ValueError on bad input"""
+        table = resolve_table(name)
+        fmt = parse_format(args.get('format'))
+        try:
+            since_ms = parse_time(args['since']) if args.get('since') else None
+            until_ms = parse_time(args['until']) if args.get('until') else None
+        except ValueError:
+            raise ValueError('since/until must be ISO timestamps or epoch seconds from 1970 to 9999')
+        try:
+            after_id = parse_count(args.get('after_id')) or 0
+            limit = parse_count(args.get('limit'))
+        except ValueError:
+            raise ValueError('after_id and limit must be whole numbers')
+        if limit is not None and limit < 1:
+            raise ValueError('limit must be >= 1')
+        unknown = [key for key in args if key not in ('format', 'since', 'until', 'after_id', 'limit')
+                   and key not in FILTERS[table]]
+        if unknown:
+            raise ValueError(f"unknown filter {unknown[0]!r}; {table} filters on {', '.join(FILTERS[table])}")
+        filters = {key: args[key] for key in FILTERS[table] if args.get(key)}
+        return cls(table, fmt, since_ms, until_ms, filters, after_id, limit)
+
+    def filename(self):
+        return f'{self.table}.{self.format}'
+
+    def query(self, conn, after_id, page):
+        where = ['id > ?']
+        params = [after_id]
+        if self.since_ms is not None:
+            where.append('ts >= ?')
+            params.append(self.since_ms)
+        if self.until_ms is not None:
+            where.append('ts < ?')
+            params.append(self.until_ms)
+        for column, value in self.filters.items():
+            # Unary + keeps SQLite off the (column, ts) index, whose order would need a sort
+            where.append(f'+{column} = ?')
+            params.append(value)
+        sql = (f"SELECT {', '.join(self.columns)} FROM {{{self.table}}} WHERE {' AND '.join(where)} "
+               f"ORDER BY id LIMIT ?")
+        # Each partition is read in rowid order and merged, so nothing is sorted in
+        # memory (migrate.py checks the plan)
+        return partitions.expand(conn, sql, self.since_ms, self.until_ms), params + [page]
+
+    def chunks(self):
+        """Lists of row tuples in id order, page by page on a dedicated connection"""
+        remaining = self.limit
+        with database.dedicated_read_connection() as conn:
+            conn.row_factory = None
+            while remaining is None or remaining > 0:
+                page = PAGE_ROWS if remaining is None else min(PAGE_ROWS, remaining)
+                sql, params = self.query(conn, self.last_id, page)
+                cursor = conn.execute(sql, params)
+                fetched = 0
+                while True:
+                    chunk = cursor.fetchmany(self.chunk_rows)
+                    if not chunk:
+                        break
+                    fetched += len(chunk)
+                    self.last_id = chunk[-1][0]
+                    yield chunk
+                if remaining is not None:
+                    remaining -= fetched
+                if fetched < page:
+                    break
+
+    def csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(self.columns)
+        for chunk in self.chunks():
+            writer.writerows(chunk)
+            self.rows += len(chunk)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    def schema(self):
+        import pyarrow
+        types = {'INTEGER': pyarrow.int64(), 'REAL': pyarrow.float64(), 'TEXT': pyarrow.string()}
+        fields = []
+        for column, kind in partitions.COLUMNS[self.table]:
+            kind = pyarrow.timestamp('ms', tz='UTC') if column == 'ts' else types[kind.split()[0]]
+            fields.append(pyarrow.field(column, kind))
+        return pyarrow.schema(fields)
+
+    def parquet(self):
+        import pyarrow
+        import pyarrow.parquet as parquet
+        schema = self.schema()
+        sink = _Sink()
+        writer = parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema, compression='zstd')
+        pending = []
+        pending_rows = 0
+
+        def row_group():
+            columns = list(zip(*(row for chunk in pending for row in chunk)))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema), row_group_size=PARQUET_ROW_GROUP)
+
+        try:
+            for chunk in self.chunks():
+                pending.append(chunk)
+                pending_rows += len(chunk)
+                self.rows += len(chunk)
+                if pending_rows >= PARQUET_ROW_GROUP:
+                    row_group()
+                    pending, pending_rows = [], 0
+                    yield sink.take()
+            if pending:
+                row_group()
+        finally:
+            writer.close()
+        yield sink.take()
+
+    def stream(self, slot=None):
+        """Response body: encoded chunks, with the export counted in stats()"""
+        started = time.perf_counter()
+        with _stats_lock:
+            _stats['exports'] += 1
+            _stats['active'] += 1
+        ok = False
+        try:
+            for block in (self.csv() if self.format == 'csv' else self.parquet()):
+                self.bytes += len(block)
+                yield block
+            ok = True
+        finally:
+            if slot is not None:
+                slot.release()
+            self.seconds = time.perf_counter() - started
+            summary = self.summary()
+            with _stats_lock:
+                _stats['active'] -= 1
+                _stats['completed' if ok else 'failed'] += 1
+                _stats['rows'] += self.rows
+                _stats['bytes'] += self.bytes
+                _stats['seconds'] += self.seconds
+                _stats['last'] = summary
+            print(f"📤 Exported {self.rows:,} {self.table} rows as {self.format} in {self.seconds:.1f}s "
+                  f"({summary['rows_per_second']:,.0f} rows/s){'' if ok else ' - interrupted'}")
+
+    def summary(self):
+        return {
+            'table': self.table,
+            'format': self.format,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'last_id': self.last_id,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+
+class _Sink:
+    """Write-only file that hands back what was written since the last take().
+
+    The Parquet writer records byte offsets via tell(), so it keeps
+    counting across takes.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def stats():
+    with _stats_lock:
+        s = dict(_stats)
+    s['rows_per_second'] = round(s['rows'] / s['seconds'], 1) if s['seconds'] else 0.0
+    s['max_concurrent'] = MAX_CONCURRENT
+    s['parquet'] = HAVE_PYARROW
+    return s
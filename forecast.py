@@ -0,0 +1,328 @@
+"""Per-location crowd density forecasts for the coming hours.
+
+Each location's model is an hour-of-day x day-of-week profile of density,
+an exponentially weighted mean (half-life HALF_LIFE_DAYS) of its hourly
+rollups, plus a level adjustment: how far the last LEVEL_HOURS ran above
+or below the profile, fading by LEVEL_DECAY per hour ahead.
+
+Fitting runs in a process pool so it never holds the GIL of a request
+thread. The weighting makes refreshes incremental: a refresh folds in only
+the hours completed since the last fit, decaying the held sums by the
+hours that passed and adding the new ones, which is the same model a full
+refit would give. Readings can arrive late, so the last LATE_HOURS
+completed hours are not folded yet: every refresh reads them afresh and
+adds them on top of the held sums. A background thread refreshes every REFRESH_SECONDS once the
+readings have moved (or a new hour has begun) and precomputes MAX_HOURS
+of predictions for every location, so /api/forecast is a lookup. Under
+serve.py all of this runs once, in the writer process, and workers read
+the forecasts from it (see ingest_server.py).
+CROWD_FORECAST_REFRESH_SECONDS=0 turns the service off.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import database
+import partitions
+
+REFRESH_SECONDS = float(os.environ.get('CROWD_FORECAST_REFRESH_SECONDS', 60))
+HALF_LIFE_DAYS = 28
+LEVEL_HOURS = 3
+LEVEL_DECAY = 0.85
+SHRINKAGE = 3.0
+LATE_HOURS = 24
+MAX_HOURS = 72
+POOL_WORKERS = 1
+
+HOUR_FORMAT = '%Y-%m-%d %H'
+
+# Completed hours after the last fit, with their age in hours at `until`
+# and SQLite's day of week (0 = Sunday)
+HOURS_SQL = '''
+    SELECT location,
+           CAST(strftime('%w', substr(bucket, 1, 10)) AS INTEGER) AS dow,
+           CAST(substr(bucket, 12, 2) AS INTEGER) AS hour,
+           (julianday(?) - julianday(bucket || ':00')) * 24 AS age,
+           readings, total
+    FROM crowd_rollup
+    WHERE grain = 'hour' AND bucket > ? AND bucket <= ?
+'''
+
+RECENT_SQL = '''
+    SELECT location,
+           CAST(strftime('%w', substr(bucket, 1, 10)) AS INTEGER) AS dow,
+           CAST(substr(bucket, 12, 2) AS INTEGER) AS hour,
+           readings, total
+    FROM crowd_rollup
+    WHERE grain = 'hour' AND bucket >= ?
+'''
+
+
+def fit_hours(path, after, settled, until, recent_since):
+    """Pool job: weighted profile sums for the hours in (after, settled] and (settled, until], plus the recent hours.
+
+    Returns (settled part, late part, recent). Each part is (locations,
+    sums, weights) where sums and weights are (locations, 7, 24) arrays of
+    density totals and readings, decayed to the end of the part's range.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        folded = conn.execute(HOURS_SQL, (settled + ':00', after or '', settled)).fetchall() \
+            if after is None or settled > after else []
+        late = conn.execute(HOURS_SQL, (until + ':00', settled, until)).fetchall()
+        recent = conn.execute(RECENT_SQL, (recent_since,)).fetchall()
+    finally:
+        conn.close()
+    return _weighted(folded), _weighted(late), recent
+
+
+def _weighted(rows):
+    import numpy as np
+    names = sorted({row[0] for row in rows})
+    positions = {name: i for i, name in enumerate(names)}
+    sums = np.zeros((len(names), 7, 24))
+    weights = np.zeros((len(names), 7, 24))
+    if rows:
+        location, dow, hour, age, readings, total = zip(*rows)
+        index = (np.array([positions[name] for name in location]), np.array(dow), np.array(hour))
+        decay = 0.5 ** (np.array(age) / (HALF_LIFE_DAYS * 24))
+        np.add.at(sums, index, decay * np.array(total))
+        np.add.at(weights, index, decay * np.array(readings))
+    return names, sums, weights
+
+
+def _exit_with(parent):
+    """Pool initializer: leave once the API process is gone, even if it was killed outright"""
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(1)
+        os._exit(0)
+
+    threading.Thread(target=watch, name='parent-watch', daemon=True).start()
+
+
+class Forecaster:
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, max_hours=MAX_HOURS):
+        self.refresh_seconds = refresh_seconds
+        self.max_hours = max_hours
+        self._lock = threading.Lock()
+        self._pool = None
+        self.names = []
+        self.positions = {}
+        self.sums = None
+        self.weights = None
+        # Last hour folded into the held sums ('YYYY-MM-DD HH'), and the last
+        # hour counted, late hours included
+        self.fitted_until = None
+        self.observed_until = None
+        # (start hour, {location: predictions}) from the last refresh
+        self.forecasts = None
+        self._seen = None
+        self._stats = {'fits': 0, 'full_fits': 0, 'fit_seconds': None, 'fit_seconds_total': 0.0,
+                       'predict_ms': None, 'hours_folded': 0, 'last_error': None}
+
+    @property
+    def enabled(self):
+        return self.refresh_seconds > 0
+
+    @property
+    def ready(self):
+        return self.forecasts is not None
+
+    def _executor(self):
+        if self._pool is None:
+            # Spawned, not forked: the API process has request threads running
+            self._pool = ProcessPoolExecutor(POOL_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_exit_with, initargs=(os.getpid(),))
+        return self._pool
+
+    # Fitting
+    def _register(self, names):
+        """Give locations not seen before a row of the held sums"""
+        import numpy as np
+        if self.sums is None:
+            self.sums = np.zeros((0, 7, 24))
+            self.weights = np.zeros((0, 7, 24))
+        new = [name for name in names if name not in self.positions]
+        if new:
+            for name in new:
+                self.positions[name] = len(self.names)
+                self.names.append(name)
+            self.sums = np.concatenate([self.sums, np.zeros((len(new), 7, 24))])
+            self.weights = np.concatenate([self.weights, np.zeros((len(new), 7, 24))])
+
+    def _decay(self, until):
+        """Decay factor from fitted_until to `until`, and the hours between"""
+        if self.fitted_until is None:
+            return 1.0, 0
+        passed = (datetime.strptime(until, HOUR_FORMAT)
+                  - datetime.strptime(self.fitted_until, HOUR_FORMAT)) / timedelta(hours=1)
+        return 0.5 ** (passed / (HALF_LIFE_DAYS * 24)), int(passed)
+
+    def _fold(self, names, sums, weights, until):
+        """Decay the held sums to `until` and add a fitted increment"""
+        self._register(names)
+        decay, passed = self._decay(until)
+        self.sums *= decay
+        self.weights *= decay
+        self._stats['hours_folded'] += passed
+        if names:
+            index = [self.positions[name] for name in names]
+            self.sums[index] += sums
+            self.weights[index] += weights
+        self.fitted_until = until
+
+    def _with_late(self, names, sums, weights, until):
+        """The held sums decayed to `until` plus the late hours, without folding them"""
+        self._register(names)
+        decay, _ = self._decay(until)
+        total_sums, total_weights = self.sums * decay, self.weights * decay
+        if names:
+            index = [self.positions[name] for name in names]
+            total_sums[index] += sums
+            total_weights[index] += weights
+        return total_sums, total_weights
+
+    def profiles(self, sums=None, weights=None):
+        """(locations, 7, 24) expected density from the given sums (the held ones by default).
+
+        Each day-of-week cell is shrunk towards the location's hour-of-day
+        mean with a prior worth SHRINKAGE average cells of readings, so a
+        weekday with few weeks of history doesn't chase its noise; hours
+        with no history at all take the location's overall mean.
+        """
+        import numpy as np
+        sums = self.sums if sums is None else sums
+        weights = self.weights if weights is None else weights
+        with np.errstate(invalid='ignore', divide='ignore'):
+            by_hour = sums.sum(axis=1) / weights.sum(axis=1)
+            overall = sums.sum(axis=(1, 2)) / weights.sum(axis=(1, 2))
+        by_hour = np.where(np.isnan(by_hour), np.nan_to_num(overall)[:, None], by_hour)
+        prior = SHRINKAGE * weights.mean(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            profile = (sums + prior * by_hour[:, None, :]) / (weights + prior)
+        return np.where(np.isnan(profile), by_hour[:, None, :], profile)
+
+    def refresh(self, now=None):
+        """Fold in the hours that can no longer gain readings, re-read the late ones and recompute every forecast"""
+        import numpy as np
+        now = now or datetime.now()
+        current = now.replace(minute=0, second=0, microsecond=0)
+        until = (current - timedelta(hours=1)).strftime(HOUR_FORMAT)
+        settled = (current - timedelta(hours=1 + LATE_HOURS)).strftime(HOUR_FORMAT)
+        recent_since = (current - timedelta(hours=LEVEL_HOURS)).strftime(HOUR_FORMAT)
+        started = time.perf_counter()
+        after = self.fitted_until
+        folded, late, recent = self._executor().submit(
+            fit_hours, database.DB_PATH, after, settled, until, recent_since).result()
+        fit_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with self._lock:
+            if after is None or settled > after:
+                self._fold(*folded, settled)
+            profiles = self.profiles(*self._with_late(*late, until))
+            self.observed_until = until
+            # Level: recent readings against what the profile expected, per reading
+            level_sums = np.zeros(len(self.names))
+            level_readings = np.zeros(len(self.names))
+            for location, dow, hour, readings, total in recent:
+                position = self.positions.get(location)
+                if position is not None:
+                    level_sums[position] += total - readings * profiles[position, dow, hour]
+                    level_readings[position] += readings
+            level = np.divide(level_sums, level_readings, out=np.zeros_like(level_sums), where=level_readings > 0)
+            hours = [current + timedelta(hours=h) for h in range(1, self.max_hours + 1)]
+            dows = np.array([int(hour.strftime('%w')) for hour in hours])
+            hods = np.array([hour.hour for hour in hours])
+            fade = LEVEL_DECAY ** np.arange(1, self.max_hours + 1)
+            predicted = np.clip(profiles[:, dows, hods] + level[:, None] * fade[None, :], 0, 1)
+            labels = [hour.strftime('%Y-%m-%d %H:00') for hour in hours]
+            self.forecasts = {
+                'generated': now.isoformat(),
+                'hours': labels,
+                'locations': {name: (round(float(level[i]) * 100, 1), [round(float(v) * 100, 1) for v in predicted[i]])
+                              for i, name in enumerate(self.names)},
+            }
+            self._stats['fits'] += 1
+            self._stats['full_fits'] += after is None
+            self._stats['fit_seconds'] = round(fit_seconds, 4)
+            self._stats['fit_seconds_total'] = round(self._stats['fit_seconds_total'] + fit_seconds, 4)
+            self._stats['predict_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _state(self):
+        """What a refresh depends on: the readings committed and the current hour"""
+        with database.read_connection() as conn:
+            ids = partitions.last_ids(conn)
+        return tuple(sorted(ids.items())), datetime.now().strftime(HOUR_FORMAT)
+
+    # Serving
+    def forecast(self, location, hours):
+        """Precomputed predictions for the next `hours` hours at one location"""
+        if not 1 <= hours <= self.max_hours:
+            raise ValueError(f"hours must be between 1 and {self.max_hours}")
+        forecasts = self.forecasts
+        if forecasts is None:
+            return None
+        entry = forecasts['locations'].get(location)
+        if entry is None:
+            raise KeyError(location)
+        level, values = entry
+        return {
+            'location': location,
+            'generated': forecasts['generated'],
+            'fitted_until': self.observed_until,
+            'level': level,
+            'forecast': [{'time': label, 'density': value}
+                         for label, value in zip(forecasts['hours'][:hours], values[:hours])],
+        }
+
+    def locations(self):
+        forecasts = self.forecasts
+        return sorted(forecasts['locations']) if forecasts else []
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, enabled=self.enabled, ready=self.ready, locations=len(self.names),
+                        fitted_until=self.observed_until, folded_until=self.fitted_until,
+                        refresh_seconds=self.refresh_seconds)
+
+    def start(self):
+        """Background thread: fit, then refresh whenever readings or the hour move"""
+        def maintain():
+            while True:
+                try:
+                    state = self._state()
+                    if state != self._seen:
+                        self.refresh()
+                        self._seen = state
+                        if self._stats['fits'] == 1:
+                            print(f"📈 Forecasts ready for {len(self.names)} locations "
+                                  f"(fit in {self._stats['fit_seconds']}s)")
+                except Exception as e:
+                    self._stats['last_error'] = str(e)
+                    print(f"❌ Forecast refresh failed: {e}")
+                time.sleep(self.refresh_seconds)
+
+        thread = threading.Thread(target=maintain, name='forecast', daemon=True)
+        thread.start()
+        return thread
+
+
+forecaster = Forecaster()
+
+
+def start():
+    """Fit the models in the background and keep them fresh; a no-op when disabled"""
+    if not forecaster.enabled:
+        return None
+    return forecaster.start()
+
+
+def stats():
+    return forecaster.stats()
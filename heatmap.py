@@ -0,0 +1,256 @@
+"""Grid heatmap of recent crowd density for map viewports.
+
+/api/heatmap?bbox=west,south,east,north&zoom=z&minutes=m averages the last
+`minutes` of crowd density into square grid cells, CELLS_PER_TILE across a
+256 px map tile at zoom z (so a cell is ~16 px on screen at every zoom).
+
+Readings come from the per-location minute rollups (see rollups.py), not
+the raw partitions. Each minute bucket is read once and kept; only the
+OPEN_BUCKETS newest ones, which can still gain readings, are re-read, and
+only when the ingestion watermark has moved. Window totals per sensor
+and cells per zoom are cached on top of the buckets, so a pan or zoom at
+an unchanged watermark costs an R-tree lookup of the sensors in view (see
+sensors.py) plus a dict lookup per cell.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import rollups
+import sensors
+
+CELLS_PER_TILE = 16
+MAX_ZOOM = 22
+MAX_MINUTES = 1440
+OPEN_BUCKETS = 2
+MAX_ENTRIES = 64
+
+MINUTE_MS = 60_000
+
+BUCKETS_SQL = '''
+    SELECT bucket, location, readings, total, maximum, anomalies
+    FROM crowd_rollup
+    WHERE grain = 'minute' AND bucket BETWEEN ? AND ?
+'''
+
+
+def cell_size(zoom):
+    """Cell edge in degrees at a zoom level"""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def cell_of(lat, lng, size):
+    return int((lng + 180) // size), int((lat + 90) // size)
+
+
+class Bucket:
+    """One minute of rollups: location indexes plus readings/total/anomalies/maximum rows"""
+    __slots__ = ('watermark', 'index', 'values')
+
+    def __init__(self, watermark, index, values):
+        # None once the minute is past OPEN_BUCKETS and can't change
+        self.watermark = watermark
+        self.index = index
+        self.values = values
+
+
+class Heatmap:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = []
+        self._positions = {}
+        self._buckets = {}
+        # minutes -> (newest bucket, totals of the buckets no longer open)
+        self._settled = OrderedDict()
+        # minutes -> ((newest bucket, watermark), totals)
+        self._windows = OrderedDict()
+        # (zoom, minutes) -> (window state, registry version, cells)
+        self._cells = OrderedDict()
+        # (registry version, {name: (lat, lng)})
+        self._registry = (None, {})
+        self._stats = {'requests': 0, 'cell_hits': 0, 'cell_builds': 0, 'window_builds': 0,
+                       'bucket_reads': 0, 'rollup_rows': 0}
+
+    def _position(self, name):
+        position = self._positions.get(name)
+        if position is None:
+            position = self._positions[name] = len(self._names)
+            self._names.append(name)
+        return position
+
+    # Minute buckets
+    def _refresh(self, conn, starts, newest, watermark):
+        """Read the buckets (epoch-ms minute starts) that are missing or still open and stale"""
+        import numpy as np
+        stale = []
+        for start in starts:
+            bucket = self._buckets.get(start)
+            is_open = start > newest - OPEN_BUCKETS * MINUTE_MS
+            if bucket is None or (bucket.watermark is not None and not (is_open and bucket.watermark == watermark)):
+                stale.append(start)
+        if not stale:
+            return
+        labels = {rollups.bucket_of(start, 'minute'): start for start in range(min(stale), max(stale) + 1, MINUTE_MS)}
+        rows = {start: [] for start in labels.values()}
+        for label, location, readings, total, maximum, anomalies in conn.execute(
+                BUCKETS_SQL, (min(labels), max(labels))):
+            if label in labels:
+                rows[labels[label]].append((self._position(location), readings, total, anomalies, maximum))
+        for start, bucket_rows in rows.items():
+            is_open = start > newest - OPEN_BUCKETS * MINUTE_MS
+            values = np.array([row[1:] for row in bucket_rows], dtype=np.float64).reshape(-1, 4).T
+            index = np.array([row[0] for row in bucket_rows], dtype=np.int64)
+            self._buckets[start] = Bucket(watermark if is_open else None, index, values)
+            self._stats['rollup_rows'] += len(bucket_rows)
+        self._stats['bucket_reads'] += len(rows)
+        # Nothing reaches back further than MAX_MINUTES
+        oldest = newest - MAX_MINUTES * MINUTE_MS
+        for start in [start for start in self._buckets if start <= oldest]:
+            del self._buckets[start]
+
+    def _accumulate(self, starts, size):
+        """readings, total, anomalies and maximum per location position over some buckets"""
+        import numpy as np
+        buckets = [self._buckets[start] for start in starts]
+        index = np.concatenate([b.index for b in buckets]) if buckets else np.empty(0, np.int64)
+        values = np.concatenate([b.values for b in buckets], axis=1) if buckets else np.empty((4, 0))
+        totals = np.zeros((4, size))
+        for row in range(3):
+            totals[row] = np.bincount(index, weights=values[row], minlength=size)
+        totals[3] = -np.inf
+        np.maximum.at(totals[3], index, values[3])
+        return totals
+
+    @staticmethod
+    def _combine(a, b):
+        import numpy as np
+        size = max(a.shape[1], b.shape[1])
+        a, b = (np.pad(t, ((0, 0), (0, size - t.shape[1])), constant_values=0) for t in (a, b))
+        combined = a + b
+        combined[3] = np.maximum(a[3], b[3])
+        return combined
+
+    def _window(self, conn, minutes, now_ms, watermark):
+        """Totals per location position over the last `minutes` buckets, and the state they were built at"""
+        newest = now_ms // MINUTE_MS * MINUTE_MS
+        state = (newest, watermark)
+        cached = self._windows.get(minutes)
+        if cached is not None and cached[0] == state:
+            self._windows.move_to_end(minutes)
+            return state, cached[1]
+        starts = [newest - i * MINUTE_MS for i in range(minutes)]
+        self._refresh(conn, starts, newest, watermark)
+        open_starts, settled_starts = starts[:OPEN_BUCKETS], starts[OPEN_BUCKETS:]
+        settled = self._settled.get(minutes)
+        if settled is None or settled[0] != newest:
+            settled = self._settled[minutes] = (newest, self._accumulate(settled_starts, len(self._names)))
+            _trim(self._settled)
+        totals = self._combine(settled[1], self._accumulate(open_starts, len(self._names)))
+        self._windows[minutes] = (state, totals)
+        _trim(self._windows)
+        self._stats['window_builds'] += 1
+        return state, totals
+
+    # Cells
+    def _sensors(self, conn):
+        version = sensors.version(conn)
+        if self._registry[0] != version:
+            self._registry = (version, {name: (lat, lng) for _, name, lat, lng in sensors.all_sensors(conn)})
+        return self._registry
+
+    def cells(self, conn, zoom, minutes, watermark, now_ms=None):
+        """{(x, y): [readings, total, anomalies, maximum, sensors]} for every cell holding a sensor"""
+        now_ms = now_ms or int(time.time() * 1000)
+        version, registry = self._sensors(conn)
+        state, totals = self._window(conn, minutes, now_ms, watermark)
+        key = (zoom, minutes)
+        cached = self._cells.get(key)
+        if cached is not None and cached[0] == state and cached[1] == version:
+            self._cells.move_to_end(key)
+            self._stats['cell_hits'] += 1
+            return cached[2]
+        size = cell_size(zoom)
+        cells = {}
+        for name, (lat, lng) in registry.items():
+            cell = cells.get(cell_of(lat, lng, size))
+            if cell is None:
+                cell = cells[cell_of(lat, lng, size)] = [0, 0.0, 0, -math.inf, 0]
+            cell[4] += 1
+            position = self._positions.get(name)
+            if position is None or position >= totals.shape[1] or not totals[0, position]:
+                continue
+            cell[0] += int(totals[0, position])
+            cell[1] += float(totals[1, position])
+            cell[2] += int(totals[2, position])
+            cell[3] = max(cell[3], float(totals[3, position]))
+        self._cells[key] = (state, version, cells)
+        _trim(self._cells)
+        self._stats['cell_builds'] += 1
+        return cells
+
+    def view(self, conn, bbox, zoom, minutes, watermark, now_ms=None):
+        """The cells overlapping bbox (west, south, east, north) with their average and peak density"""
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+        if not 1 <= minutes <= MAX_MINUTES:
+            raise ValueError(f"minutes must be between 1 and {MAX_MINUTES}")
+        size = cell_size(zoom)
+        with self._lock:
+            self._stats['requests'] += 1
+            cells = self.cells(conn, zoom, minutes, watermark, now_ms)
+        # Widen the box to whole cells so edge cells count every sensor in them
+        west, south, east, north = bbox
+        x0, y0 = cell_of(south, west, size)
+        x1, y1 = cell_of(north, east, size)
+        snapped = (max(-180.0, x0 * size - 180), max(-90.0, y0 * size - 90),
+                   min(180.0, (x1 + 1) * size - 180), min(90.0, (y1 + 1) * size - 90))
+        keys = {cell_of(lat, lng, size) for _, _, lat, lng in sensors.within(conn, snapped)}
+        result = []
+        for x, y in sorted(keys, key=lambda key: (key[1], key[0])):
+            readings, total, anomalies, maximum, count = cells.get((x, y), (0, 0.0, 0, -math.inf, 0))
+            west_edge, south_edge = x * size - 180, y * size - 90
+            result.append({
+                'bounds': [round(west_edge, 6), round(south_edge, 6), round(west_edge + size, 6),
+                           round(south_edge + size, 6)],
+                'lat': round(south_edge + size / 2, 6),
+                'lng': round(west_edge + size / 2, 6),
+                'density': round(total / readings * 100, 1) if readings else None,
+                'max_density': round(maximum * 100, 1) if readings else None,
+                'readings': readings,
+                'anomalies': anomalies,
+                'sensors': count,
+            })
+        return {
+            'bbox': list(bbox),
+            'zoom': zoom,
+            'minutes': minutes,
+            'cell_size': size,
+            'cells': result,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._settled.clear()
+            self._windows.clear()
+            self._cells.clear()
+            self._registry = (None, {})
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, buckets=len(self._buckets), cached_cells=len(self._cells),
+                        locations=len(self._names))
+
+
+def _trim(entries):
+    while len(entries) > MAX_ENTRIES:
+        entries.popitem(last=False)
+
+
+heatmap = Heatmap()
+
+
+def stats():
+    return heatmap.stats()
@@ -0,0 +1,407 @@
+"""In-memory hot tier for the most recent readings.
+
+Dashboard reads (/api/live-graph, /api/dashboard) almost always cover the
+last minutes or hours. The hot store keeps the last CROWD_HOT_STORE_HOURS
+(default 25, so a 24-hour graph aligned to its step still fits; 0 turns it
+off) of every reading table as NumPy columns:
+int64 ts, float32 values, int8 flags and int32 codes for text columns
+(location, vehicle_type, route, ...) from dictionaries shared across
+tables. Range and aggregate queries are a vectorized mask over those
+columns plus np.bincount, with no sqlite3.Row or dict per reading.
+
+It is fed like the sliding window: an ingest listener for rows committed
+in this process and a follower that tails other writers by id. Rows older
+than the window are evicted every EVICT_SECONDS. covers(since_ms) says
+whether a range starts inside what is held; callers run anything reaching
+further back against SQLite (see timeseries.bucketed()). The store loads
+in the background, so queries fall through to SQLite until it is ready.
+"""
+
+import os
+import threading
+import time
+
+import database
+import ingest
+import partitions
+
+TABLES = ingest.TABLES
+HOURS = float(os.environ.get('CROWD_HOT_STORE_HOURS', 25))
+EVICT_SECONDS = 60
+INITIAL_CAPACITY = 4096
+LOAD_CHUNK_ROWS = 50000
+
+AGGREGATES = ('count', 'sum', 'avg', 'min', 'max')
+
+TAIL_SQL = 'SELECT * FROM {{{table}}} WHERE id > ? ORDER BY id'
+
+# Held columns per table: ts, then the rest (not id) by storage kind
+KINDS = {'REAL': 'value', 'TEXT': 'code', 'INTEGER': 'flag'}
+DTYPES = {'ts': 'int64', 'value': 'float32', 'code': 'int32', 'flag': 'int8'}
+LAYOUT = {
+    table: {column: 'ts' if column == 'ts' else KINDS[kind.split()[0]]
+            for column, kind in partitions.COLUMNS[table] if column != 'id'}
+    for table in TABLES
+}
+
+
+class Dictionary:
+    """Text value <-> int32 code; one per column name, shared by every table"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, values):
+        codes = self.codes
+        out = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self.values)
+                self.values.append(value)
+            out.append(code)
+        return out
+
+    def code(self, value):
+        """The value's code, or -1 (matches nothing) if it was never seen"""
+        return self.codes.get(value, -1)
+
+    def decode(self, codes):
+        import numpy as np
+        return np.array(self.values, dtype=object)[codes] if len(codes) else np.array([], dtype=object)
+
+
+class HotTable:
+    """Append-only columns for one reading table.
+
+    Appends write past `size` into the current arrays; growth and eviction
+    build new ones. A reader holding (size, arrays) from view() therefore
+    never sees them change underneath it.
+    """
+
+    def __init__(self, table, dictionaries, capacity=INITIAL_CAPACITY):
+        import numpy as np
+        self.table = table
+        self.layout = LAYOUT[table]
+        self.dictionaries = dictionaries
+        self.size = 0
+        self.arrays = {column: np.empty(capacity, DTYPES[kind]) for column, kind in self.layout.items()}
+
+    @property
+    def capacity(self):
+        return len(self.arrays['ts'])
+
+    def view(self):
+        return self.size, self.arrays
+
+    def append(self, columns, count):
+        """Add `count` rows given as {column: sequence of values}"""
+        import numpy as np
+        if not count:
+            return
+        size = self.size
+        if size + count > self.capacity:
+            capacity = max(2 * self.capacity, size + count)
+            grown = {}
+            for column, array in self.arrays.items():
+                grown[column] = np.empty(capacity, array.dtype)
+                grown[column][:size] = array[:size]
+            self.arrays = grown
+        for column, kind in self.layout.items():
+            values = columns[column]
+            if kind == 'code':
+                values = self.dictionaries[column].encode(values)
+            elif kind == 'flag':
+                values = [1 if value else 0 for value in values]
+            self.arrays[column][size:size + count] = values
+        self.size = size + count
+
+    def evict(self, cutoff_ms):
+        """Drop rows with ts < cutoff_ms; returns how many went"""
+        import numpy as np
+        keep = self.arrays['ts'][:self.size] >= cutoff_ms
+        kept = int(keep.sum())
+        dropped = self.size - kept
+        if dropped:
+            capacity = max(INITIAL_CAPACITY, 2 * kept)
+            arrays = {}
+            for column, array in self.arrays.items():
+                arrays[column] = np.empty(capacity, array.dtype)
+                arrays[column][:kept] = array[:self.size][keep]
+            self.arrays = arrays
+            self.size = kept
+        return dropped
+
+    def nbytes(self):
+        """(bytes in use, bytes allocated)"""
+        per_row = sum(array.itemsize for array in self.arrays.values())
+        return self.size * per_row, self.capacity * per_row
+
+
+class HotStore:
+    def __init__(self, hours=HOURS):
+        self.hours = hours
+        self._lock = threading.Lock()
+        self.tables = {}
+        self.dictionaries = {}
+        self.last_ids = dict.fromkeys(TABLES, 0)
+        # Every row with ts >= since_ms (and id <= last_ids) is held
+        self.since_ms = None
+        self.ready = False
+        self._evicted_at = 0.0
+        self._stats = {'loads': 0, 'load_seconds': 0.0, 'appended': 0, 'evicted': 0, 'late_rows': 0,
+                       'hot_queries': 0, 'fallthroughs': 0, 'last_error': None}
+
+    @property
+    def enabled(self):
+        return self.hours > 0
+
+    def _dictionary(self, column):
+        if column not in self.dictionaries:
+            self.dictionaries[column] = Dictionary()
+        return self.dictionaries[column]
+
+    # Loading and feeding
+    def rebuild(self):
+        """Load the last `hours` of readings from the database"""
+        started = time.perf_counter()
+        since_ms = int((time.time() - self.hours * 3600) * 1000)
+        dictionaries = {}
+        tables = {}
+        with self._lock:
+            self.ready = False
+        with database.dedicated_read_connection() as conn:
+            conn.row_factory = None
+            conn.execute('BEGIN')
+            try:
+                tails = partitions.last_ids(conn)
+                for table in TABLES:
+                    for column, kind in LAYOUT[table].items():
+                        if kind == 'code':
+                            dictionaries.setdefault(column, Dictionary())
+                    hot = tables[table] = HotTable(table, dictionaries)
+                    columns = list(LAYOUT[table])
+                    sql = f"SELECT {', '.join(columns)} FROM {{{table}}} WHERE ts >= ?"
+                    cursor = conn.execute(partitions.expand(conn, sql, since_ms), (since_ms,))
+                    while True:
+                        chunk = cursor.fetchmany(LOAD_CHUNK_ROWS)
+                        if not chunk:
+                            break
+                        hot.append(dict(zip(columns, zip(*chunk))), len(chunk))
+            finally:
+                conn.rollback()
+        with self._lock:
+            self.tables = tables
+            self.dictionaries = dictionaries
+            self.last_ids = dict.fromkeys(TABLES, 0)
+            self.last_ids.update(tails)
+            self.since_ms = since_ms
+            self._evicted_at = time.monotonic()
+            self._stats['loads'] += 1
+            self._stats['load_seconds'] = round(time.perf_counter() - started, 3)
+            self.ready = True
+
+    def add(self, crowd=(), mobility=(), carbon=()):
+        """Append committed rows; ones already held (by id) or older than the window are skipped"""
+        with self._lock:
+            if not self.ready:
+                # rebuild() reads past whatever is committed meanwhile
+                return
+            for table, rows in zip(TABLES, (crowd, mobility, carbon)):
+                if not rows:
+                    continue
+                last_id = self.last_ids[table]
+                fresh = [row for row in rows if row['id'] > last_id]
+                if not fresh:
+                    continue
+                self.last_ids[table] = max(row['id'] for row in fresh)
+                held = [row for row in fresh if row['ts'] >= self.since_ms]
+                self._stats['late_rows'] += len(fresh) - len(held)
+                self.tables[table].append({column: [row[column] for row in held] for column in LAYOUT[table]},
+                                          len(held))
+                self._stats['appended'] += len(held)
+        self.evict()
+
+    def on_ingest(self, crowd, mobility, carbon):
+        # Ingest listener
+        self.add(crowd, mobility, carbon)
+
+    def sync(self):
+        """Pull rows other processes wrote since the last seen ids"""
+        with database.read_connection() as conn:
+            last_ids = dict(self.last_ids)
+            batches = [conn.execute(partitions.expand(conn, TAIL_SQL.format(table=table)),
+                                    (last_ids[table],)).fetchall() for table in TABLES]
+        if any(batches):
+            self.add(*batches)
+        else:
+            self.evict()
+
+    def behind(self, last_ids):
+        """Whether the database (last id per table, in TABLES order) has rows not held yet"""
+        return any(last_id > self.last_ids[table] for table, last_id in zip(TABLES, last_ids))
+
+    def evict(self, force=False):
+        """Drop rows that have aged out of the window (at most every EVICT_SECONDS)"""
+        now = time.monotonic()
+        if not self.ready or (not force and now - self._evicted_at < EVICT_SECONDS):
+            return
+        with self._lock:
+            self._evicted_at = now
+            cutoff_ms = int((time.time() - self.hours * 3600) * 1000)
+            for hot in self.tables.values():
+                self._stats['evicted'] += hot.evict(cutoff_ms)
+            self.since_ms = max(self.since_ms, cutoff_ms)
+
+    # Queries
+    def covers(self, since_ms):
+        """Whether every reading from since_ms on is held; counts hot queries and fall-throughs"""
+        hit = self.ready and since_ms >= self.since_ms
+        self._stats['hot_queries' if hit else 'fallthroughs'] += 1
+        return hit
+
+    def _mask(self, table, since_ms, until_ms, filters):
+        with self._lock:
+            size, arrays = self.tables[table].view()
+            codes = {column: self.dictionaries[column].code(value) for column, value in (filters or {}).items()}
+        ts = arrays['ts'][:size]
+        mask = ts >= since_ms
+        if until_ms is not None:
+            mask &= ts <= until_ms
+        for column, code in codes.items():
+            mask &= arrays[column][:size] == code
+        return size, arrays, mask
+
+    def select(self, table, columns, since_ms, until_ms=None, filters=None, decode=True):
+        """{column: array} for rows with since_ms <= ts <= until_ms matching `filters`, ts included"""
+        for column in tuple(columns) + tuple(filters or ()):
+            if column not in LAYOUT[table]:
+                raise ValueError(f"{table} has no column {column}")
+        size, arrays, mask = self._mask(table, since_ms, until_ms, filters)
+        result = {}
+        for column in dict.fromkeys(('ts',) + tuple(columns)):
+            values = arrays[column][:size][mask]
+            if decode and LAYOUT[table][column] == 'code':
+                values = self.dictionaries[column].decode(values)
+            result[column] = values
+        return result
+
+    def select_coded(self, table, columns, since_ms, until_ms=None):
+        """select() without decoding, plus {column: values} to decode each coded column with"""
+        data = self.select(table, columns, since_ms, until_ms, decode=False)
+        # Read after the select: dictionaries only grow, so every code in data is covered
+        with self._lock:
+            values = {column: list(self.dictionaries[column].values)
+                      for column in columns if LAYOUT[table][column] == 'code'}
+        return data, values
+
+    def aggregate(self, table, column, since_ms, until_ms=None, filters=None, fn='avg', by=None):
+        """One aggregate of `column` over a range, or {value of `by`: aggregate}; avg/min/max of nothing is None"""
+        import numpy as np
+        if fn not in AGGREGATES:
+            raise ValueError(f"aggregate must be one of {', '.join(AGGREGATES)}")
+        data = self.select(table, (column,) + ((by,) if by else ()), since_ms, until_ms, filters, decode=False)
+        values = data[column].astype(np.float64)
+        if by is None:
+            return _reduce(values, fn)
+        codes = data[by]
+        names = self.dictionaries[by].values
+        return {names[code]: _reduce(values[codes == code], fn) for code in np.unique(codes)}
+
+    def bucketed(self, grid, spec, filters=None):
+        """timeseries.bucketed() from memory: the series on the grid, empty buckets NaN"""
+        import numpy as np
+        start_ms = grid.start_s * 1000
+        data = self.select(spec['table'], (spec['column'],), start_ms, grid.end_ms, filters, decode=False)
+        idx = (data['ts'] - start_ms) // (grid.step * 1000)
+        keep = idx < grid.size
+        idx = idx[keep]
+        counts = np.bincount(idx, minlength=grid.size)
+        sums = np.bincount(idx, weights=data[spec['column']][keep], minlength=grid.size)
+        values = np.full(grid.size, np.nan)
+        filled = counts > 0
+        values[filled] = sums[filled] / counts[filled] if spec['aggregate'] == 'AVG' else sums[filled]
+        return values
+
+    def stats(self):
+        """Rows and memory per table, plus bytes per million readings"""
+        with self._lock:
+            tables = dict(self.tables)
+            stats = dict(self._stats)
+            since_ms = self.since_ms
+            dictionary_entries = sum(len(d.values) for d in self.dictionaries.values())
+        per_table = {}
+        rows = used = allocated = 0
+        for table, hot in tables.items():
+            in_use, total = hot.nbytes()
+            per_table[table] = {
+                'rows': hot.size,
+                'capacity': hot.capacity,
+                'bytes': in_use,
+                'bytes_per_million_rows': round(in_use / hot.size * 1e6) if hot.size else None,
+            }
+            rows += hot.size
+            used += in_use
+            allocated += total
+        stats.update({
+            'enabled': self.enabled,
+            'ready': self.ready,
+            'hours': self.hours,
+            'since': since_ms,
+            'rows': rows,
+            'bytes': used,
+            'bytes_allocated': allocated,
+            'bytes_per_million_rows': round(used / rows * 1e6) if rows else None,
+            'dictionary_entries': dictionary_entries,
+            'tables': per_table,
+        })
+        return stats
+
+    def start_follower(self, interval=1.0):
+        """Background thread: load the store, then tail other writers and evict"""
+        def follow():
+            while not self.ready:
+                try:
+                    self.rebuild()
+                except Exception as e:
+                    self._stats['last_error'] = str(e)
+                    print(f"❌ Hot store load failed: {e}")
+                    time.sleep(10 * interval)
+            print(f"🔥 Hot store holds {self.stats()['rows']:,} readings from the last {self.hours:g}h")
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sync()
+                except Exception as e:
+                    self._stats['last_error'] = str(e)
+                    print(f"❌ Hot store sync failed: {e}")
+
+        thread = threading.Thread(target=follow, name='hot-store', daemon=True)
+        thread.start()
+        return thread
+
+
+def _reduce(values, fn):
+    if fn == 'count':
+        return int(values.size)
+    if fn == 'sum':
+        return float(values.sum())
+    if not values.size:
+        return None
+    return float({'avg': values.mean, 'min': values.min, 'max': values.max}[fn]())
+
+
+hot_store = HotStore()
+
+
+def start():
+    """Load the hot store in the background and keep it fed; a no-op when disabled"""
+    if not hot_store.enabled:
+        return None
+    ingest.subscribe(hot_store.on_ingest)
+    return hot_store.start_follower()
+
+
+def stats():
+    return hot_store.stats()
@@ -0,0 +1,239 @@
+"""Single write path for sensor readings.
+
+Readings are plain dicts keyed by column name. Everything that adds rows
+(the realtime updater, the /api/ingest route) goes through write_readings()
+so the rollups, location state and alerts stay in step with the raw tables. Records arriving from
+outside are checked with validate() against SCHEMAS first. After a batch commits, the
+registered listeners get the same dicts (now carrying their row ids), which
+is how in-memory views like the sliding window stay current.
+"""
+
+import json
+import math
+import time
+from datetime import datetime
+
+import alerts
+import database
+import locations
+import partitions
+import retention
+import rollups
+
+TABLES = ('crowd_data', 'mobility_data', 'carbon_data')
+
+# Record "type" values accepted by the ingest API
+RECORD_TYPES = {
+    'crowd': 'crowd_data',
+    'mobility': 'mobility_data',
+    'carbon': 'carbon_data',
+}
+
+# Column -> (kind, default) mirroring the table definitions in partitions.py;
+# REQUIRED columns are NOT NULL without a default. A missing ts means "now".
+REQUIRED = object()
+SCHEMAS = {
+    'crowd_data': {
+        'location': ('text', REQUIRED),
+        'density': ('real', REQUIRED),
+        'ts': ('ts', None),
+        'anomaly': ('flag', 0),
+        'emotion_score': ('real', 0.5),
+        'category': ('text', 'normal'),
+    },
+    'mobility_data': {
+        'vehicle_type': ('text', REQUIRED),
+        'route': ('text', REQUIRED),
+        'co2_emission': ('real', REQUIRED),
+        'distance': ('real', REQUIRED),
+        'ts': ('ts', None),
+        'speed': ('real', 30.0),
+        'status': ('text', 'moving'),
+    },
+    'carbon_data': {
+        'location': ('text', REQUIRED),
+        'co2_level': ('real', REQUIRED),
+        'ts': ('ts', None),
+        'source': ('text', REQUIRED),
+        'trend': ('text', 'stable'),
+    },
+}
+
+# Accepted (low, high) of numeric columns; None leaves that side open
+RANGES = {
+    'crowd_data': {'density': (0.0, 1.0), 'emotion_score': (0.0, 1.0)},
+    'mobility_data': {'co2_emission': (0.0, None), 'distance': (0.0, None), 'speed': (0.0, None)},
+    'carbon_data': {'co2_level': (0.0, None)},
+}
+
+# Any real must fit the hot store's float32 columns (hot_store.py)
+MAX_REAL = 1e12
+
+# Readings may be stamped from 2000 up to a day ahead (sensor clock skew),
+# but not before the retention window: those days are archived and dropped
+MIN_TS = 946684800000
+MAX_TS_AHEAD_MS = 24 * 3600 * 1000
+
+# API records may name the time field "timestamp"
+ALIASES = {'timestamp': 'ts'}
+
+_listeners = []
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def to_ms(value):
+    """Epoch milliseconds from a datetime, an ISO string or epoch s/ms.
+
+    Naive datetimes and strings are taken as local time.
+    """
+    if isinstance(value, bool):
+        raise ValueError('must be an ISO timestamp or epoch seconds')
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError('must be finite')
+        return int(value if value > 1e11 else value * 1000)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    raise ValueError('must be an ISO timestamp or epoch seconds')
+
+
+def check_ts(ts):
+    if not max(MIN_TS, retention.oldest_kept_ms()) <= ts <= now_ms() + MAX_TS_AHEAD_MS:
+        raise ValueError(f'must be within the last {retention.HOT_DAYS} days and at most a day from now')
+    return ts
+
+
+def _coerce(kind, value, bounds=(None, None)):
+    if kind == 'text':
+        if not isinstance(value, str) or not value:
+            raise ValueError('must be a non-empty string')
+        return value
+    if kind == 'real':
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError('must be a number')
+        low, high = bounds
+        if (low is not None and value < low) or (high is not None and value > high):
+            raise ValueError(f'must be between {low:g} and {high:g}' if high is not None else f'must be {low:g} or more')
+        if abs(value) > MAX_REAL:
+            raise ValueError(f'must be within ±{MAX_REAL:g}')
+        return float(value)
+    if kind == 'flag':
+        if value not in (0, 1):
+            raise ValueError('must be 0/1 or true/false')
+        return int(value)
+    return check_ts(to_ms(value))
+
+
+def validate(record):
+    """Check one API record against its table schema; returns (table, row).
+
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('record must be a JSON object')
+    kind = record.get('type')
+    table = RECORD_TYPES.get(kind) if isinstance(kind, str) else None
+    if table is None:
+        raise ValueError(f"type must be one of {', '.join(RECORD_TYPES)}")
+    schema = SCHEMAS[table]
+    ranges = RANGES.get(table, {})
+    for alias, column in ALIASES.items():
+        if alias in record and column in record:
+            raise ValueError(f'give either {alias} or {column}, not both')
+    record = {ALIASES.get(field, field): value for field, value in record.items()}
+    unknown = set(record) - set(schema) - {'type'}
+    if unknown:
+        raise ValueError(f"unknown field(s) for {record['type']}: {', '.join(sorted(unknown))}")
+
+    row = {}
+    for column, (kind, default) in schema.items():
+        value = record.get(column)
+        if value is None:
+            if default is REQUIRED:
+                raise ValueError(f'{column} is required')
+            row[column] = now_ms() if kind == 'ts' else default
+            continue
+        try:
+            row[column] = _coerce(kind, value, ranges.get(column, (None, None)))
+        except ValueError as e:
+            raise ValueError(f'{column} {e}') from None
+    return table, row
+
+
+def iter_records(body, lines=None):
+    """Yield (number, record, error) from a JSON array or NDJSON body.
+
+    `body` is bytes or an iterable of byte lines (e.g. a request stream).
+    Arrays are parsed whole; NDJSON is parsed line by line so large
+    uploads never have to be held as one document. A malformed array
+    raises ValueError, a malformed NDJSON line is reported as an error.
+    """
+    if isinstance(body, (bytes, str)):
+        text = body.lstrip()
+        if lines is None:
+            lines = not text.startswith(b'[' if isinstance(text, bytes) else '[')
+        if not lines:
+            try:
+                records = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'invalid JSON: {e}') from None
+            for number, record in enumerate(records if isinstance(records, list) else [records], 1):
+                yield number, record, None
+            return
+        body = body.splitlines()
+
+    for number, line in enumerate(body, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield number, None, f'invalid JSON: {e}'
+
+
+def subscribe(listener):
+    """Call listener(crowd, mobility, carbon) after every committed batch"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def unsubscribe(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def notify(crowd=(), mobility=(), carbon=()):
+    for listener in list(_listeners):
+        try:
+            listener(crowd, mobility, carbon)
+        except Exception as e:
+            print(f"❌ Ingest listener failed: {e}")
+
+
+def write_readings(conn, crowd=(), mobility=(), carbon=()):
+    """Insert a batch of readings on an open write connection (caller commits)"""
+    for table, rows in zip(TABLES, (crowd, mobility, carbon)):
+        if not rows:
+            continue
+        # Ids are reserved up front so they stay global across day partitions
+        first_id = partitions.reserve_ids(conn, table, len(rows))
+        for offset, row in enumerate(rows, start=first_id):
+            row['id'] = offset
+        # Before the insert: detected anomalies are stored on the rows
+        alerts.evaluate(conn, table, rows)
+        partitions.insert(conn, table, rows)
+        rollups.record(conn, table, rows)
+        locations.record(conn, table, rows)
+    return len(crowd) + len(mobility) + len(carbon)
+
+
+def store_readings(crowd=(), mobility=(), carbon=()):
+    """Write a batch through the shared writer in one transaction"""
+    with database.write_connection() as conn:
+        count = write_readings(conn, crowd, mobility, carbon)
+    notify(crowd, mobility, carbon)
+    return count
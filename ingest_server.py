@@ -0,0 +1,304 @@
+"""Single writer process for multi-worker deployments.
+
+SQLite takes one writer at a time, so when the API runs as several worker
+processes (see serve.py) none of them writes. One IngestServer process owns
+the schema migrations, retention and the group-commit IngestionDaemon, and
+workers hand it their readings over a local socket. IngestClient has the
+same producer interface as the daemon (submit, wait_committed, failed,
+stats, batch_size), so /api/ingest does not care which one it is given.
+
+Rows are committed by this process; workers see them through the response
+cache watermark they already poll. The in-memory views that follow the
+commits (the 5-minute sliding window and the hot store) and the fitted
+forecasts live here once rather than in every worker: a worker reads them
+through RemoteView proxies over the same socket.
+
+    python ingest_server.py --address /tmp/crowd-writer.sock
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import alerts
+import database
+import forecast
+import hot_store
+import locations
+import migrate
+import realtime_updater
+import retention
+import rollups
+import sensors
+import sliding_window
+
+DEFAULT_ADDRESS = os.environ.get('CROWD_WRITER_ADDRESS', '/tmp/crowd-writer.sock')
+CONNECT_TIMEOUT = 30.0
+
+# Views this process keeps for every worker: name -> (object, what a
+# RemoteView may read or call on it)
+VIEWS = {
+    'window': (lambda: sliding_window.metrics_window, ('ready', 'stats', 'behind', 'sync')),
+    'hot': (lambda: hot_store.hot_store, ('ready', 'covers', 'select_coded', 'aggregate', 'bucketed',
+                                          'behind', 'sync', 'stats')),
+    'forecast': (lambda: forecast.forecaster, ('ready', 'forecast', 'locations', 'stats')),
+}
+
+
+class IngestServer:
+    """Serve one IngestionDaemon to local clients, a thread per connection"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, daemon=None, authkey=None):
+        self.address = address
+        self.daemon = daemon or realtime_updater.IngestionDaemon()
+        self.authkey = authkey
+        self._listener = None
+        self._lock = threading.Lock()
+        self._stats = {'connections': 0, 'open_connections': 0, 'calls': 0, 'errors': 0}
+
+    def prepare(self):
+        """Bring the schema up to date before any client is accepted"""
+        with database.write_connection() as conn:
+            migrate.migrate(conn)
+            rollups.ensure(conn)
+            locations.ensure(conn)
+            sensors.ensure(conn)
+            alerts.ensure(conn)
+
+    def listen(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = Listener(self.address, 'AF_UNIX', authkey=self.authkey)
+        return self._listener
+
+    def serve_forever(self):
+        listener = self._listener or self.listen()
+        self.daemon.start()
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                # Closed by stop(), or a client that failed the handshake
+                if self._listener is None:
+                    return
+                continue
+            threading.Thread(target=self._handle, args=(conn,), name='ingest-client', daemon=True).start()
+
+    def _handle(self, conn):
+        with self._lock:
+            self._stats['connections'] += 1
+            self._stats['open_connections'] += 1
+        try:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ('ok', self.call(method, args))
+                except (realtime_updater.QueueFull, ValueError, KeyError) as e:
+                    reply = ('error', type(e).__name__, str(e))
+                except Exception as e:
+                    with self._lock:
+                        self._stats['errors'] += 1
+                    reply = ('error', 'RuntimeError', f'{type(e).__name__}: {e}')
+                conn.send(reply)
+        finally:
+            conn.close()
+            with self._lock:
+                self._stats['open_connections'] -= 1
+
+    def call(self, method, args):
+        with self._lock:
+            self._stats['calls'] += 1
+        daemon = self.daemon
+        if method == 'submit':
+            return daemon.submit(*args)
+        if method == 'wait_committed':
+            return daemon.wait_committed(*args)
+        if method == 'failed':
+            return daemon.failed(*args)
+        if method == 'flush':
+            return daemon.flush(*args)
+        if method == 'stats':
+            return dict(daemon.stats(*args), server=self.stats())
+        if method == 'settings':
+            return {'batch_size': daemon.batch_size, 'max_pending': daemon.max_pending}
+        if method == 'view':
+            return self.view(*args)
+        raise ValueError(f'unknown method {method!r}')
+
+    def view(self, name, attribute, args=(), kwargs=None):
+        target, allowed = VIEWS.get(name, (None, ()))
+        if attribute not in allowed:
+            raise ValueError(f'unknown view attribute {name}.{attribute}')
+        value = getattr(target(), attribute)
+        return value(*args, **(kwargs or {})) if callable(value) else value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, address=self.address, pid=os.getpid())
+
+    def stop(self, timeout=None):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+        self.daemon.stop(timeout)
+
+
+class IngestClient:
+    """Producer side of an IngestServer; one connection per calling thread"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._settings = None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, 'AF_UNIX', authkey=self.authkey)
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def _call(self, method, *args):
+        try:
+            conn = self._connection()
+            conn.send((method, args))
+            reply = conn.recv()
+        except (EOFError, OSError) as e:
+            # The writer restarted or is not up; the next call reconnects
+            self._drop()
+            raise realtime_updater.QueueFull(f'ingest writer unavailable: {e}')
+        if reply[0] == 'ok':
+            return reply[1]
+        _, kind, message = reply
+        if kind == 'QueueFull':
+            raise realtime_updater.QueueFull(message)
+        if kind == 'ValueError':
+            raise ValueError(message)
+        if kind == 'KeyError':
+            raise KeyError(message)
+        raise RuntimeError(message)
+
+    @property
+    def batch_size(self):
+        if self._settings is None:
+            self._settings = self._call('settings')
+        return self._settings['batch_size']
+
+    def submit(self, crowd=(), mobility=(), carbon=(), timeout=None):
+        return self._call('submit', list(crowd), list(mobility), list(carbon), timeout)
+
+    def wait_committed(self, ticket, timeout=None):
+        return self._call('wait_committed', ticket, timeout)
+
+    def failed(self, first, last):
+        return self._call('failed', first, last)
+
+    def flush(self, timeout=None):
+        return self._call('flush', timeout)
+
+    def stats(self, window=10.0):
+        try:
+            return self._call('stats', window)
+        except realtime_updater.QueueFull as e:
+            return {'connected': False, 'address': self.address, 'last_error': str(e)}
+
+
+class RemoteView:
+    """One of the writer process's VIEWS, read through an IngestClient.
+
+    Attributes are fetched and methods called on the writer, so a worker
+    uses it like the local object. `ready` is False while the writer is
+    unreachable, which sends callers to their SQL fallback.
+    """
+
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    @property
+    def ready(self):
+        try:
+            return self._client._call('view', self._name, 'ready')
+        except realtime_updater.QueueFull:
+            return False
+
+    def stats(self):
+        try:
+            return self._client._call('view', self._name, 'stats')
+        except realtime_updater.QueueFull as e:
+            return {'connected': False, 'last_error': str(e)}
+
+    def __getattr__(self, attribute):
+        if attribute not in VIEWS[self._name][1]:
+            raise AttributeError(attribute)
+
+        def call(*args, **kwargs):
+            return self._client._call('view', self._name, attribute, args, kwargs)
+
+        return call
+
+
+def wait_ready(address, timeout=CONNECT_TIMEOUT, authkey=None):
+    """Block until an IngestServer accepts connections at `address`"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            Client(address, 'AF_UNIX', authkey=authkey).close()
+            return True
+        except OSError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+
+def run(address=DEFAULT_ADDRESS, authkey=None, max_pending=50000, batch_size=5000, flush_ms=100):
+    """Process entry point: migrate, start retention, then serve until killed"""
+    server = IngestServer(address, realtime_updater.IngestionDaemon(max_pending, batch_size, flush_ms), authkey)
+    server.prepare()
+    retention.start()
+    # The views workers read through RemoteView, fed by this process's commits
+    sliding_window.start()
+    hot_store.start()
+    forecast.start()
+    server.listen()
+    # serve.py stops the writer with SIGTERM; flush the queue on the way out
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"✍️ Writer process {os.getpid()} serving ingest on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Don't let a second signal cut the flush short
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        print("🛑 Flushing queued readings...")
+        server.stop(10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the single writer process for API workers')
+    parser.add_argument('--address', default=DEFAULT_ADDRESS, help='unix socket path')
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows per group commit')
+    parser.add_argument('--flush-ms', type=float, default=100, help='max time a row waits for a commit')
+    parser.add_argument('--max-pending', type=int, default=50000, help='queue size before producers block')
+    args = parser.parse_args(argv)
+    authkey = os.environ.get('CROWD_WRITER_AUTHKEY', '').encode() or None
+    run(args.address, authkey, args.max_pending, args.batch_size, args.flush_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Location registry and materialized current state per location.
+
+`locations` holds every known location with its map coordinates (seeded
+from COORDINATES; names first seen in readings are registered without
+coordinates). `location_state` keeps the latest crowd reading and a
+running reading count per location and is upserted in the same
+transaction as each batch of inserts (see ingest.py), so the map reads one
+row per location however much history there is. Anomalies over the last
+hour come from the minute rollups, which is also bounded by the number of
+locations.
+"""
+
+from datetime import datetime, timedelta
+
+import partitions
+import rollups
+
+COORDINATES = {
+    "Stadium Main Gate": (12.9784, 77.5994),
+    "Stadium North Stand": (12.9792, 77.5999),
+    "Stadium South Stand": (12.9776, 77.5997),
+    "VIP Entrance": (12.9787, 77.6004),
+    "Parking Lot A": (12.9778, 77.6003),
+    "Parking Lot B": (12.9770, 77.5990),
+    "Metro Station": (12.9780, 77.6010),
+    "Bus Terminal": (12.9795, 77.5995),
+    "Food Court": (12.9782, 77.5985),
+    "Security Checkpoint": (12.9786, 77.5990),
+}
+
+# Density (%) thresholds for the map status; 'high' matches the dashboard
+HIGH_DENSITY = 70
+MEDIUM_DENSITY = 40
+
+ANOMALY_WINDOW_MINUTES = 60
+
+CURRENT_SQL = '''
+    SELECT l.name, l.lat, l.lng, s.ts, s.density, s.anomaly, s.readings
+    FROM location_state s
+    JOIN locations l ON l.name = s.location
+    ORDER BY l.name
+'''
+
+RECENT_ANOMALIES_SQL = '''
+    SELECT location, SUM(anomalies) AS anomalies
+    FROM crowd_rollup
+    WHERE grain = 'minute' AND bucket >= ?
+    GROUP BY location
+'''
+
+UPSERT_SQL = '''
+    INSERT INTO location_state (location, ts, density, anomaly, readings)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (location) DO UPDATE SET
+        readings = readings + excluded.readings,
+        density = CASE WHEN excluded.ts >= ts THEN excluded.density ELSE density END,
+        anomaly = CASE WHEN excluded.ts >= ts THEN excluded.anomaly ELSE anomaly END,
+        ts = MAX(ts, excluded.ts)
+'''
+
+# Names already in the registry (saves an INSERT OR IGNORE per batch)
+_registered = set()
+
+
+def create_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS locations (
+        name TEXT PRIMARY KEY,
+        lat REAL,
+        lng REAL
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS location_state (
+        location TEXT PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        density REAL NOT NULL,
+        anomaly INTEGER NOT NULL,
+        readings INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    conn.executemany('INSERT OR IGNORE INTO locations (name, lat, lng) VALUES (?, ?, ?)',
+                     [(name, lat, lng) for name, (lat, lng) in COORDINATES.items()])
+
+
+def register(conn, names):
+    new = [name for name in names if name not in _registered]
+    if new:
+        conn.executemany('INSERT OR IGNORE INTO locations (name) VALUES (?)', [(name,) for name in new])
+        _registered.update(new)
+
+
+def record(conn, table, rows):
+    """Fold freshly inserted crowd rows into location_state"""
+    if table != 'crowd_data' or not rows:
+        return
+    latest = {}
+    for row in rows:
+        state = latest.get(row['location'])
+        if state is None:
+            latest[row['location']] = [row['ts'], row['density'], 1 if row.get('anomaly') else 0, 1]
+        else:
+            if row['ts'] >= state[0]:
+                state[0], state[1], state[2] = row['ts'], row['density'], 1 if row.get('anomaly') else 0
+            state[3] += 1
+    register(conn, latest)
+    conn.executemany(UPSERT_SQL, [(location, *state) for location, state in latest.items()])
+
+
+def backfill(conn):
+    """Rebuild location_state from the rollups and the newest partitions"""
+    create_tables(conn)
+    conn.execute('DELETE FROM location_state')
+    counts = dict(conn.execute("SELECT location, SUM(readings) FROM crowd_rollup WHERE grain = 'day' "
+                               "GROUP BY location"))
+    missing = set(counts)
+    # Walk back one day at a time until every location has its latest row
+    for day in reversed(partitions.days(conn, 'crowd_data')):
+        if not missing:
+            break
+        name = partitions.partition_name('crowd_data', day)
+        # SQLite returns the bare columns from the row that holds MAX(ts)
+        rows = conn.execute(f'SELECT location, MAX(ts), density, anomaly FROM {name} GROUP BY location')
+        for location, ts, density, anomaly in rows:
+            if location in missing:
+                missing.discard(location)
+                conn.execute('INSERT INTO location_state (location, ts, density, anomaly, readings) '
+                              'VALUES (?, ?, ?, ?, ?)', (location, ts, density, anomaly or 0, counts[location]))
+    register(conn, counts)
+
+
+def ensure(conn):
+    """Create the tables and backfill the state if it is still empty"""
+    create_tables(conn)
+    has_state = conn.execute('SELECT 1 FROM location_state LIMIT 1').fetchone()
+    has_rows = conn.execute('SELECT 1 FROM crowd_rollup LIMIT 1').fetchone()
+    if has_rows and not has_state:
+        print("📍 Building current location state...")
+        backfill(conn)
+        return True
+    return False
+
+
+def status_of(density):
+    if density >= HIGH_DENSITY:
+        return 'high'
+    if density >= MEDIUM_DENSITY:
+        return 'medium'
+    return 'low'
+
+
+def current(conn, now=None, names=None):
+    """Latest state of every location that has readings (or of `names`), for the map"""
+    now = now or datetime.now()
+    since = (now - timedelta(minutes=ANOMALY_WINDOW_MINUTES)).strftime('%Y-%m-%d %H:%M')
+    anomalies = dict(conn.execute(RECENT_ANOMALIES_SQL, (since,)).fetchall())
+    result = []
+    for name, lat, lng, ts, density, anomaly, readings in conn.execute(CURRENT_SQL):
+        if names is not None and name not in names:
+            continue
+        density = round(density * 100, 1)
+        result.append({
+            'name': name,
+            'lat': lat,
+            'lng': lng,
+            'density': density,
+            'status': status_of(density),
+            'anomaly': bool(anomaly),
+            'anomalies': anomalies.get(name, 0),
+            'readings': readings,
+            'last_reading': rollups.local_time(ts),
+        })
+    return result
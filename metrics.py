@@ -0,0 +1,360 @@
+"""Process metrics in the Prometheus text exposition format.
+
+Request latency and SQL time are recorded per endpoint into fixed-bucket
+histograms (a bisect and a few additions per request, so it stays on under
+load). SQL time is the time spent in execute/fetch calls on pool
+connections during the request (see database.TimedConnection). Point-in-time
+values (writer queue depth, pool use, DB and WAL size, freshness, ...) are
+read only when /metrics or /api/system-status asks, through collectors the
+app registers.
+
+    # HELP crowd_http_request_seconds Request latency by endpoint
+    # TYPE crowd_http_request_seconds histogram
+    crowd_http_request_seconds_bucket{endpoint="/api/dashboard",method="GET",le="0.005"} 41
+"""
+
+import bisect
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import partitions
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Readings older than this make a data stream "stale"
+STALE_SECONDS = 300
+
+
+class _RequestState(threading.local):
+    started = None
+    sql_seconds = 0.0
+    sql_statements = 0
+
+
+_local = _RequestState()
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-quantile (what histogram_quantile() would bracket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def histograms(self, name):
+        with self._lock:
+            return {labels: h for (n, labels), h in self._histograms.items() if n == name}
+
+    def counter(self, name, labels):
+        return self._counters.get((name, labels), 0)
+
+    def register(self, collector):
+        """collector() -> [(name, type, help, [(labels, value), ...]), ...], called per scrape"""
+        self._collectors.append(collector)
+
+    def render(self, families=()):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        described = set()
+        for (name, labels), histogram in histograms:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {histogram.total!r}')
+            lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+
+        for (name, labels), value in counters:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_labels(labels)} {value}')
+
+        collected = [families]
+        for collector in list(self._collectors):
+            try:
+                collected.append(collector())
+            except Exception as e:
+                lines.append(f'# collector {getattr(collector, "__name__", collector)} failed: {e}')
+        for name, kind, help_text, samples in (family for group in collected for family in group):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+HELP = {
+    'crowd_http_request_seconds': 'Request latency by endpoint',
+    'crowd_http_sql_seconds': 'Time spent in SQL per request by endpoint',
+    'crowd_http_requests_total': 'Requests by endpoint and status',
+    'crowd_ingested_rows_total': 'Rows committed by this process per table',
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+# name -> stats() callable of a component (ingest daemon, pool, cache, ...);
+# numeric fields are exported as crowd_<name>_<field>
+sources = {}
+
+
+def watch(name, stats):
+    # Watching a name again (another create_app()) swaps its stats function
+    if name not in sources:
+        registry.register(lambda: _source_families(name, sources[name]))
+    sources[name] = stats
+
+
+def _source_families(name, stats):
+    families = []
+    for key, value in stats().items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            families.append((f'crowd_{name}_{key}', 'gauge', f'{name} stats: {key}', [((), value)]))
+    return families
+
+
+# Per-request SQL time (fed by database.TimedConnection)
+def add_sql(seconds):
+    state = _local
+    state.sql_seconds += seconds
+    state.sql_statements += 1
+
+
+def begin_request():
+    _local.started = time.perf_counter()
+    _local.sql_seconds = 0.0
+    _local.sql_statements = 0
+
+
+def end_request(endpoint, method, status):
+    started = _local.started
+    if started is None:
+        return
+    labels = (('endpoint', endpoint), ('method', method))
+    registry.observe('crowd_http_request_seconds', labels, time.perf_counter() - started)
+    registry.observe('crowd_http_sql_seconds', labels, _local.sql_seconds)
+    registry.inc('crowd_http_requests_total', labels + (('status', str(status)),))
+    _local.started = None
+
+
+def ingested(crowd=(), mobility=(), carbon=()):
+    """ingest listener: count committed rows per table"""
+    for table, rows in zip(partitions.TABLES, (crowd, mobility, carbon)):
+        if rows:
+            registry.inc('crowd_ingested_rows_total', (('table', table),), len(rows))
+
+
+# Database-derived figures
+class IngestRate:
+    """Rows/s per table from partition_ids samples, so other writer processes count too"""
+
+    def __init__(self, window=60.0):
+        self.window = window
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def sample(self, conn):
+        now = time.monotonic()
+        with self._lock:
+            if not self._samples or now - self._samples[-1][0] >= 1.0:
+                self._samples.append((now, partitions.last_ids(conn)))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+            (t0, first), (t1, last) = self._samples[0], self._samples[-1]
+        elapsed = t1 - t0
+        return {table: round((last.get(table, 0) - first.get(table, 0)) / elapsed, 2) if elapsed else 0.0
+                for table in partitions.TABLES}
+
+
+ingest_rate = IngestRate()
+
+
+def latest_ts(conn):
+    """Newest reading ts per table (an index seek on the newest partition)"""
+    latest = {}
+    for table in partitions.TABLES:
+        latest[table] = None
+        for day in reversed(partitions.days(conn, table)):
+            ts = conn.execute(f'SELECT MAX(ts) FROM {partitions.partition_name(table, day)}').fetchone()[0]
+            if ts is not None:
+                latest[table] = ts
+                break
+    return latest
+
+
+def file_sizes(path):
+    sizes = {}
+    for name, suffix in (('db', ''), ('wal', '-wal')):
+        try:
+            sizes[name] = os.path.getsize(path + suffix)
+        except OSError:
+            sizes[name] = 0
+    return sizes
+
+
+def endpoint_summary():
+    """Count, mean and p95 bucket per endpoint for /api/system-status"""
+    sql = registry.histograms('crowd_http_sql_seconds')
+    summary = {}
+    for labels, histogram in registry.histograms('crowd_http_request_seconds').items():
+        endpoint = dict(labels)['endpoint']
+        entry = summary.setdefault(endpoint, {'requests': 0, 'seconds': 0.0, 'sql_seconds': 0.0})
+        entry['requests'] += histogram.count
+        entry['seconds'] += histogram.total
+        entry['p95_ms'] = max(entry.get('p95_ms') or 0, (histogram.quantile(0.95) or 0) * 1000)
+        if labels in sql:
+            entry['sql_seconds'] += sql[labels].total
+    return {
+        endpoint: {
+            'requests': e['requests'],
+            'avg_ms': round(e['seconds'] / e['requests'] * 1000, 3) if e['requests'] else 0.0,
+            'avg_sql_ms': round(e['sql_seconds'] / e['requests'] * 1000, 3) if e['requests'] else 0.0,
+            'p95_ms_at_most': e['p95_ms'] if e['p95_ms'] != math.inf else None,
+        }
+        for endpoint, e in sorted(summary.items())
+    }
+
+
+def database_path(conn):
+    return next((row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main'), '')
+
+
+def freshness(conn, now_ms=None):
+    """Seconds since the newest reading per table (None for an empty table)"""
+    now_ms = now_ms or int(time.time() * 1000)
+    return {table: (now_ms - ts) / 1000 if ts is not None else None for table, ts in latest_ts(conn).items()}
+
+
+def database_families(conn, now_ms=None):
+    """Gauges read from the database at scrape time"""
+    ages = freshness(conn, now_ms)
+    rates = ingest_rate.sample(conn)
+    sizes = file_sizes(database_path(conn))
+    by_table = lambda values: [((('table', table),), value) for table, value in values.items()]
+    return [
+        ('crowd_data_freshness_seconds', 'gauge', 'Seconds since the newest reading', by_table(ages)),
+        ('crowd_ingest_rows_per_second', 'gauge', 'Rows committed per second by any writer', by_table(rates)),
+        ('crowd_database_bytes', 'gauge', 'Database file size', [((('file', name),), size)
+                                                                 for name, size in sizes.items()]),
+    ]
+
+
+def render(conn=None, now_ms=None):
+    """The /metrics body"""
+    return registry.render(database_families(conn, now_ms) if conn is not None else ())
+
+
+def system_status(conn, now_ms=None, active_alerts=0):
+    """/api/system-status, built from the same figures /metrics exports"""
+    now_ms = now_ms or int(time.time() * 1000)
+    latest = latest_ts(conn)
+    rates = ingest_rate.sample(conn)
+    sizes = file_sizes(database_path(conn))
+
+    streams = {}
+    for table in partitions.TABLES:
+        ts = latest[table]
+        age = (now_ms - ts) / 1000 if ts is not None else None
+        streams[table.split('_')[0]] = {
+            'status': 'active' if age is not None and age <= STALE_SECONDS else 'stale',
+            'last_reading': datetime.fromtimestamp(ts / 1000).isoformat() if ts is not None else None,
+            'freshness_seconds': round(age, 1) if age is not None else None,
+            'rows_per_second': rates[table],
+            'updates_per_hour': round(rates[table] * 3600),
+        }
+    newest = max((ts for ts in latest.values() if ts is not None), default=None)
+    age = (now_ms - newest) / 1000 if newest is not None else None
+
+    writer = sources['writer']() if 'writer' in sources else {}
+    queue_full = writer.get('queue_capacity') and writer['queue_depth'] >= 0.8 * writer['queue_capacity']
+    stale = any(stream['status'] != 'active' for stream in streams.values())
+    return {
+        'database': {
+            'status': 'online',
+            'last_update': datetime.fromtimestamp(newest / 1000).isoformat() if newest is not None else None,
+            'freshness_minutes': round(age / 60, 1) if age is not None else None,
+            'size_bytes': sizes['db'],
+            'wal_bytes': sizes['wal'],
+        },
+        'data_streams': streams,
+        'ingest': {key: writer[key] for key in ('queue_depth', 'queue_capacity', 'rows_per_second', 'last_error')
+                   if key in writer},
+        'api': endpoint_summary(),
+        'alerts': {
+            'active_alerts': active_alerts,
+            'status': 'attention' if active_alerts else 'normal'
+        },
+        'overall_status': 'degraded' if stale or queue_full or writer.get('connected') is False else 'healthy'
+    }
@@ -0,0 +1,229 @@
+"""Schema versions, migrations and query-plan checks for the reading tables.
+
+Readings are stored with an integer `ts` (milliseconds since the Unix
+epoch, UTC) in day partitions (see partitions.py). Older databases kept
+local-time text in `timestamp` (version 0) or one flat table per kind
+(version 1); migrate() copies either into day partitions in one
+transaction, keeping row ids. The version lives in PRAGMA user_version.
+
+Every partition has a covering index led by ts for the windowed dashboard
+queries and covering (key, ts) indexes for per-location / per-vehicle /
+per-source lookups, so every dashboard query is an index range scan.
+
+    python migrate.py                 # migrate crowd_mobility.db in place
+    python migrate.py --check         # EXPLAIN QUERY PLAN every dashboard query
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import partitions
+
+SCHEMA_VERSION = 2
+
+# Local-time text ('YYYY-MM-DD HH:MM:SS.ffffff') -> epoch milliseconds
+TEXT_TO_MS_SQL = ("(CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000"
+                  " + CAST(substr(strftime('%f', timestamp), 4, 3) AS INTEGER))")
+
+
+def create_tables(conn):
+    """Schema for a fresh database; partitions are created as data arrives"""
+    partitions.create_tables(conn)
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _partition_flat_table(conn, table, flat):
+    """Copy the flat reading table (renamed to `flat`) into day partitions, then drop it"""
+    legacy = 'timestamp' in columns(conn, flat)
+    ts_sql = TEXT_TO_MS_SQL if legacy else 'ts'
+    day_sql = 'date(timestamp)' if legacy else "date(ts / 1000, 'unixepoch', 'localtime')"
+    names = [c for c in partitions.column_names(table) if c != 'ts']
+    select = ', '.join(names) + f', {ts_sql}'
+
+    days = [row[0] for row in conn.execute(f'SELECT DISTINCT {day_sql} FROM {flat}')]
+    for day in sorted(days):
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+        name = partitions.create_partition(conn, table, day, indexes=False)
+        if legacy:
+            # Text timestamps sort like dates, so the day is a range
+            where, params = 'timestamp >= ? AND timestamp < ?', (str(day), str(day + timedelta(days=1)))
+        else:
+            where, params = 'ts >= ? AND ts < ?', partitions.day_bounds(day)
+        conn.execute(f'''
+        INSERT INTO {name} ({', '.join(names)}, ts)
+        SELECT {select} FROM {flat} WHERE {where}
+        ''', params)
+        partitions.create_indexes(conn, table, day)
+
+    last_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {flat}').fetchone()[0]
+    conn.execute(f'DROP TABLE {flat}')
+    conn.execute('UPDATE partition_ids SET last_id = MAX(last_id, ?) WHERE tbl = ?', (last_id, table))
+
+
+def migrate(conn):
+    """Bring a database up to SCHEMA_VERSION; returns True if anything changed.
+
+    Runs on the writer inside one transaction, so a failed migration
+    leaves the old schema untouched.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    kinds = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE name IN (?, ?, ?)", partitions.TABLES))
+    if version >= SCHEMA_VERSION or not kinds:
+        return False
+
+    started = time.perf_counter()
+    print("🛠️ Migrating readings to epoch-ms day partitions...")
+    # sqlite3 only opens transactions implicitly for DML; the DDL must be in it too
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    # The flat tables move aside so their names can become the views
+    flat = [table for table in partitions.TABLES if kinds.get(table) == 'table']
+    for table in flat:
+        conn.execute(f'ALTER TABLE {table} RENAME TO {table}_flat')
+    partitions.create_tables(conn)
+    for table in flat:
+        _partition_flat_table(conn, table, f'{table}_flat')
+        partitions.refresh_view(conn, table)
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    print(f"✅ Schema at version {SCHEMA_VERSION} ({time.perf_counter() - started:.1f}s)")
+    return True
+
+
+# Query-plan checks
+# Checks of queries that stream rows in index order, which must not sort
+STREAMED_PREFIX = 'export '
+
+
+def plan_checks(conn, now_ms=None):
+    """(name, sql, params) for every query the dashboard runs against the DB.
+
+    "Now" defaults to the newest reading so an idle database still has
+    partitions in the windows being checked.
+    """
+    import dashboard
+    import export
+    import forecast
+    import heatmap
+    import sliding_window
+    import timeseries
+
+    if now_ms is None:
+        days = partitions.days(conn, 'crowd_data')
+        now_ms = partitions.day_bounds(days[-1])[1] - 1 if days else int(time.time() * 1000)
+
+    def raw(sql, since_ms):
+        return partitions.expand(conn, sql, since_ms, now_ms), (since_ms,)
+
+    checks = [
+        ('crowd stats', *raw(dashboard.CROWD_STATS_SQL, now_ms - 300000)),
+        ('mobility stats', *raw(dashboard.MOBILITY_STATS_SQL, now_ms - 300000)),
+        ('carbon stats', *raw(dashboard.CARBON_STATS_SQL, now_ms - 300000)),
+        ('vehicle distribution', *raw(dashboard.VEHICLE_DISTRIBUTION_SQL, now_ms - 3600000)),
+        # A window reaching into yesterday reads a union of two partitions
+        ('crowd stats over two days', *raw(dashboard.CROWD_STATS_SQL, now_ms - 36 * 3600000)),
+    ]
+    for name in ('HOURLY_CROWD_SQL', 'HOURLY_CARBON_SQL', 'DAILY_TRIPS_SQL', 'DAILY_CROWD_SQL',
+                 'DAILY_CARBON_SQL', 'DAILY_VEHICLE_DIVERSITY_SQL'):
+        checks.append((name.lower()[:-4].replace('_', ' '), getattr(dashboard, name), ('2026-01-01',)))
+    checks.append(('heatmap buckets', heatmap.BUCKETS_SQL, ('2026-01-01 00:00', '2026-01-01 00:15')))
+    checks.append(('forecast hours', forecast.HOURS_SQL, ('2026-01-02 00:00', '2026-01-01 00', '2026-01-02 00')))
+    checks.append(('forecast recent hours', forecast.RECENT_SQL, ('2026-01-01 21',)))
+
+    grid = timeseries.Grid(now_ms / 1000, 24 * 60, 60)
+    for series, spec in timeseries.SERIES.items():
+        checks.append((f'live graph {series}', *timeseries.bucket_query(conn, grid, series)))
+        for column in spec['filters']:
+            checks.append((f'live graph {series} by {column}',
+                           *timeseries.bucket_query(conn, grid, series, {column: 'x'})))
+
+    for table in sliding_window.TABLES:
+        since_ms = now_ms - 300000
+        checks.append((f'window rebuild {table}',
+                       partitions.expand(conn, sliding_window.SINCE_SQL.format(table=table), since_ms),
+                       (since_ms,)))
+        checks.append((f'window tail {table}',
+                       partitions.expand(conn, sliding_window.TAIL_SQL.format(table=table)), (0,)))
+
+    # Exports stream in id order; a filter must not turn that into a sort
+    for table, columns in export.FILTERS.items():
+        for filters in [{}] + [{column: 'x'} for column in columns]:
+            job = export.Export(table, since_ms=now_ms - 36 * 3600000, filters=filters)
+            by = f" by {', '.join(filters)}" if filters else ''
+            checks.append((f'{STREAMED_PREFIX}{table}{by}', *job.query(conn, 0, export.PAGE_ROWS)))
+    return checks
+
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def is_range_scan(plan, sorted_ok=True):
+    """Every table access is a SEARCH on an index or the primary key.
+
+    Scans of a union subquery or co-routine are just reads of its arms,
+    which are checked themselves. With sorted_ok=False the rows must also
+    come out in order, without a temp b-tree.
+    """
+    accesses = [step for step in plan if step.startswith(('SCAN', 'SEARCH'))
+                and not step.startswith(('SCAN (subquery', 'SCAN CONSTANT ROW'))]
+    if not sorted_ok and any('TEMP B-TREE' in step for step in plan):
+        return False
+    return bool(accesses) and all(
+        step.startswith('SEARCH') and ('INDEX' in step or 'PRIMARY KEY' in step) for step in accesses)
+
+
+def check_plans(conn, verbose=True):
+    """EXPLAIN every dashboard query; returns the names that are not range scans"""
+    failures = []
+    for name, sql, params in plan_checks(conn):
+        try:
+            plan = explain(conn, sql, params)
+        except sqlite3.OperationalError as e:
+            plan = [f'error: {e}']
+        ok = is_range_scan(plan, sorted_ok=not name.startswith(STREAMED_PREFIX))
+        if not ok:
+            failures.append(name)
+        if verbose:
+            print(f"{'✅' if ok else '❌'} {name}: {' | '.join(plan)}")
+    return failures
+
+
+def main(argv=None):
+    import alerts
+    import database
+    import locations
+    import rollups
+    import sensors
+
+    parser = argparse.ArgumentParser(description='Migrate the readings schema and check query plans')
+    parser.add_argument('--db', default=database.DB_PATH)
+    parser.add_argument('--check', action='store_true', help='only run the EXPLAIN QUERY PLAN checks')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if not args.check:
+            with conn:
+                migrate(conn)
+                rollups.ensure(conn)
+                locations.ensure(conn)
+                sensors.ensure(conn)
+                alerts.ensure(conn)
+        failures = check_plans(conn)
+    finally:
+        conn.close()
+    if failures:
+        print(f"❌ {len(failures)} queries are not index range scans")
+        sys.exit(1)
+    print("✅ Every dashboard query is an index range scan")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Day-partitioned storage for the raw reading tables.
+
+Each reading table is split into one physical table per local day
+(crowd_data_p20261016, ...) with its own covering indexes. Expiring a day
+is a DROP TABLE instead of a DELETE over millions of rows, and each day's
+indexes stay small.
+
+`crowd_data` etc. remain as UNION ALL views over every partition for
+ad-hoc and bulk reads. Dashboard queries use source() instead, which
+builds the same union over just the partitions a time range touches and
+just the columns the query needs, so SQLite keeps every arm on a covering
+index (a one-day window flattens to a plain table query).
+
+Row ids stay global and increasing: writers reserve them from
+partition_ids in the same transaction as the insert.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+TABLES = ('crowd_data', 'mobility_data', 'carbon_data')
+
+# Columns of each reading table (id first); DDL types in table_sql()
+COLUMNS = {
+    'crowd_data': (('id', 'INTEGER PRIMARY KEY'), ('location', 'TEXT NOT NULL'), ('density', 'REAL NOT NULL'),
+                   ('ts', 'INTEGER NOT NULL'), ('anomaly', 'INTEGER DEFAULT 0'),
+                   ('emotion_score', 'REAL DEFAULT 0.5'), ('category', "TEXT DEFAULT 'normal'")),
+    'mobility_data': (('id', 'INTEGER PRIMARY KEY'), ('vehicle_type', 'TEXT NOT NULL'), ('route', 'TEXT NOT NULL'),
+                      ('co2_emission', 'REAL NOT NULL'), ('distance', 'REAL NOT NULL'),
+                      ('ts', 'INTEGER NOT NULL'), ('speed', 'REAL DEFAULT 30.0'),
+                      ('status', "TEXT DEFAULT 'moving'")),
+    'carbon_data': (('id', 'INTEGER PRIMARY KEY'), ('location', 'TEXT NOT NULL'), ('co2_level', 'REAL NOT NULL'),
+                    ('ts', 'INTEGER NOT NULL'), ('source', 'TEXT NOT NULL'), ('trend', "TEXT DEFAULT 'stable'")),
+}
+
+# Per-partition indexes; trailing columns make them covering for the
+# aggregates that use them
+INDEXES = {
+    'crowd_data': {
+        'ts': '(ts, density, anomaly)',
+        'location_ts': '(location, ts, density, anomaly)',
+    },
+    'mobility_data': {
+        'ts': '(ts, vehicle_type, co2_emission)',
+        'vehicle_ts': '(vehicle_type, ts, co2_emission)',
+    },
+    'carbon_data': {
+        'ts': '(ts, co2_level)',
+        'location_ts': '(location, ts, co2_level)',
+        'source_ts': '(source, ts, co2_level)',
+    },
+}
+
+SEQUENCE_SQL = '''
+CREATE TABLE IF NOT EXISTS partition_ids (
+    tbl TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+)
+'''
+
+# (schema_version, {table: [days]}), swapped as a whole when the schema moves
+_cache = (None, {})
+_day_of_minute = {}
+
+
+def table_sql(name, table):
+    columns = ',\n    '.join(f'{column} {kind}' for column, kind in COLUMNS[table])
+    return f'CREATE TABLE IF NOT EXISTS {name} (\n    {columns}\n)'
+
+
+def column_names(table):
+    return [column for column, _ in COLUMNS[table]]
+
+
+def partition_name(table, day):
+    return f'{table}_p{day:%Y%m%d}'
+
+
+def day_of(ts):
+    """Local calendar day of an epoch-ms ts"""
+    minute = ts // 60000
+    day = _day_of_minute.get(minute)
+    if day is None:
+        if len(_day_of_minute) > 100000:
+            _day_of_minute.clear()
+        day = _day_of_minute[minute] = datetime.fromtimestamp(minute * 60).date()
+    return day
+
+
+def day_bounds(day):
+    """[start, end) of a local day in epoch ms"""
+    start = datetime.combine(day, datetime.min.time())
+    return int(start.timestamp() * 1000), int((start + timedelta(days=1)).timestamp() * 1000)
+
+
+# Partition catalogue
+def days(conn, table):
+    """Days that have a partition, oldest first"""
+    global _cache
+    version = conn.execute('PRAGMA schema_version').fetchone()[0]
+    cached_version, cached = _cache
+    if version != cached_version:
+        found = {t: [] for t in TABLES}
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB '*_p[0-9]*'"):
+            base, _, stamp = name.rpartition('_p')
+            if base in found and len(stamp) == 8 and stamp.isdigit():
+                found[base].append(datetime.strptime(stamp, '%Y%m%d').date())
+        cached = {t: sorted(d) for t, d in found.items()}
+        _cache = (version, cached)
+    return cached[table]
+
+
+def create_indexes(conn, table, day):
+    name = partition_name(table, day)
+    for suffix, columns in INDEXES[table].items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_{suffix} ON {name} {columns}')
+
+
+def refresh_view(conn, table):
+    """Point the `table` view at the current set of partitions"""
+    names = [partition_name(table, day) for day in days(conn, table)]
+    columns = ', '.join(column_names(table))
+    arms = [f'SELECT {columns} FROM {name}' for name in names]
+    if not arms:
+        arms = ['SELECT ' + ', '.join(f'NULL AS {column}' for column in column_names(table)) + ' WHERE 0']
+    conn.execute(f'DROP VIEW IF EXISTS {table}')
+    conn.execute(f'CREATE VIEW {table} AS ' + '\nUNION ALL '.join(arms))
+
+
+def _begin(conn):
+    # sqlite3 only opens transactions implicitly for DML; keep the table and
+    # its view swap in one so readers never see the view missing
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+
+def create_partition(conn, table, day, indexes=True):
+    """Create one day's partition (writer only); returns its name"""
+    name = partition_name(table, day)
+    if day not in days(conn, table):
+        _begin(conn)
+        conn.execute(table_sql(name, table))
+        if indexes:
+            create_indexes(conn, table, day)
+        refresh_view(conn, table)
+    return name
+
+
+def create_tables(conn):
+    """Sequence table and (empty) views for a fresh database"""
+    conn.execute(SEQUENCE_SQL)
+    for table in TABLES:
+        conn.execute('INSERT OR IGNORE INTO partition_ids (tbl, last_id) VALUES (?, 0)', (table,))
+        refresh_view(conn, table)
+
+
+def drop_partition(conn, table, day):
+    _begin(conn)
+    conn.execute(f'DROP TABLE IF EXISTS {partition_name(table, day)}')
+    refresh_view(conn, table)
+
+
+# Ids
+def reserve_ids(conn, table, count):
+    """Reserve `count` ids; returns the first. Call inside the write transaction."""
+    last = conn.execute('UPDATE partition_ids SET last_id = last_id + ? WHERE tbl = ? RETURNING last_id',
+                        (count, table)).fetchone()[0]
+    return last - count + 1
+
+
+def last_ids(conn):
+    return {row[0]: row[1] for row in conn.execute('SELECT tbl, last_id FROM partition_ids')}
+
+
+# Reads
+def source(conn, table, columns, since_ms=None, until_ms=None):
+    """FROM-clause source over the partitions overlapping [since_ms, until_ms]"""
+    wanted = ', '.join(dict.fromkeys(('ts',) + tuple(columns)))
+    first = day_of(since_ms) if since_ms is not None else None
+    last = day_of(until_ms) if until_ms is not None else None
+    names = [partition_name(table, day) for day in days(conn, table)
+             if (first is None or day >= first) and (last is None or day <= last)]
+    if not names:
+        return '(SELECT ' + ', '.join(f'NULL AS {c}' for c in wanted.split(', ')) + ' WHERE 0)'
+    if len(names) == 1:
+        return names[0]
+    return '(' + ' UNION ALL '.join(f'SELECT {wanted} FROM {name}' for name in names) + ')'
+
+
+def expand(conn, sql, since_ms=None, until_ms=None):
+    """Fill {crowd_data}-style placeholders in `sql` with pruned sources.
+
+    Each source carries the table's columns that the statement mentions
+    (all of them for SELECT *).
+    """
+    sources = {}
+    for table in TABLES:
+        if '{' + table + '}' in sql:
+            sources[table] = source(conn, table, _mentioned(sql, table), since_ms, until_ms)
+    return sql.format(**sources)
+
+
+_mentioned_cache = {}
+
+
+def _mentioned(sql, table):
+    key = (sql, table)
+    found = _mentioned_cache.get(key)
+    if found is None:
+        if re.search(r'SELECT\s+\*', sql, re.IGNORECASE):
+            found = tuple(column_names(table))
+        else:
+            found = tuple(c for c in column_names(table) if re.search(rf'\b{c}\b', sql))
+        _mentioned_cache[key] = found
+    return found
+
+
+# Writes
+def insert(conn, table, rows, ensure=True):
+    """Insert rows that already carry ids, routed to their day's partition"""
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(day_of(row['ts']), []).append(row)
+    columns = column_names(table)
+    for day, day_rows in by_day.items():
+        name = create_partition(conn, table, day) if ensure else partition_name(table, day)
+        conn.executemany(
+            f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})",
+            day_rows)
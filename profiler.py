@@ -0,0 +1,272 @@
+"""Sampled per-request SQL profiler and slow-query log.
+
+Off unless CROWD_SQL_PROFILE is set. Then a CROWD_SQL_PROFILE_SAMPLE
+fraction of requests is profiled: every statement their pool connections
+run is timed (execute plus fetching), with rows returned, rows changed and
+the SQLite VM instructions it took (counted through a progress handler, in
+thousands; the closest thing to "rows scanned" SQLite exposes to Python).
+Time spent waiting for a pool connection or the writer lock is recorded
+too, so a slow endpoint can be told apart from a blocked one.
+
+Statements slower than CROWD_SLOW_SQL_MS get their EXPLAIN QUERY PLAN
+captured before the connection goes back to the pool, and are written as
+JSON lines to a rotating log (CROWD_SLOW_SQL_LOG, default slow_sql.log
+next to the database). Totals per (endpoint, statement) and the recent
+slow statements are served by /api/sql-profile.
+
+    CROWD_SQL_PROFILE=1 CROWD_SQL_PROFILE_SAMPLE=0.05 python app.py
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+ENABLED = os.environ.get('CROWD_SQL_PROFILE', '').lower() not in ('', '0', 'false', 'no')
+SAMPLE_RATE = float(os.environ.get('CROWD_SQL_PROFILE_SAMPLE', 0.05))
+SLOW_MS = float(os.environ.get('CROWD_SLOW_SQL_MS', 50))
+LOG_PATH = os.environ.get('CROWD_SLOW_SQL_LOG')
+LOG_MAX_BYTES = int(os.environ.get('CROWD_SLOW_SQL_LOG_MB', 10)) * 1024 * 1024
+LOG_BACKUPS = 5
+
+# The progress handler fires every PROGRESS_STEPS VM instructions
+PROGRESS_STEPS = 1000
+MAX_STATEMENTS = 500
+RECENT_SLOW = 100
+MAX_PARAMS_CHARS = 200
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class Statement:
+    __slots__ = ('conn', 'sql', 'params', 'seconds', 'rows', 'changed', 'steps', 'plan', 'done')
+
+    def __init__(self, conn, sql, params):
+        self.conn = conn
+        self.sql = sql
+        self.params = params
+        self.seconds = 0.0
+        self.rows = 0
+        self.changed = None
+        self.steps = 0
+        self.plan = None
+        self.done = False
+
+
+class RequestProfile:
+    __slots__ = ('endpoint', 'method', 'started', 'statements', 'steps', 'wait_ms')
+
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.started = time.perf_counter()
+        self.statements = []
+        self.steps = 0
+        self.wait_ms = {'reader': 0.0, 'writer': 0.0}
+
+    def tick(self):
+        # Progress handler: returning 0 lets the statement continue
+        self.steps += 1
+        return 0
+
+
+class _State(threading.local):
+    request = None
+
+
+class Profiler:
+    def __init__(self, enabled=ENABLED, sample_rate=SAMPLE_RATE, slow_ms=SLOW_MS, log_path=LOG_PATH):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self._local = _State()
+        self._lock = threading.Lock()
+        self._totals = {}      # (endpoint, sql) -> [calls, seconds, max seconds, rows, steps]
+        self._slow = deque(maxlen=RECENT_SLOW)
+        self._logger = None
+        self._stats = {'requests_seen': 0, 'requests_profiled': 0, 'statements': 0, 'slow_statements': 0,
+                       'plans_failed': 0, 'untracked_statements': 0}
+
+    # Request lifecycle (Flask hooks in app.py)
+    def begin(self, endpoint, method):
+        if not self.enabled:
+            return
+        self._stats['requests_seen'] += 1
+        if random.random() < self.sample_rate:
+            self._local.request = RequestProfile(endpoint, method)
+        else:
+            self._local.request = None
+
+    def end(self, status):
+        request = self._local.request
+        if request is None:
+            return
+        self._local.request = None
+        for statement in request.statements:
+            if not statement.done:
+                self._finish(request, statement, None)
+        with self._lock:
+            self._stats['requests_profiled'] += 1
+            self._stats['statements'] += len(request.statements)
+        request_ms = (time.perf_counter() - request.started) * 1000
+        sql_ms = sum(s.seconds for s in request.statements) * 1000
+        for statement in request.statements:
+            if statement.seconds * 1000 >= self.slow_ms:
+                self._log_slow(request, statement, status, request_ms, sql_ms)
+
+    def current(self):
+        return self._local.request
+
+    # Connection hooks (database.ConnectionPool)
+    def attach(self, conn, kind, waited_ms=0.0):
+        """A pool connection was handed out; count its VM steps for this request"""
+        request = self._local.request
+        if request is None:
+            return
+        request.wait_ms[kind] += waited_ms
+        conn.set_progress_handler(request.tick, PROGRESS_STEPS)
+
+    def detach(self, conn):
+        """The connection goes back: close its statements and explain the slow ones"""
+        request = self._local.request
+        if request is None:
+            return
+        conn.set_progress_handler(None, 0)
+        for statement in request.statements:
+            if statement.conn is conn and not statement.done:
+                self._finish(request, statement, conn)
+
+    # Cursor hooks (database.ProfiledCursor)
+    def statement(self, conn, sql, params):
+        request = self._local.request
+        statement = Statement(conn, sql, params)
+        if request is not None:
+            request.statements.append(statement)
+        else:
+            self._stats['untracked_statements'] += 1
+        return statement
+
+    def steps(self):
+        request = self._local.request
+        return request.steps if request is not None else 0
+
+    def _finish(self, request, statement, conn):
+        statement.done = True
+        key = (request.endpoint, normalize(statement.sql))
+        with self._lock:
+            totals = self._totals.get(key)
+            if totals is None:
+                if len(self._totals) >= MAX_STATEMENTS:
+                    totals = None
+                else:
+                    totals = self._totals[key] = [0, 0.0, 0.0, 0, 0]
+            if totals is not None:
+                totals[0] += 1
+                totals[1] += statement.seconds
+                totals[2] = max(totals[2], statement.seconds)
+                totals[3] += statement.rows
+                totals[4] += statement.steps
+        if conn is not None and statement.seconds * 1000 >= self.slow_ms:
+            statement.plan = self.explain(conn, statement.sql, statement.params)
+
+    def explain(self, conn, sql, params):
+        # The base class execute() skips the timed/profiled cursors
+        try:
+            rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params or ()).fetchall()
+        except sqlite3.Error as e:
+            with self._lock:
+                self._stats['plans_failed'] += 1
+            return [f'(no plan: {e})']
+        return [row[3] for row in rows]
+
+    # Output
+    def _log_slow(self, request, statement, status, request_ms, sql_ms):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'status': status,
+            'sql': normalize(statement.sql),
+            'params': repr(statement.params)[:MAX_PARAMS_CHARS],
+            'ms': round(statement.seconds * 1000, 3),
+            'rows': statement.rows,
+            'changed': statement.changed,
+            'vm_steps_k': statement.steps,
+            'plan': statement.plan,
+            'request_ms': round(request_ms, 3),
+            'request_sql_ms': round(sql_ms, 3),
+            'request_statements': len(request.statements),
+            'reader_wait_ms': round(request.wait_ms['reader'], 3),
+            'writer_wait_ms': round(request.wait_ms['writer'], 3),
+        }
+        with self._lock:
+            self._slow.append(entry)
+            self._stats['slow_statements'] += 1
+        try:
+            self.logger().info(json.dumps(entry))
+        except OSError as e:
+            print(f"❌ Slow query log failed: {e}")
+
+    def logger(self):
+        if self._logger is None:
+            path = self.log_path
+            if not path:
+                import database
+                path = os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), 'slow_sql.log')
+            logger = logging.getLogger('crowd.slow_sql')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            if not logger.handlers:
+                handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+            self.log_path = path
+            self._logger = logger
+        return self._logger
+
+    def report(self, limit=20):
+        """Settings, counters, the costliest statements and the recent slow ones"""
+        with self._lock:
+            totals = list(self._totals.items())
+            slow = list(self._slow)
+            stats = dict(self._stats)
+        top = sorted(totals, key=lambda item: item[1][1], reverse=True)[:limit]
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow_ms,
+            'log_path': self.log_path,
+            'stats': stats,
+            'top_statements': [{
+                'endpoint': endpoint,
+                'sql': sql,
+                'calls': calls,
+                'total_ms': round(seconds * 1000, 3),
+                'avg_ms': round(seconds / calls * 1000, 3),
+                'max_ms': round(longest * 1000, 3),
+                'avg_rows': round(rows / calls, 1),
+                'avg_vm_steps_k': round(steps / calls, 1),
+            } for (endpoint, sql), (calls, seconds, longest, rows, steps) in top],
+            'recent_slow': slow[::-1],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._slow.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+
+
+profiler = Profiler()
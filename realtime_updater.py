@@ -0,0 +1,379 @@
+"""Group-commit ingestion daemon for live sensor readings.
+
+Producers (the simulator below, the HTTP ingest route) push readings into a
+bounded in-memory queue and return immediately. A single writer thread
+drains it in batches, flushing when `batch_size` rows are waiting or the
+oldest row has waited `flush_ms`, so thousands of readings share one
+transaction instead of paying a commit each. When the queue is full,
+producers block (or time out with QueueFull) until the writer catches up.
+
+    python realtime_updater.py                  # demo: one batch a minute
+    python realtime_updater.py --rate 5000      # synthetic load, readings/s
+"""
+
+import argparse
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import alerts
+import database
+import emissions
+import ingest
+import locations
+import migrate
+import rollups
+import sensors
+
+
+class QueueFull(RuntimeError):
+    """Raised when a producer gives up waiting for room in the queue"""
+
+
+class IngestionDaemon:
+    def __init__(self, max_pending=50000, batch_size=5000, flush_ms=100):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+
+        self._pending = deque()       # (seq, table, row, queued_at, ticket of its submission)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._committed_seq = 0
+        self._thread = None
+        self._stopping = False
+
+        self._stats = {
+            'submitted': 0,
+            'committed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'batches': 0,
+            'blocked_producers': 0,
+            'blocked_seconds': 0.0,
+            'peak_depth': 0,
+            'commit_ms_last': 0.0,
+            'commit_ms_max': 0.0,
+            'commit_ms_total': 0.0,
+            'last_error': None,
+        }
+        self._rate = deque(maxlen=600)   # (commit time, rows) for the rate window
+        self._failures = deque(maxlen=100)   # (first seq, last seq) of failed batches
+
+    # Producers
+    def submit(self, crowd=(), mobility=(), carbon=(), timeout=None):
+        """Queue a batch of readings; returns a ticket for wait_committed().
+
+        Blocks while the queue is full. With a timeout, raises QueueFull if
+        no room frees up in time (nothing from the batch is queued then);
+        also raised once stop() has been called.
+        """
+        rows = [(table, row) for table, batch in zip(ingest.TABLES, (crowd, mobility, carbon))
+                for row in batch]
+        if not rows:
+            return self._seq
+        if len(rows) > self.max_pending:
+            raise ValueError(f'batch of {len(rows)} rows exceeds the queue size ({self.max_pending})')
+        self.start()
+        with self._cond:
+            if len(self._pending) + len(rows) > self.max_pending:
+                self._stats['blocked_producers'] += 1
+                started = time.perf_counter()
+                self._cond.wait_for(
+                    lambda: len(self._pending) + len(rows) <= self.max_pending or self._stopping, timeout)
+                self._stats['blocked_seconds'] += time.perf_counter() - started
+            if self._stopping:
+                raise QueueFull('ingest daemon is stopping')
+            if len(self._pending) + len(rows) > self.max_pending:
+                self._stats['rejected'] += len(rows)
+                raise QueueFull(f'ingest queue full ({self.max_pending} rows pending)')
+            now = time.monotonic()
+            ticket = self._seq + len(rows)
+            for table, row in rows:
+                self._seq += 1
+                self._pending.append((self._seq, table, row, now, ticket))
+            self._stats['submitted'] += len(rows)
+            self._stats['peak_depth'] = max(self._stats['peak_depth'], len(self._pending))
+            self._cond.notify_all()
+            return self._seq
+
+    def wait_committed(self, ticket, timeout=None):
+        """Wait until every row up to `ticket` has been written (or failed)"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._committed_seq >= ticket, timeout)
+
+    def failed(self, first, last):
+        """Whether any row with a ticket in [first, last] was lost to a failed batch"""
+        return any(lo <= last and hi >= first for lo, hi in list(self._failures))
+
+    def flush(self, timeout=None):
+        """Wait for everything queued so far"""
+        with self._cond:
+            ticket = self._seq
+        return self.wait_committed(ticket, timeout)
+
+    # Writer
+    def _take_batch(self):
+        """Block until a batch is due, then pop it.
+
+        A batch holds whole submissions only, so each one commits or fails
+        as a unit; one larger than batch_size makes a batch on its own.
+        """
+        with self._cond:
+            while True:
+                if self._pending:
+                    if len(self._pending) >= self.batch_size or self._stopping:
+                        break
+                    due = self._pending[0][3] + self.flush_ms / 1000
+                    wait = due - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+            batch = []
+            while self._pending:
+                seq, _, _, _, ticket = self._pending[0]
+                # Sequence numbers within a submission are contiguous and end at its ticket
+                if batch and len(batch) + ticket - seq + 1 > self.batch_size:
+                    break
+                while self._pending and self._pending[0][4] == ticket:
+                    batch.append(self._pending.popleft())
+            self._cond.notify_all()
+            return batch
+
+    def _commit(self, rows):
+        tables = {table: [] for table in ingest.TABLES}
+        for _, table, row, _, _ in rows:
+            tables[table].append(row)
+        started = time.perf_counter()
+        with database.write_connection() as conn:
+            ingest.write_readings(conn, *tables.values())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ingest.notify(*tables.values())
+
+        with self._cond:
+            self._stats['batches'] += 1
+            self._stats['committed'] += len(rows)
+            self._stats['commit_ms_last'] = round(elapsed_ms, 3)
+            self._stats['commit_ms_max'] = max(self._stats['commit_ms_max'], round(elapsed_ms, 3))
+            self._stats['commit_ms_total'] += elapsed_ms
+            self._rate.append((time.monotonic(), len(rows)))
+
+    def _fail(self, rows, e):
+        with self._cond:
+            self._stats['failed'] += len(rows)
+            self._stats['last_error'] = str(e)
+            self._failures.append((rows[0][0], rows[-1][0]))
+        print(f"❌ Ingest batch of {len(rows)} rows failed: {e}")
+
+    def _write(self, batch):
+        try:
+            self._commit(batch)
+            return
+        except Exception as e:
+            error = e
+        # The rolled-back batch may have opened alerts that don't exist; let them reload
+        alerts.engine.reset()
+        submissions = {}
+        for entry in batch:
+            submissions.setdefault(entry[4], []).append(entry)
+        if len(submissions) == 1:
+            self._fail(batch, error)
+            return
+        # One bad submission shouldn't fail the others it was batched with
+        print(f"⚠️ Ingest batch of {len(batch)} rows failed ({error}); retrying each submission alone")
+        for rows in submissions.values():
+            try:
+                self._commit(rows)
+            except Exception as e:
+                self._fail(rows, e)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self._write(batch)
+            with self._cond:
+                self._committed_seq = batch[-1][0]
+                self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Write out what is queued, then stop the writer thread"""
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self, window=10.0):
+        """Counters plus the commit rate over the last `window` seconds"""
+        now = time.monotonic()
+        with self._cond:
+            stats = dict(self._stats)
+            depth = len(self._pending)
+            oldest = now - self._pending[0][3] if self._pending else 0.0
+            recent = sum(rows for at, rows in self._rate if now - at <= window)
+        batches = stats['batches']
+        stats.update({
+            'queue_depth': depth,
+            'queue_capacity': self.max_pending,
+            'oldest_pending_ms': round(oldest * 1000, 1),
+            'rows_per_second': round(recent / window, 1),
+            'commit_ms_avg': round(stats.pop('commit_ms_total') / batches, 3) if batches else 0.0,
+            'blocked_seconds': round(stats['blocked_seconds'], 3),
+            'batch_size': self.batch_size,
+            'flush_ms': self.flush_ms,
+        })
+        return stats
+
+
+def simulate_readings(timestamp=None):
+    """One round of simulated gate, vehicle and CO2 readings"""
+    timestamp = timestamp or datetime.now()
+    ts = int(timestamp.timestamp() * 1000)
+    location_names = ["Stadium Main Gate", "Parking Lot A", "Metro Station", "Bus Terminal"]
+    vehicle_types = ["Car", "Bus", "EV", "Bike", "Taxi"]
+    sources = ["Transport", "Energy", "Commercial"]
+    current_hour = timestamp.hour
+    crowd_rows = []
+    mobility_rows = []
+    carbon_rows = []
+
+    # Add crowd data
+    for location in location_names:
+        # Peak hours adjustment
+        base_hour_factor = 1.0
+        if 8 <= current_hour <= 10:
+            base_hour_factor = 1.5
+        elif 17 <= current_hour <= 20:
+            base_hour_factor = 1.8
+        elif 0 <= current_hour <= 5:
+            base_hour_factor = 0.4
+
+        density = min(1.0, random.uniform(0.3, 0.7) * base_hour_factor)
+        crowd_rows.append({
+            'location': location, 'density': density, 'ts': ts,
+            # Left to the alert engine, which flags outliers on write
+            'anomaly': 0,
+            'emotion_score': random.uniform(0.5, 0.9), 'category': 'realtime'
+        })
+
+    # Add mobility data (emission factors from emissions.py)
+    for _ in range(5):
+        vehicle = random.choice(vehicle_types)
+        distance = round(random.uniform(5, 20), 2)
+        mobility_rows.append({
+            'vehicle_type': vehicle, 'route': f"Route {random.choice(['A', 'B', 'C', 'D'])}",
+            'co2_emission': emissions.co2_for(vehicle, distance),
+            'distance': distance, 'ts': ts,
+            'speed': random.uniform(20, 60), 'status': random.choice(['moving', 'idle', 'slow'])
+        })
+
+    # Add carbon data, higher during peak hours
+    for location in location_names[:2]:
+        base_co2 = random.uniform(350, 550)
+        if 8 <= current_hour <= 10 or 17 <= current_hour <= 20:
+            base_co2 *= 1.3
+        carbon_rows.append({
+            'location': location, 'co2_level': round(base_co2, 2), 'ts': ts,
+            'source': random.choice(sources), 'trend': random.choice(['increasing', 'stable', 'decreasing'])
+        })
+
+    return crowd_rows, mobility_rows, carbon_rows
+
+
+def run_simulator(daemon, interval=60.0, rate=None, tick=0.1):
+    """Feed the daemon: one round per `interval`, or about `rate` readings/s"""
+    try:
+        if rate is None:
+            while True:
+                crowd, mobility, carbon = simulate_readings()
+                daemon.submit(crowd, mobility, carbon)
+                print(f"✅ Queued real-time data at {datetime.now().strftime('%H:%M:%S')}")
+                time.sleep(interval)
+        _run_at_rate(daemon, rate, tick)
+    except QueueFull:
+        # The daemon is shutting down
+        return
+
+
+def _run_at_rate(daemon, rate, tick):
+    produced = 0
+    started = time.monotonic()
+    while True:
+        # Catch up to the target rate a batch at a time; submit() blocks
+        # when the writer falls behind, which throttles this loop
+        target = int((time.monotonic() - started) * rate)
+        batch = ([], [], [])
+        size = 0
+        now = datetime.now()
+        while produced + size < target and size < daemon.batch_size:
+            for rows, new in zip(batch, simulate_readings(now)):
+                rows.extend(new)
+                size += len(new)
+        if size:
+            daemon.submit(*batch)
+            produced += size
+        if produced >= target:
+            time.sleep(tick)
+
+
+def start(interval=60.0, rate=None, daemon=None):
+    """Run the simulator on a background thread; returns (daemon, thread)"""
+    # Rollups are updated with every batch; make sure they (and the current schema) exist first
+    with database.write_connection() as conn:
+        migrate.migrate(conn)
+        rollups.ensure(conn)
+        locations.ensure(conn)
+        sensors.ensure(conn)
+        alerts.ensure(conn)
+    daemon = daemon or IngestionDaemon()
+    daemon.start()
+    thread = threading.Thread(target=run_simulator, args=(daemon, interval, rate), daemon=True)
+    thread.start()
+    return daemon, thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Feed simulated readings through the group-commit writer')
+    parser.add_argument('--interval', type=float, default=60.0, help='seconds between simulated rounds')
+    parser.add_argument('--rate', type=float, help='target readings per second (overrides --interval)')
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows per group commit')
+    parser.add_argument('--flush-ms', type=float, default=100, help='max time a row waits for a commit')
+    parser.add_argument('--max-pending', type=int, default=50000, help='queue size before producers block')
+    parser.add_argument('--report', type=float, default=10.0, help='seconds between stats lines')
+    args = parser.parse_args(argv)
+
+    daemon = IngestionDaemon(args.max_pending, args.batch_size, args.flush_ms)
+    start(args.interval, args.rate, daemon)
+    cadence = f"{args.rate:,.0f} readings/s" if args.rate else f"every {args.interval:g}s"
+    print(f"🚀 Ingestion daemon writing to {database.DB_PATH} ({cadence})")
+    print("Press Ctrl+C to stop\n")
+
+    try:
+        while True:
+            time.sleep(args.report)
+            s = daemon.stats(args.report)
+            print(f"📈 {s['rows_per_second']:,.0f} rows/s | {s['committed']:,} committed | "
+                  f"queue {s['queue_depth']:,}/{s['queue_capacity']:,} | "
+                  f"commit {s['commit_ms_avg']:.1f} ms avg, {s['commit_ms_max']:.1f} ms max")
+    except KeyboardInterrupt:
+        print("\n🛑 Flushing queued readings...")
+        daemon.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""Response cache for the polled GET API routes.
+
+Entries are keyed by path and query arguments and stay valid until their
+TTL runs out or the ingestion watermark moves (the last row id of every
+reading table, see partitions.last_ids()), whichever comes first. The
+watermark is bumped in-process by ingest.notify() and re-read from the
+database at most every `watermark_ms`, which also catches rows from other
+writer processes. Identical misses arriving together wait for the first
+one instead of recomputing, and the cache is an LRU bounded by body bytes.
+
+Every cached body carries a strong ETag (a hash of its bytes), so a poller
+that sends If-None-Match gets a bodyless 304 until the data changes.
+Compressed variants (see serialization.py) are made once per entry and
+carry their own ETag.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+import database
+import ingest
+import partitions
+import serialization
+
+
+class Entry:
+    __slots__ = ('watermark', 'expires', 'body', 'status', 'mimetype', 'etag', 'variants')
+
+    def __init__(self, watermark, expires, body, status, mimetype):
+        self.watermark = watermark
+        self.expires = expires
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.variants = {}
+
+    def encoded(self, encoding):
+        """(body, etag, encoding) in a content coding, compressed on first use"""
+        if encoding is None or len(self.body) < serialization.COMPRESS_MIN_BYTES:
+            return self.body, self.etag, None
+        variant = self.variants.get(encoding)
+        if variant is None:
+            variant = self.variants[encoding] = (serialization.compress(self.body, encoding),
+                                                 f'{self.etag}-{encoding}', encoding)
+        return variant
+
+
+class Watermark:
+    """Last committed row id per reading table, refreshed lazily"""
+
+    def __init__(self, refresh_ms=500):
+        self.refresh_ms = refresh_ms
+        self._value = None
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._value
+
+    def bump(self, crowd=(), mobility=(), carbon=()):
+        # ingest listener: this process just committed, re-read on next use
+        self._read_at = 0.0
+
+    def _stale(self):
+        return self._value is None or time.monotonic() - self._read_at >= self.refresh_ms / 1000
+
+    def current(self):
+        if not self._stale():
+            return self._value
+        with self._lock:
+            if self._stale():
+                try:
+                    with database.read_connection() as conn:
+                        ids = partitions.last_ids(conn)
+                except sqlite3.OperationalError:
+                    # No schema yet (create_database.py has not run)
+                    ids = {}
+                self._value = tuple(ids.get(table, 0) for table in partitions.TABLES)
+                self._read_at = time.monotonic()
+        return self._value
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, watermark_ms=500):
+        self.max_bytes = max_bytes
+        self.watermark = Watermark(watermark_ms)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'not_modified': 0,
+            'expired': 0,
+            'invalidated': 0,
+            'evicted': 0,
+            'coalesced': 0,
+        }
+
+    # Storage
+    def _get(self, key, watermark):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.watermark != watermark or entry.expires <= time.monotonic():
+                self._stats['invalidated' if entry.watermark != watermark else 'expired'] += 1
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def _put(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._bytes += len(entry.body)
+            while self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= len(old.body)
+                self._stats['evicted'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # Lookup
+    def fetch(self, key, ttl, compute):
+        """(entry, hit) for `key`, calling compute() -> (body, status, mimetype) on a miss"""
+        watermark = self.watermark.current()
+        entry = self._get(key, watermark)
+        if entry is not None:
+            self._count('hits')
+            return entry, True
+
+        # Single flight: the first miss computes, the rest wait for it
+        with self._lock:
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                self._inflight[key] = threading.Event()
+        if waiter is not None:
+            waiter.wait()
+            entry = self._get(key, watermark)
+            if entry is not None:
+                self._count('coalesced')
+                return entry, True
+
+        self._count('misses')
+        try:
+            body, status, mimetype = compute()
+            entry = Entry(watermark, time.monotonic() + ttl, body, status, mimetype)
+            if status == 200:
+                self._put(key, entry)
+        finally:
+            if waiter is None:
+                with self._lock:
+                    self._inflight.pop(key).set()
+        return entry, False
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+            used = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'entries': entries,
+            'bytes': used,
+            'max_bytes': self.max_bytes,
+            'hit_ratio': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            'watermark': dict(zip(partitions.TABLES, self.watermark.value or ())),
+        })
+        return stats
+
+    # Flask integration
+    def cached(self, ttl):
+        """Route decorator: serve from the cache and answer If-None-Match with 304"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+
+                def compute():
+                    response = make_response(view(*args, **kwargs))
+                    return response.get_data(), response.status_code, response.mimetype
+
+                entry, hit = self.fetch(key, ttl, compute)
+                if entry.status != 200:
+                    return Response(entry.body, status=entry.status, mimetype=entry.mimetype)
+                body, etag, encoding = entry.encoded(
+                    serialization.choose_encoding(request.headers.get('Accept-Encoding')))
+                response = Response(body, status=entry.status, mimetype=entry.mimetype)
+                if encoding:
+                    response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+                response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+                response.make_conditional(request)
+                if response.status_code == 304:
+                    self._count('not_modified')
+                return response
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache(
+    max_bytes=int(os.environ.get('CROWD_CACHE_MB', 32)) * 1024 * 1024,
+    watermark_ms=int(os.environ.get('CROWD_CACHE_WATERMARK_MS', 500)),
+)
+ingest.subscribe(response_cache.watermark.bump)
+cached = response_cache.cached
@@ -0,0 +1,233 @@
+"""Retention for the day-partitioned reading tables.
+
+Raw readings are kept for CROWD_HOT_DAYS days. Older days are copied to a
+per-day archive file (CROWD_ARCHIVE_DIR, empty to skip archiving) and their
+partition is dropped, which costs the same however many rows it held.
+Alerts expire with the raw rows. Summaries outlive them: minute rollups are
+kept for CROWD_MINUTE_ROLLUP_DAYS, hour rollups for CROWD_HOUR_ROLLUP_DAYS
+and day rollups forever. Freed pages go back to the OS with incremental vacuum, a
+few MB per writer turn so ingestion keeps flowing.
+
+    python retention.py                   # apply the policy once
+    python retention.py --dry-run         # show what would expire
+    python retention.py --enable-vacuum   # one-off VACUUM to turn on incremental vacuum
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+import database
+import partitions
+import rollups
+
+HOT_DAYS = int(os.environ.get('CROWD_HOT_DAYS', 30))
+MINUTE_ROLLUP_DAYS = int(os.environ.get('CROWD_MINUTE_ROLLUP_DAYS', 7))
+HOUR_ROLLUP_DAYS = int(os.environ.get('CROWD_HOUR_ROLLUP_DAYS', 90))
+ARCHIVE_DIR = os.environ.get('CROWD_ARCHIVE_DIR')
+MAINTENANCE_INTERVAL = float(os.environ.get('CROWD_MAINTENANCE_INTERVAL', 3600))
+
+# Pages released per writer turn (4 KB pages -> 8 MB)
+VACUUM_STEP_PAGES = 2048
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def archive_dir():
+    """Where expired days go; None when archiving is turned off"""
+    if ARCHIVE_DIR is None:
+        return os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), 'archive')
+    return ARCHIVE_DIR or None
+
+
+def oldest_kept_ms(today=None, hot_days=None):
+    """Start of the oldest day the hot window keeps; anything earlier is (or will be) archived"""
+    today = today or date.today()
+    return partitions.day_bounds(today - timedelta(days=HOT_DAYS if hot_days is None else hot_days))[0]
+
+
+def expired_days(conn, today=None, hot_days=None):
+    """{table: [days]} of partitions older than the hot window"""
+    today = today or date.today()
+    cutoff = today - timedelta(days=HOT_DAYS if hot_days is None else hot_days)
+    return {table: [day for day in partitions.days(conn, table) if day < cutoff]
+            for table in partitions.TABLES}
+
+
+def archive_partition(table, day, directory):
+    """Copy one day's partition into <directory>/<YYYY-MM-DD>.db.
+
+    Expired days no longer receive writes, so the copy runs on its own
+    connection without holding the writer. Rows are added to what the
+    archive already holds for the day (ids are global, so a partition
+    archived twice keeps one copy of each row).
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = partitions.partition_name(table, day)
+    conn = sqlite3.connect(os.path.join(directory, f'{day}.db'))
+    try:
+        conn.execute('ATTACH DATABASE ? AS live', (database.DB_PATH,))
+        conn.execute(partitions.table_sql(f'main.{name}', table))
+        conn.execute(f'INSERT OR IGNORE INTO main.{name} SELECT * FROM live.{name}')
+        conn.commit()
+        conn.execute('DETACH DATABASE live')
+    finally:
+        conn.close()
+
+
+def prune_rollups(conn, today=None):
+    """Delete minute/hour rollup buckets past their retention; returns rows deleted"""
+    today = today or date.today()
+    deleted = 0
+    for grain, days in (('minute', MINUTE_ROLLUP_DAYS), ('hour', HOUR_ROLLUP_DAYS)):
+        # Bucket labels start with the date, so the cutoff is a primary-key range
+        cutoff = str(today - timedelta(days=days))
+        for spec in rollups.ROLLUPS.values():
+            deleted += conn.execute(f"DELETE FROM {spec['table']} WHERE grain = ? AND bucket < ?",
+                                    (grain, cutoff)).rowcount
+    return deleted
+
+
+def prune_alerts(conn, today=None, hot_days=None):
+    """Delete alerts last seen before the hot window (last_ts index range)"""
+    today = today or date.today()
+    cutoff = today - timedelta(days=HOT_DAYS if hot_days is None else hot_days)
+    return conn.execute('DELETE FROM alerts WHERE last_ts < ?', (partitions.day_bounds(cutoff)[0],)).rowcount
+
+
+def enable_incremental_vacuum(conn):
+    """Switch auto_vacuum to INCREMENTAL; rewrites the file once if it was off"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return False
+    conn.commit()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+
+def incremental_vacuum(step_pages=VACUUM_STEP_PAGES):
+    """Hand free pages back to the OS in small writer turns; returns pages freed"""
+    freed = 0
+    while True:
+        with database.write_connection() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                return freed
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not before:
+                return freed
+            conn.execute(f'PRAGMA incremental_vacuum({step_pages})').fetchall()
+            freed += before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def run(today=None, dry_run=False):
+    """Apply the retention policy once; returns a summary dict"""
+    started = time.perf_counter()
+    directory = archive_dir()
+    with database.read_connection() as conn:
+        expired = expired_days(conn, today)
+    summary = {'dropped': [], 'archived': [], 'rollup_rows_deleted': 0, 'alerts_deleted': 0,
+               'pages_freed': 0, 'archive_dir': directory}
+    if dry_run:
+        summary['dropped'] = [partitions.partition_name(t, d) for t, days in expired.items() for d in days]
+        return summary
+
+    for table, days in expired.items():
+        for day in days:
+            name = partitions.partition_name(table, day)
+            if directory:
+                archive_partition(table, day, directory)
+                summary['archived'].append(name)
+            with database.write_connection() as conn:
+                partitions.drop_partition(conn, table, day)
+            summary['dropped'].append(name)
+
+    with database.write_connection() as conn:
+        summary['rollup_rows_deleted'] = prune_rollups(conn, today)
+        summary['alerts_deleted'] = prune_alerts(conn, today)
+    summary['pages_freed'] = incremental_vacuum()
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def storage_stats(conn):
+    """File, free-list and partition figures for /api/storage-stats"""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return {
+        'db_bytes': page_size * page_count,
+        'free_bytes': page_size * freelist,
+        'incremental_vacuum': conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL,
+        'partitions': {
+            table: {'count': len(days), 'oldest': str(days[0]) if days else None,
+                    'newest': str(days[-1]) if days else None}
+            for table, days in ((t, partitions.days(conn, t)) for t in partitions.TABLES)
+        },
+        'policy': {
+            'hot_days': HOT_DAYS,
+            'minute_rollup_days': MINUTE_ROLLUP_DAYS,
+            'hour_rollup_days': HOUR_ROLLUP_DAYS,
+            'archive_dir': archive_dir(),
+            'interval_seconds': MAINTENANCE_INTERVAL,
+        },
+    }
+
+
+def _report(summary):
+    if summary['dropped']:
+        print(f"🧹 Retention dropped {len(summary['dropped'])} partitions "
+              f"({len(summary['archived'])} archived to {summary['archive_dir']})")
+    if summary['rollup_rows_deleted'] or summary['pages_freed']:
+        print(f"🧹 Pruned {summary['rollup_rows_deleted']} rollup rows, freed {summary['pages_freed']} pages")
+
+
+def start(interval=None):
+    """Background thread applying the policy every `interval` seconds"""
+    interval = MAINTENANCE_INTERVAL if interval is None else interval
+
+    def maintain():
+        while True:
+            try:
+                _report(run())
+            except Exception as e:
+                print(f"❌ Retention run failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=maintain, name='retention', daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Expire old day partitions and rollups')
+    parser.add_argument('--db', default=database.DB_PATH)
+    parser.add_argument('--dry-run', action='store_true', help='only list the partitions that would expire')
+    parser.add_argument('--enable-vacuum', action='store_true',
+                        help='VACUUM once so dropped partitions shrink the file')
+    args = parser.parse_args(argv)
+    database.DB_PATH = args.db
+
+    if args.enable_vacuum:
+        conn = sqlite3.connect(args.db)
+        try:
+            started = time.perf_counter()
+            if enable_incremental_vacuum(conn):
+                print(f"✅ Incremental vacuum enabled ({time.perf_counter() - started:.1f}s)")
+            else:
+                print("✅ Incremental vacuum already enabled")
+        finally:
+            conn.close()
+
+    summary = run(dry_run=args.dry_run)
+    if args.dry_run:
+        print('\n'.join(summary['dropped']) or "Nothing to expire")
+    else:
+        _report(summary)
+        print(f"✅ Retention done in {summary['seconds']}s")
+
+
+if __name__ == '__main__':
+    main()
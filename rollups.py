@@ -0,0 +1,147 @@
+"""Minute/hour/day aggregates of the raw reading tables.
+
+Each raw table has a rollup table keyed by (grain, bucket, key) holding the
+count, sum, min, max and anomaly count of its main value. Buckets are local
+time strings truncated to the grain (readings themselves carry epoch-ms ts),
+so day and hour labels follow the venue's wall clock.
+Rollups are updated in the same transaction as the inserts (see ingest.py)
+and can be rebuilt from history with backfill().
+"""
+
+from datetime import datetime
+
+# Readings above this CO2 level count as carbon anomalies (same rule as the dashboard)
+CO2_HIGH = 500
+
+GRAINS = {
+    'minute': 16,   # 'YYYY-MM-DD HH:MM'
+    'hour': 13,     # 'YYYY-MM-DD HH'
+    'day': 10,      # 'YYYY-MM-DD'
+}
+
+ROLLUPS = {
+    'crowd_data': {
+        'table': 'crowd_rollup',
+        'key': 'location',
+        'value': 'density',
+        'anomaly_sql': 'anomaly',
+        'is_anomaly': lambda row: 1 if row.get('anomaly') else 0,
+    },
+    'mobility_data': {
+        'table': 'mobility_rollup',
+        'key': 'vehicle_type',
+        'value': 'co2_emission',
+        'anomaly_sql': '0',
+        'is_anomaly': lambda row: 0,
+    },
+    'carbon_data': {
+        'table': 'carbon_rollup',
+        'key': 'source',
+        'value': 'co2_level',
+        'anomaly_sql': f'co2_level > {CO2_HIGH}',
+        'is_anomaly': lambda row: 1 if row['co2_level'] > CO2_HIGH else 0,
+    },
+}
+
+
+# Epoch-ms ts -> local 'YYYY-MM-DD HH:MM:SS' in SQL, for backfills
+LOCAL_TIME_SQL = "datetime(ts / 1000, 'unixepoch', 'localtime')"
+
+
+def local_time(ts):
+    """Local 'YYYY-MM-DD HH:MM:SS' for an epoch-ms ts"""
+    return str(datetime.fromtimestamp(ts // 1000))
+
+
+def bucket_of(ts, grain):
+    """Bucket label of an epoch-ms ts"""
+    return local_time(ts)[:GRAINS[grain]]
+
+
+def create_tables(conn):
+    for spec in ROLLUPS.values():
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {spec['table']} (
+            grain TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            {spec['key']} TEXT NOT NULL,
+            readings INTEGER NOT NULL,
+            total REAL NOT NULL,
+            minimum REAL NOT NULL,
+            maximum REAL NOT NULL,
+            anomalies INTEGER NOT NULL,
+            PRIMARY KEY (grain, bucket, {spec['key']})
+        ) WITHOUT ROWID
+        ''')
+
+
+def record(conn, table, rows):
+    """Fold freshly inserted rows into the rollups with one upsert per bucket"""
+    if not rows:
+        return
+    spec = ROLLUPS[table]
+    key, value, is_anomaly = spec['key'], spec['value'], spec['is_anomaly']
+
+    buckets = {}
+    labels = {}
+    for row in rows:
+        # Rows in a batch mostly share a handful of seconds
+        second = row['ts'] // 1000
+        timestamp = labels.get(second)
+        if timestamp is None:
+            timestamp = labels[second] = local_time(row['ts'])
+        v = row[value]
+        a = is_anomaly(row)
+        for grain, width in GRAINS.items():
+            k = (grain, timestamp[:width], row[key])
+            agg = buckets.get(k)
+            if agg is None:
+                buckets[k] = [1, v, v, v, a]
+            else:
+                agg[0] += 1
+                agg[1] += v
+                if v < agg[2]:
+                    agg[2] = v
+                if v > agg[3]:
+                    agg[3] = v
+                agg[4] += a
+
+    conn.executemany(f'''
+    INSERT INTO {spec['table']} (grain, bucket, {key}, readings, total, minimum, maximum, anomalies)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (grain, bucket, {key}) DO UPDATE SET
+        readings = readings + excluded.readings,
+        total = total + excluded.total,
+        minimum = MIN(minimum, excluded.minimum),
+        maximum = MAX(maximum, excluded.maximum),
+        anomalies = anomalies + excluded.anomalies
+    ''', [k + tuple(agg) for k, agg in buckets.items()])
+
+
+def backfill(conn):
+    """Rebuild every rollup from the raw tables"""
+    create_tables(conn)
+    for table, spec in ROLLUPS.items():
+        conn.execute(f"DELETE FROM {spec['table']}")
+        for grain, width in GRAINS.items():
+            conn.execute(f'''
+            INSERT INTO {spec['table']} (grain, bucket, {spec['key']}, readings, total, minimum, maximum, anomalies)
+            SELECT ?, substr({LOCAL_TIME_SQL}, 1, {width}) AS bucket, {spec['key']},
+                   COUNT(*), SUM({spec['value']}), MIN({spec['value']}), MAX({spec['value']}),
+                   SUM({spec['anomaly_sql']})
+            FROM {table}
+            GROUP BY bucket, {spec['key']}
+            ''', (grain,))
+
+
+def ensure(conn):
+    """Create the rollup tables and backfill them if they are still empty"""
+    create_tables(conn)
+    for table, spec in ROLLUPS.items():
+        has_rollups = conn.execute(f"SELECT 1 FROM {spec['table']} LIMIT 1").fetchone()
+        has_rows = conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+        if has_rows and not has_rollups:
+            print("📊 Backfilling rollups from history...")
+            backfill(conn)
+            return True
+    return False
@@ -0,0 +1,362 @@
+"""Modal-shift emission scenarios over recent mobility_data.
+
+A scenario is a list of shifts such as "20% of Car trips on Route B move
+to Metro" ({'from': 'Car', 'to': 'Metro', 'share': 0.2, 'routes':
+['Route B']}, optionally limited to some hours of the day). A moved trip
+keeps its distance and is priced with the target mode's emission factor
+(see emissions.py), so it changes CO2 by share * (factor_to * distance -
+co2). That is linear in distance and CO2, which lets the engine work on
+sums instead of trips:
+
+1. The window's trips are loaded as columns (from the hot store when it
+   holds the range, else from SQLite) and reduced with np.bincount to a
+   vehicle x route x hour-of-day cube of trips, km and kg CO2. Cubes add
+   up, so SQLite windows are summed from one cube per day partition, and
+   a partition is read again only once it has gained rows.
+2. Every shift of every scenario becomes one row of a (shifts, vehicles,
+   routes, hours) array of moved shares; one broadcast against the cube
+   prices them all, and np.add.at folds the rows into their scenarios.
+
+Cubes are cached per window and ingestion watermark (for at most
+CUBE_SECONDS) and results per window, watermark and scenario batch, so a
+dashboard re-asking the same questions costs a dict lookup until new
+trips arrive.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import emissions
+import hot_store
+import partitions
+
+DEFAULT_HOURS = 168
+MAX_HOURS = 90 * 24
+MAX_SCENARIOS = 1000
+MAX_SHIFTS = 20
+CUBE_SECONDS = 60
+MAX_RESULTS = 128
+LOAD_CHUNK_ROWS = 50000
+MAX_PARTITIONS = 200
+
+COLUMNS_SQL = 'SELECT vehicle_type, route, distance, co2_emission, ts FROM {partition}'
+
+
+class Cube:
+    """Trips, km and kg CO2 per (vehicle, route, hour of day) over one window"""
+
+    def __init__(self, vehicles, routes, trips, distance, co2, since_ms):
+        self.vehicles = vehicles
+        self.routes = routes
+        self.trips = trips
+        self.distance = distance
+        self.co2 = co2
+        self.since_ms = since_ms
+        self.built = time.monotonic()
+
+    @classmethod
+    def from_columns(cls, vehicle_codes, vehicles, route_codes, routes, distance, co2, ts, since_ms):
+        import numpy as np
+        shape = (len(vehicles), len(routes), 24)
+        # Local hour of day, converted once per distinct UTC hour
+        utc_hours, inverse = np.unique(ts // 3_600_000, return_inverse=True)
+        local = np.array([datetime.fromtimestamp(int(h) * 3600).hour for h in utc_hours], dtype=np.int64)
+        cell = np.ravel_multi_index((vehicle_codes, route_codes, local[inverse]), shape)
+        size = int(np.prod(shape))
+
+        def total(weights=None):
+            return np.bincount(cell, weights=weights, minlength=size).reshape(shape).astype(np.float64)
+
+        return cls(vehicles, routes, total(), total(distance), total(co2), since_ms)
+
+    @classmethod
+    def combine(cls, cubes, vehicles, routes, since_ms):
+        """Sum of cubes built against (prefixes of) the same vehicle and route lists"""
+        import numpy as np
+        shape = (len(vehicles), len(routes), 24)
+        totals = [np.zeros(shape) for _ in range(3)]
+        for cube in cubes:
+            V, R = cube.key()
+            for total, part in zip(totals, (cube.trips, cube.distance, cube.co2)):
+                total[:V, :R] += part
+        return cls(list(vehicles), list(routes), *totals, since_ms)
+
+    def key(self):
+        return len(self.vehicles), len(self.routes)
+
+
+def hot_cube(hot, since_ms, vehicles, routes):
+    """The cube for trips with ts >= since_ms from the hot store, coded with our dictionaries"""
+    import numpy as np
+    data, values = hot.select_coded('mobility_data', ('vehicle_type', 'route', 'distance', 'co2_emission'),
+                                    since_ms)
+    vehicle_codes = np.array(vehicles.encode(values['vehicle_type']), dtype=np.int64)
+    route_codes = np.array(routes.encode(values['route']), dtype=np.int64)
+    return Cube.from_columns(vehicle_codes[data['vehicle_type']], list(vehicles.values),
+                             route_codes[data['route']], list(routes.values),
+                             data['distance'].astype(np.float64), data['co2_emission'].astype(np.float64),
+                             data['ts'], since_ms)
+
+
+def partition_cube(conn, name, since_ms, vehicles, routes):
+    """The cube for one partition's trips with ts >= since_ms (all of them for 0), read in chunks"""
+    import numpy as np
+    columns = ([], [], [], [], [])
+    # A whole partition is a plain table scan, cheaper than walking the ts index
+    if since_ms:
+        cursor = conn.execute(COLUMNS_SQL.format(partition=name) + ' WHERE ts >= ?', (since_ms,))
+    else:
+        cursor = conn.execute(COLUMNS_SQL.format(partition=name))
+    while True:
+        chunk = cursor.fetchmany(LOAD_CHUNK_ROWS)
+        if not chunk:
+            break
+        vehicle, route, distance, co2, ts = zip(*chunk)
+        columns[0].append(np.array(vehicles.encode(vehicle), dtype=np.int64))
+        columns[1].append(np.array(routes.encode(route), dtype=np.int64))
+        columns[2].append(np.array(distance, dtype=np.float64))
+        columns[3].append(np.array(co2, dtype=np.float64))
+        columns[4].append(np.array(ts, dtype=np.int64))
+    vehicle, route, ts = (np.concatenate(parts) if parts else np.empty(0, np.int64) for parts in
+                          (columns[0], columns[1], columns[4]))
+    distance, co2 = (np.concatenate(parts) if parts else np.empty(0) for parts in (columns[2], columns[3]))
+    return Cube.from_columns(vehicle, list(vehicles.values), route, list(routes.values), distance, co2, ts, since_ms)
+
+
+def parse_scenarios(scenarios):
+    """Validated [{'name', 'shifts': [{'from', 'to', 'share', 'routes', 'hours'}]}]"""
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ValueError("scenarios must be a non-empty list")
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(f"at most {MAX_SCENARIOS} scenarios per request")
+    parsed = []
+    for i, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict) or not isinstance(scenario.get('shifts'), list):
+            raise ValueError(f"scenario {i} needs a list of shifts")
+        if not 1 <= len(scenario['shifts']) <= MAX_SHIFTS:
+            raise ValueError(f"scenario {i} needs 1 to {MAX_SHIFTS} shifts")
+        shifts = []
+        for shift in scenario['shifts']:
+            if not isinstance(shift, dict) or not shift.get('from') or not shift.get('to'):
+                raise ValueError(f"scenario {i}: every shift needs 'from' and 'to'")
+            if not isinstance(shift['from'], str) or not isinstance(shift['to'], str):
+                raise ValueError(f"scenario {i}: 'from' and 'to' must be vehicle type names")
+            emissions.factor(shift['to'])
+            try:
+                if isinstance(shift.get('share'), bool):
+                    raise TypeError
+                share = float(shift.get('share', 1.0))
+            except (TypeError, ValueError):
+                raise ValueError(f"scenario {i}: share must be a number")
+            if not 0 <= share <= 1:
+                raise ValueError(f"scenario {i}: share must be between 0 and 1")
+            hours = shift.get('hours')
+            if hours is not None and not (isinstance(hours, list) and all(
+                    isinstance(h, int) and not isinstance(h, bool) and 0 <= h <= 23 for h in hours)):
+                raise ValueError(f"scenario {i}: hours must be a list of hours of the day (0-23)")
+            routes = shift.get('routes')
+            if isinstance(routes, str):
+                routes = [routes]
+            if routes is not None and not (isinstance(routes, list) and all(isinstance(r, str) for r in routes)):
+                raise ValueError(f"scenario {i}: routes must be a route name or a list of them")
+            shifts.append({'from': shift['from'], 'to': shift['to'], 'share': share,
+                           'routes': sorted(routes) if routes else None,
+                           'hours': sorted(set(hours)) if hours is not None else None})
+        parsed.append({'name': str(scenario.get('name') or f'scenario {i + 1}'), 'shifts': shifts})
+    return parsed
+
+
+def evaluate(cube, scenarios):
+    """CO2 deltas of parsed scenarios against a cube, in one vectorized pass"""
+    import numpy as np
+    V, R = cube.key()
+    shifts = [(s, shift) for s, scenario in enumerate(scenarios) for shift in scenario['shifts']]
+    K = len(shifts)
+    # Target modes without trips in the window still get a column of their own
+    names = list(cube.vehicles) + sorted({shift['to'] for _, shift in shifts} - set(cube.vehicles))
+    vehicles = {name: i for i, name in enumerate(names)}
+    routes = {name: i for i, name in enumerate(cube.routes)}
+
+    # Moved share of each (vehicle, route, hour) cell, one row per shift
+    owner = np.array([s for s, _ in shifts], dtype=np.int64)
+    share = np.array([shift['share'] for _, shift in shifts])
+    to_factor = np.array([emissions.factor(shift['to']) for _, shift in shifts])
+    from_mask = np.zeros((K, V))
+    route_mask = np.ones((K, R))
+    hour_mask = np.ones((K, 24))
+    to_index = np.array([vehicles[shift['to']] for _, shift in shifts], dtype=np.int64)
+    for k, (_, shift) in enumerate(shifts):
+        if vehicles.get(shift['from'], V) < V:
+            from_mask[k, vehicles[shift['from']]] = 1
+        if shift['routes'] is not None:
+            route_mask[k] = 0
+            route_mask[k, [routes[r] for r in shift['routes'] if r in routes]] = 1
+        if shift['hours'] is not None:
+            hour_mask[k] = 0
+            hour_mask[k, shift['hours']] = 1
+    moved = share[:, None, None, None] * from_mask[:, :, None, None] * route_mask[:, None, :, None] \
+        * hour_mask[:, None, None, :]
+
+    # Shifts of one scenario can't move more than every trip in a cell
+    total_moved = np.zeros((len(scenarios), V, R, 24))
+    np.add.at(total_moved, owner, moved)
+    over = np.flatnonzero((total_moved > 1 + 1e-9).any(axis=(1, 2, 3)))
+    if len(over):
+        raise ValueError(f"scenario {scenarios[over[0]]['name']!r} moves more than all of some trips")
+
+    removed = moved * cube.co2                                              # (K, V, R, H) kg leaving the source
+    added = (moved * cube.distance).sum(axis=1) * to_factor[:, None, None]  # (K, R, H) kg on the target mode
+    trips_moved = (moved * cube.trips).sum(axis=(1, 2, 3))
+
+    by_route_hour = np.zeros((len(scenarios), R, 24))
+    np.add.at(by_route_hour, owner, added - removed.sum(axis=1))
+    by_vehicle = np.zeros((len(scenarios), len(names)))
+    np.add.at(by_vehicle[:, :V], owner, -removed.sum(axis=(2, 3)))
+    np.add.at(by_vehicle, (owner, to_index), added.sum(axis=(1, 2)))
+    moved_trips = np.zeros(len(scenarios))
+    np.add.at(moved_trips, owner, trips_moved)
+
+    baseline = float(cube.co2.sum())
+    results = []
+    for s, scenario in enumerate(scenarios):
+        delta = float(by_route_hour[s].sum())
+        results.append({
+            'name': scenario['name'],
+            'co2': round(baseline + delta, 3),
+            'delta': round(delta, 3),
+            'delta_pct': round(delta / baseline * 100, 2) if baseline else None,
+            'trips_moved': round(float(moved_trips[s]), 1),
+            'by_route': {name: round(float(by_route_hour[s, i].sum()), 3) for i, name in enumerate(cube.routes)},
+            'by_vehicle': {name: round(float(by_vehicle[s, i]), 3) for i, name in enumerate(names)
+                           if by_vehicle[s, i]},
+            'by_hour': [round(float(v), 3) for v in by_route_hour[s].sum(axis=0)],
+        })
+    return results
+
+
+class ScenarioEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Cube builds take turns: they share the dictionaries and the partition cubes
+        self._build_lock = threading.Lock()
+        self._vehicles = hot_store.Dictionary()
+        self._routes = hot_store.Dictionary()
+        # (partition, since_ms) -> (its largest id when read, cube)
+        self._partitions = OrderedDict()
+        self._cubes = OrderedDict()
+        self._results = OrderedDict()
+        self._stats = {'requests': 0, 'result_hits': 0, 'cube_builds': 0, 'cube_seconds': None,
+                       'partition_reads': 0, 'partition_hits': 0, 'hot_builds': 0,
+                       'evaluations': 0, 'scenarios_evaluated': 0, 'evaluate_seconds': None}
+
+    def load(self, conn, since_ms, hot=None):
+        """The cube for trips with ts >= since_ms.
+
+        From the hot store when it holds the range; otherwise summed from
+        per-partition cubes, each re-read only when its partition gained
+        rows, so after an ingest just the current day is scanned again.
+        """
+        if hot is not None and hot.covers(since_ms):
+            self._stats['hot_builds'] += 1
+            return hot_cube(hot, since_ms, self._vehicles, self._routes)
+        first = partitions.day_of(since_ms)
+        cubes = []
+        wanted = set()
+        for day in partitions.days(conn, 'mobility_data'):
+            if day < first:
+                continue
+            name = partitions.partition_name('mobility_data', day)
+            # Only the first partition is cut by the window
+            key = (name, since_ms if day == first else 0)
+            wanted.add(key)
+            last_id = conn.execute(f'SELECT MAX(id) FROM {name}').fetchone()[0]
+            cached = self._partitions.get(key)
+            if cached is not None and cached[0] == last_id:
+                self._partitions.move_to_end(key)
+                self._stats['partition_hits'] += 1
+            else:
+                cached = self._partitions[key] = (last_id, partition_cube(conn, name, key[1], self._vehicles,
+                                                                          self._routes))
+                self._stats['partition_reads'] += 1
+            cubes.append(cached[1])
+        # Keep what this window used plus the most recent of the rest
+        for key in list(self._partitions)[:max(0, len(self._partitions) - MAX_PARTITIONS)]:
+            if key not in wanted:
+                del self._partitions[key]
+        return Cube.combine(cubes, self._vehicles.values, self._routes.values, since_ms)
+
+    def cube(self, conn, hours, watermark, hot=None):
+        # Whole hours, so the partially read first partition stays reusable within the hour
+        since_ms = (int(time.time()) // 3600 - hours) * 3_600_000
+        key = (since_ms, watermark)
+        with self._lock:
+            cube = self._cubes.get(key)
+            if cube is not None and time.monotonic() - cube.built < CUBE_SECONDS:
+                return cube
+        with self._build_lock:
+            started = time.perf_counter()
+            cube = self.load(conn, since_ms, hot)
+        with self._lock:
+            self._cubes[key] = cube
+            while len(self._cubes) > 8:
+                self._cubes.popitem(last=False)
+            self._stats['cube_builds'] += 1
+            self._stats['cube_seconds'] = round(time.perf_counter() - started, 4)
+        return cube
+
+    def run(self, conn, scenarios, hours=DEFAULT_HOURS, watermark=None, hot=None):
+        """Baseline and per-scenario CO2 deltas over the last `hours`; cached per watermark"""
+        if not 1 <= hours <= MAX_HOURS:
+            raise ValueError(f"hours must be between 1 and {MAX_HOURS}")
+        scenarios = parse_scenarios(scenarios)
+        batch = hashlib.blake2b(json.dumps(scenarios, sort_keys=True).encode(), digest_size=16).hexdigest()
+        key = (hours, watermark, batch)
+        with self._lock:
+            self._stats['requests'] += 1
+            result = self._results.get(key)
+            if result is not None and time.monotonic() - result[0] < CUBE_SECONDS:
+                self._results.move_to_end(key)
+                self._stats['result_hits'] += 1
+                return dict(result[1], cached=True)
+
+        cube = self.cube(conn, hours, watermark, hot)
+        started = time.perf_counter()
+        evaluated = evaluate(cube, scenarios)
+        seconds = time.perf_counter() - started
+        result = {
+            'window': {'hours': hours, 'since': datetime.fromtimestamp(cube.since_ms / 1000).isoformat(),
+                       'trips': int(cube.trips.sum())},
+            'baseline': {
+                'co2': round(float(cube.co2.sum()), 3),
+                'by_route': {name: round(float(cube.co2[:, i].sum()), 3) for i, name in enumerate(cube.routes)},
+                'by_vehicle': {name: round(float(cube.co2[i].sum()), 3) for i, name in enumerate(cube.vehicles)},
+                'by_hour': [round(float(v), 3) for v in cube.co2.sum(axis=(0, 1))],
+            },
+            'factors': emissions.FACTORS,
+            'scenarios': evaluated,
+            'seconds': round(seconds, 4),
+        }
+        with self._lock:
+            self._results[key] = (time.monotonic(), result)
+            while len(self._results) > MAX_RESULTS:
+                self._results.popitem(last=False)
+            self._stats['evaluations'] += 1
+            self._stats['scenarios_evaluated'] += len(scenarios)
+            self._stats['evaluate_seconds'] = round(seconds, 4)
+        return dict(result, cached=False)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cached_cubes=len(self._cubes), cached_partitions=len(self._partitions),
+                        cached_results=len(self._results))
+
+
+engine = ScenarioEngine()
+
+
+def stats():
+    return engine.stats()
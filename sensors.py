@@ -0,0 +1,186 @@
+"""Sensor registry with an R-tree index on position.
+
+Crowd readings name their sensor in the `location` column, so a sensor is
+a location with map coordinates. `sensors` holds every positioned sensor
+(seeded from the located rows of `locations`; venue deployments register
+hundreds with `python sensors.py import`), and `sensor_index` is an SQLite
+R-tree over the same ids, so a map viewport is an index lookup however
+many sensors there are. SQLite builds without the rtree module get a
+(lat, lng) index instead.
+
+Bounding boxes follow Leaflet's toBBoxString(): 'west,south,east,north'.
+
+    python sensors.py import sensors.csv          # columns: name,lat,lng
+    python sensors.py list --bbox 77.59,12.97,77.61,12.98
+"""
+
+import argparse
+import csv
+import json
+import sqlite3
+import time
+
+import database
+import locations
+
+UPSERT_SQL = '''
+    INSERT INTO sensors (name, lat, lng, updated) VALUES (?, ?, ?, ?)
+    ON CONFLICT (name) DO UPDATE SET lat = excluded.lat, lng = excluded.lng, updated = excluded.updated
+    RETURNING id
+'''
+
+# R-tree boxes are 32-bit floats rounded outwards, so within() re-checks
+# the exact coordinates of what the index returns
+RTREE_SQL = '''
+    SELECT s.id, s.name, s.lat, s.lng
+    FROM sensor_index i
+    JOIN sensors s ON s.id = i.id
+    WHERE i.max_lng >= ? AND i.min_lng <= ? AND i.max_lat >= ? AND i.min_lat <= ?
+'''
+
+SCAN_SQL = '''
+    SELECT id, name, lat, lng
+    FROM sensors
+    WHERE lng BETWEEN ? AND ? AND lat BETWEEN ? AND ?
+'''
+
+
+def create_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sensors (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        lat REAL NOT NULL,
+        lng REAL NOT NULL,
+        updated INTEGER NOT NULL
+    )
+    ''')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS sensor_index '
+                     'USING rtree(id, min_lng, max_lng, min_lat, max_lat)')
+    except sqlite3.OperationalError:
+        # This SQLite build has no rtree module
+        conn.execute('CREATE INDEX IF NOT EXISTS sensors_position ON sensors (lng, lat)')
+
+
+def has_rtree(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sensor_index'").fetchone() is not None
+
+
+def check_position(lat, lng):
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"({lat}, {lng}) is not a valid position")
+    return lat, lng
+
+
+def register(conn, sensors):
+    """Add or move sensors given as (name, lat, lng); returns how many were written"""
+    now_ms = int(time.time() * 1000)
+    rtree = has_rtree(conn)
+    count = 0
+    for name, lat, lng in sensors:
+        if not name:
+            raise ValueError("sensor name is required")
+        lat, lng = check_position(lat, lng)
+        (sensor_id,) = conn.execute(UPSERT_SQL, (name, lat, lng, now_ms)).fetchone()
+        if rtree:
+            conn.execute('INSERT OR REPLACE INTO sensor_index VALUES (?, ?, ?, ?, ?)',
+                         (sensor_id, lng, lng, lat, lat))
+        # The map's location list shows the same coordinates
+        conn.execute('INSERT INTO locations (name, lat, lng) VALUES (?, ?, ?) '
+                     'ON CONFLICT (name) DO UPDATE SET lat = excluded.lat, lng = excluded.lng', (name, lat, lng))
+        locations._registered.add(name)
+        count += 1
+    return count
+
+
+def reindex(conn):
+    """Rebuild sensor_index from sensors"""
+    conn.execute('DELETE FROM sensor_index')
+    conn.execute('INSERT INTO sensor_index SELECT id, lng, lng, lat, lat FROM sensors')
+
+
+def ensure(conn):
+    """Create the tables, seed them from located locations and repair the index"""
+    create_tables(conn)
+    if not conn.execute('SELECT 1 FROM sensors LIMIT 1').fetchone():
+        seeded = register(conn, conn.execute('SELECT name, lat, lng FROM locations '
+                                             'WHERE lat IS NOT NULL AND lng IS NOT NULL').fetchall())
+        if seeded:
+            print(f"📡 Registered {seeded} sensors from known locations")
+    if has_rtree(conn):
+        indexed = conn.execute('SELECT COUNT(*) FROM sensor_index').fetchone()[0]
+        if indexed != conn.execute('SELECT COUNT(*) FROM sensors').fetchone()[0]:
+            reindex(conn)
+
+
+def version(conn):
+    """Changes whenever a sensor is added or moved"""
+    return tuple(conn.execute('SELECT COUNT(*), MAX(updated) FROM sensors').fetchone())
+
+
+def all_sensors(conn):
+    """(id, name, lat, lng) of every sensor"""
+    return conn.execute('SELECT id, name, lat, lng FROM sensors ORDER BY id').fetchall()
+
+
+def parse_bbox(value):
+    """'west,south,east,north' -> (west, south, east, north)"""
+    try:
+        west, south, east, north = (float(part) for part in (value or '').split(','))
+    except ValueError:
+        raise ValueError("bbox must be 'west,south,east,north'")
+    check_position(south, west)
+    check_position(north, east)
+    if west > east or south > north:
+        raise ValueError("bbox must have west <= east and south <= north")
+    return west, south, east, north
+
+
+def within(conn, bbox):
+    """(id, name, lat, lng) of the sensors inside bbox (west, south, east, north)"""
+    west, south, east, north = bbox
+    rows = conn.execute(RTREE_SQL if has_rtree(conn) else SCAN_SQL, (west, east, south, north)).fetchall()
+    return [tuple(row) for row in rows if west <= row[3] <= east and south <= row[2] <= north]
+
+
+def read_file(path):
+    """(name, lat, lng) rows from a CSV with a name,lat,lng header or a JSON list of objects"""
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            records = json.load(f)
+        else:
+            records = list(csv.DictReader(f))
+    try:
+        return [(record['name'], record['lat'], record['lng']) for record in records]
+    except KeyError as e:
+        raise ValueError(f"every sensor needs name, lat and lng (missing {e})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the sensor registry')
+    parser.add_argument('--db', default=database.DB_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('import', help='register or move sensors from a CSV or JSON file')
+    load.add_argument('file')
+    listing = commands.add_parser('list', help='print registered sensors')
+    listing.add_argument('--bbox', type=parse_bbox, help="only those inside 'west,south,east,north'")
+    args = parser.parse_args(argv)
+    database.DB_PATH = args.db
+
+    if args.command == 'import':
+        sensors = read_file(args.file)
+        with database.write_connection() as conn:
+            ensure(conn)
+            count = register(conn, sensors)
+        print(f"✅ Registered {count} sensors")
+    else:
+        with database.read_connection() as conn:
+            rows = within(conn, args.bbox) if args.bbox else all_sensors(conn)
+        for sensor_id, name, lat, lng in rows:
+            print(f"{sensor_id:>6}  {lat:>10.5f} {lng:>10.5f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
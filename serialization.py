@@ -0,0 +1,132 @@
+"""JSON encoding, columnar payloads and response compression for the API.
+
+The JSON encoder is pluggable through CROWD_JSON_ENCODER: 'orjson' (used
+by default when the package is installed) serializes straight to bytes and
+is several times faster than the stdlib encoder Flask ships with; 'stdlib'
+keeps Flask's own provider. Both sort keys and fall back to Flask's
+handling of dates, decimals and dataclasses, so payloads are identical.
+
+Large series can be requested as columns (?format=columnar): one array per
+field plus the time base and step, instead of a dict per point. JSON
+bodies over CROWD_COMPRESS_MIN_BYTES are compressed with brotli (when the
+package is installed) or gzip, whichever the client accepts.
+"""
+
+import gzip
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('CROWD_COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+FORMATS = ('rows', 'columnar')
+
+
+# Encoders
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+
+    def _option(self, kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=self._option(kwargs)).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._option({'indent': indent}))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+ENCODERS = {'stdlib': DefaultJSONProvider}
+if orjson is not None:
+    ENCODERS['orjson'] = OrjsonProvider
+
+
+def install(app, name=None):
+    """Set the app's JSON provider; returns the encoder name in use"""
+    name = name or os.environ.get('CROWD_JSON_ENCODER', 'auto')
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in ENCODERS else 'stdlib'
+    if name not in ENCODERS:
+        raise ValueError(f"JSON encoder must be one of {', '.join(ENCODERS)} (is the package installed?)")
+    app.json = ENCODERS[name](app)
+    return name
+
+
+# Payload shapes
+def parse_format(value):
+    value = value or 'rows'
+    if value not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    return value
+
+
+def to_columns(rows, keys):
+    """[{k: v}, ...] -> {k: [v, ...]} for the given keys"""
+    return {key: [row[key] for row in rows] for key in keys}
+
+
+# Compression
+def choose_encoding(accept_encoding):
+    """Best content coding the client accepts, or None"""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compressible(response):
+    return (response.status_code == 200 and not response.direct_passthrough
+            and not response.is_streamed and 'Content-Encoding' not in response.headers
+            and response.mimetype in ('application/json', 'text/csv', 'text/plain'))
+
+
+def compress_response(response, accept_encoding):
+    """after_request hook: compress eligible bodies the client can decode.
+
+    Cached routes arrive already encoded (see response_cache.py), so the
+    ETag they were validated against matches the body sent.
+    """
+    if not compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None or response.content_length is None or response.content_length < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,153 @@
+"""Pre-forked API workers sharing one listening socket, plus a writer process.
+
+`python app.py` serves everything from one process, so reads never use more
+than one core. Here the master imports the app once, binds the port, starts
+the single writer process (ingest_server.py: migrations, retention and the
+group-commit daemon) and forks --workers copies of the app in the 'reader'
+role. Every worker accepts from the shared socket and reads the database
+through its own connection pool; /api/ingest in any worker forwards the
+readings to the writer over a unix socket, and the in-memory sliding window
+and hot store are kept once, in the writer, and read over the same socket. Workers that die are restarted,
+and SIGTERM/Ctrl+C stops the workers before the writer flushes its queue.
+
+    python serve.py --workers 4 --port 5000
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+from multiprocessing.connection import wait
+
+import ingest_server
+
+DEFAULT_WORKERS = int(os.environ.get('CROWD_WORKERS', os.cpu_count() or 1))
+RESTART_DELAY = 1.0
+STOP_TIMEOUT = 15.0
+
+
+def bind(host, port, backlog=1024):
+    """The listening socket every worker accepts from"""
+    sock = socket.create_server((host, port), backlog=backlog)
+    # All workers wake for a new connection; the ones that lose the accept()
+    # get EAGAIN and go back to waiting instead of blocking in accept()
+    sock.setblocking(False)
+    return sock
+
+
+def run_worker(sock, host, port, config, access_log=True):
+    """Worker process: build the reader app and serve the inherited socket"""
+    from werkzeug.serving import make_server
+
+    import app as app_module
+
+    # Forked with the master's SIGTERM -> KeyboardInterrupt handler; a worker
+    # just exits when stopped
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    application = app_module.create_app(config)
+    app_module.init_database('reader')
+    if not access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server(host, port, application, threaded=True, fd=sock.fileno())
+    print(f"👷 Worker {os.getpid()} serving http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def start_writer(context, address, authkey):
+    writer = context.Process(target=ingest_server.run, args=(address, authkey), name='crowd-writer')
+    writer.start()
+    if not ingest_server.wait_ready(address, authkey=authkey):
+        writer.terminate()
+        raise RuntimeError(f'writer process did not come up on {address}')
+    return writer
+
+
+def stop(processes, timeout=STOP_TIMEOUT):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the API from pre-forked workers and one writer process')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('CROWD_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='API worker processes')
+    parser.add_argument('--writer-address', help='unix socket for the writer (default: a temp path)')
+    parser.add_argument('--stream-interval', type=float, default=5.0, help='seconds between stream ticks')
+    parser.add_argument('--no-access-log', action='store_true', help="don't log every request")
+    args = parser.parse_args(argv)
+
+    # Preload: the workers are forked with Flask and every route already
+    # imported. Nothing here opens the database, so no connection crosses
+    # a fork.
+    import app  # noqa: F401
+
+    context = multiprocessing.get_context('fork')
+    address = args.writer_address or os.path.join(tempfile.gettempdir(), f'crowd-writer-{os.getpid()}.sock')
+    authkey = os.urandom(32)
+    config = {
+        'ROLE': 'reader',
+        'WRITER_ADDRESS': address,
+        'WRITER_AUTHKEY': authkey,
+        'STREAM_INTERVAL': args.stream_interval,
+    }
+
+    print(f"🚀 Starting Crowd Mobility Analyzer with {args.workers} workers...")
+    writer = start_writer(context, address, authkey)
+    sock = bind(args.host, args.port)
+    workers = {}
+
+    def spawn(slot):
+        worker = context.Process(target=run_worker, name=f'crowd-worker-{slot}',
+                                 args=(sock, args.host, args.port, config, not args.no_access_log))
+        worker.start()
+        workers[slot] = worker
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        for slot in range(args.workers):
+            spawn(slot)
+        print(f"🌐 Server starting on http://127.0.0.1:{args.port}")
+        while True:
+            wait([writer.sentinel] + [worker.sentinel for worker in workers.values()], timeout=1.0)
+            if not writer.is_alive():
+                # Workers reconnect to the new writer on their next call
+                print(f"❌ Writer process exited ({writer.exitcode}); restarting")
+                time.sleep(RESTART_DELAY)
+                writer = start_writer(context, address, authkey)
+            for slot, worker in list(workers.items()):
+                if not worker.is_alive():
+                    print(f"❌ Worker {worker.pid} exited ({worker.exitcode}); restarting")
+                    time.sleep(RESTART_DELAY)
+                    spawn(slot)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping workers...")
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        stop(list(workers.values()))
+        stop([writer])
+        sock.close()
+        if os.path.exists(address):
+            os.unlink(address)
+
+
+if __name__ == '__main__':
+    main()
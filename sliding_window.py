@@ -0,0 +1,232 @@
+"""In-memory 5-minute window behind /api/realtime-metrics.
+
+A ring buffer of per-second buckets keeps running sums and counts, so the
+metrics endpoint answers in O(1) without a query. The window is fed by
+ingest listeners for rows written in this process; rows written by another
+process (e.g. create_database.py's updater) are picked up by a background
+follower that tails the tables by id.
+"""
+
+import threading
+import time
+from collections import Counter
+
+import database
+import ingest
+import partitions
+
+TABLES = ingest.TABLES
+
+# Fields kept per second: crowd count/sum/anomalies, trips/co2,
+# carbon count/sum
+FIELDS = ('crowd_n', 'density_sum', 'anomalies', 'trips', 'co2_sum', 'carbon_n', 'co2_level_sum')
+
+# Loading the window (range scan on the ts index) and tailing other writers
+# (range scan on the primary key); {table} is filled in by partitions.expand()
+SINCE_SQL = 'SELECT * FROM {{{table}}} WHERE ts >= ?'
+TAIL_SQL = 'SELECT * FROM {{{table}}} WHERE id > ? ORDER BY id'
+
+
+def _now_second():
+    return int(time.time())
+
+
+class SlidingWindow:
+    """Running aggregates over the last `seconds` seconds"""
+
+    def __init__(self, seconds=300):
+        self.seconds = seconds
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        n = self.seconds
+        self._slot_second = [None] * n
+        self._slots = {field: [0] * n for field in FIELDS}
+        self._vehicles = [None] * n
+        self._totals = dict.fromkeys(FIELDS, 0)
+        self._vehicle_totals = Counter()
+        self._head = None
+        self.last_ids = dict.fromkeys(TABLES, 0)
+        self.ready = False
+
+    def _evict(self, i):
+        for field in FIELDS:
+            self._totals[field] -= self._slots[field][i]
+            self._slots[field][i] = 0
+        if self._vehicles[i]:
+            self._vehicle_totals.subtract(self._vehicles[i])
+            self._vehicles[i] = None
+        self._slot_second[i] = None
+
+    def _advance(self, now):
+        """Evict every slot that has fallen out of the window ending at `now`"""
+        if self._head is None:
+            self._head = now
+            return
+        if now <= self._head:
+            return
+        if now - self._head >= self.seconds:
+            for i in range(self.seconds):
+                if self._slot_second[i] is not None:
+                    self._evict(i)
+        else:
+            for second in range(self._head + 1, now + 1):
+                i = second % self.seconds
+                if self._slot_second[i] is not None:
+                    self._evict(i)
+        self._head = now
+
+    def _slot(self, second):
+        """Slot index for `second`, or None if it is outside the window"""
+        if second > self._head:
+            self._advance(second)
+        if second <= self._head - self.seconds:
+            return None
+        i = second % self.seconds
+        if self._slot_second[i] != second:
+            if self._slot_second[i] is not None:
+                self._evict(i)
+            self._slot_second[i] = second
+        return i
+
+    def _add(self, i, field, value):
+        self._slots[field][i] += value
+        self._totals[field] += value
+
+    def _apply(self, crowd, mobility, carbon):
+        for row in crowd:
+            i = self._slot(row['ts'] // 1000)
+            if i is not None:
+                self._add(i, 'crowd_n', 1)
+                self._add(i, 'density_sum', row['density'])
+                self._add(i, 'anomalies', 1 if row.get('anomaly') else 0)
+        for row in mobility:
+            i = self._slot(row['ts'] // 1000)
+            if i is not None:
+                self._add(i, 'trips', 1)
+                self._add(i, 'co2_sum', row['co2_emission'])
+                if self._vehicles[i] is None:
+                    self._vehicles[i] = Counter()
+                self._vehicles[i][row['vehicle_type']] += 1
+                self._vehicle_totals[row['vehicle_type']] += 1
+        for row in carbon:
+            i = self._slot(row['ts'] // 1000)
+            if i is not None:
+                self._add(i, 'carbon_n', 1)
+                self._add(i, 'co2_level_sum', row['co2_level'])
+
+    def add(self, crowd=(), mobility=(), carbon=()):
+        """Apply a batch of readings; rows with ids advance the tail watermark"""
+        with self._lock:
+            batches = []
+            for table, rows in zip(TABLES, (crowd, mobility, carbon)):
+                # Skip rows the follower and the listener both delivered
+                last_id = self.last_ids[table]
+                rows = [row for row in rows if row.get('id', last_id + 1) > last_id]
+                if rows and 'id' in rows[-1]:
+                    self.last_ids[table] = max(row['id'] for row in rows)
+                batches.append(rows)
+            self._advance(_now_second())
+            self._apply(*batches)
+
+    def on_ingest(self, crowd, mobility, carbon):
+        """Ingest listener: apply in place unless rows from elsewhere slipped in between"""
+        contiguous = all(
+            not rows or rows[0].get('id') == self.last_ids[table] + 1
+            for table, rows in zip(TABLES, (crowd, mobility, carbon))
+        )
+        if contiguous:
+            self.add(crowd, mobility, carbon)
+        else:
+            self.sync()
+
+    def _fetch(self, conn, sql, params, since_ms=None):
+        batches = []
+        for table in TABLES:
+            query = partitions.expand(conn, sql.format(table=table), since_ms)
+            rows = conn.execute(query, params(table)).fetchall()
+            batches.append([dict(row) for row in rows])
+        return batches
+
+    def rebuild(self, conn=None):
+        """Reload the window from the last `seconds` seconds of the database"""
+        def load(conn):
+            since_ms = int((time.time() - self.seconds) * 1000)
+            conn.execute('BEGIN')
+            try:
+                tails = partitions.last_ids(conn)
+                batches = self._fetch(conn, SINCE_SQL, lambda table: (since_ms,), since_ms)
+            finally:
+                conn.rollback()
+            with self._lock:
+                self._reset()
+                self._advance(_now_second())
+                self._apply(*batches)
+                self.last_ids.update(tails)
+                self.ready = True
+
+        if conn is not None:
+            load(conn)
+        else:
+            with database.read_connection() as conn:
+                load(conn)
+
+    def sync(self):
+        """Pull rows other processes wrote since the last seen ids"""
+        with database.read_connection() as conn:
+            last_ids = dict(self.last_ids)
+            batches = self._fetch(conn, TAIL_SQL, lambda table: (last_ids[table],))
+        if any(batches):
+            self.add(*batches)
+
+    def behind(self, last_ids):
+        """Whether the database (last id per table, in TABLES order) has rows not seen yet"""
+        return any(last_id > self.last_ids[table] for table, last_id in zip(TABLES, last_ids))
+
+    def stats(self):
+        """Current aggregates, shaped like the SQL rows they replace"""
+        with self._lock:
+            self._advance(_now_second())
+            t = dict(self._totals)
+            vehicle_types = sum(1 for count in self._vehicle_totals.values() if count > 0)
+        return {
+            'crowd': {
+                'avg_density': t['density_sum'] / t['crowd_n'] if t['crowd_n'] else None,
+                'anomalies': t['anomalies'],
+                'total_readings': t['crowd_n'],
+            },
+            'mobility': {
+                'vehicle_types': vehicle_types,
+                'total_co2': t['co2_sum'] if t['trips'] else None,
+                'trips': t['trips'],
+            },
+            'carbon': {
+                'avg_co2': t['co2_level_sum'] / t['carbon_n'] if t['carbon_n'] else None,
+                'readings': t['carbon_n'],
+            },
+        }
+
+    def start_follower(self, interval=1.0):
+        """Background thread that tails the tables for rows from other writers"""
+        def follow():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"❌ Sliding window sync failed: {e}")
+
+        thread = threading.Thread(target=follow, daemon=True)
+        thread.start()
+        return thread
+
+
+metrics_window = SlidingWindow(300)
+
+
+def start():
+    """Load the window from the database and keep it fed"""
+    metrics_window.rebuild()
+    ingest.subscribe(metrics_window.on_ingest)
+    return metrics_window.start_follower()
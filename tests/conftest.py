@@ -0,0 +1,39 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alerts
+import database
+import locations
+import migrate
+import partitions
+import rollups
+
+
+@pytest.fixture(autouse=True)
+def partition_catalogue(monkeypatch):
+    # partitions.days() caches by schema cookie, which two test files can share
+    monkeypatch.setattr(partitions, '_cache', (None, {}))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Path of an empty database that the shared connection pool points at"""
+    path = str(tmp_path / 'crowd_mobility.db')
+    conn = sqlite3.connect(path)
+    migrate.create_tables(conn)
+    alerts.create_tables(conn)
+    rollups.create_tables(conn)
+    locations.create_tables(conn)
+    conn.commit()
+    conn.close()
+    database.close_pool()
+    monkeypatch.setattr(database, 'DB_PATH', path)
+    alerts.engine.reset()
+    yield path
+    database.close_pool()
@@ -0,0 +1,71 @@
+import csv
+import io
+from datetime import date, datetime
+
+import pytest
+
+import database
+import export
+import ingest
+
+DAYS = (date(2026, 3, 1), date(2026, 3, 2))
+
+
+@pytest.fixture
+def readings(db, monkeypatch):
+    """Ten crowd readings over two days and two locations, paged two rows at a time"""
+    monkeypatch.setattr(export, 'PAGE_ROWS', 2)
+    rows = []
+    for i in range(10):
+        day = DAYS[i // 5]
+        ts = int(datetime(day.year, day.month, day.day, 8 + i).timestamp() * 1000)
+        rows.append({'location': ('Metro Station', 'Food Court')[i % 2], 'density': i / 10, 'ts': ts,
+                     'anomaly': 0, 'emotion_score': 0.5, 'category': 'normal'})
+    with database.write_connection() as conn:
+        ingest.write_readings(conn, crowd=rows)
+
+
+def ids(body):
+    rows = list(csv.reader(io.StringIO(body.decode())))
+    assert rows[0] == ['id', 'location', 'density', 'ts', 'anomaly', 'emotion_score', 'category']
+    return [int(row[0]) for row in rows[1:]]
+
+
+def download(args, blocks=None):
+    """CSV body of an export, cut off after `blocks` blocks; returns (body, last id sent)"""
+    job = export.Export.from_args('crowd', args)
+    job.chunk_rows = 1
+    stream = job.stream()
+    body = b''.join(block for _, block in zip(range(blocks), stream)) if blocks else b''.join(stream)
+    stream.close()
+    return body, job.last_id
+
+
+def test_broken_download_resumes_after_last_id(readings):
+    full, _ = download({})
+    assert ids(full) == list(range(1, 11))
+
+    # Four one-row blocks (the header rides on the first) arrive before the connection drops
+    partial, last_id = download({}, blocks=4)
+    assert ids(partial) == [1, 2, 3, 4] and last_id == 4
+    rest, _ = download({'after_id': str(last_id)})
+    assert ids(partial) + ids(rest) == ids(full)
+
+
+def test_resume_keeps_filters_and_time_range(readings):
+    since = str(int(datetime(2026, 3, 1, 10).timestamp()))
+    args = {'location': 'Metro Station', 'since': since}
+    full, _ = download(args)
+    assert ids(full) == [3, 5, 7, 9]
+
+    partial, last_id = download(args, blocks=2)
+    rest, _ = download({**args, 'after_id': str(last_id)})
+    assert ids(partial) + ids(rest) == [3, 5, 7, 9]
+
+
+def test_limit_and_after_id_are_whole_numbers(readings):
+    body, last_id = download({'after_id': '8', 'limit': '1'})
+    assert ids(body) == [9] and last_id == 9
+    for args in ({'after_id': '-1'}, {'after_id': 'x'}, {'limit': '0'}):
+        with pytest.raises(ValueError):
+            export.Export.from_args('crowd', args)
@@ -0,0 +1,98 @@
+import sqlite3
+from datetime import date, datetime
+
+import migrate
+import partitions
+
+# Version 0: local-time text timestamps in one flat table per kind
+V0_SCHEMA = '''
+CREATE TABLE crowd_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    location TEXT NOT NULL,
+    density REAL NOT NULL,
+    timestamp DATETIME NOT NULL,
+    anomaly INTEGER DEFAULT 0,
+    emotion_score REAL DEFAULT 0.5,
+    category TEXT DEFAULT 'normal'
+);
+CREATE TABLE mobility_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vehicle_type TEXT NOT NULL,
+    route TEXT NOT NULL,
+    co2_emission REAL NOT NULL,
+    distance REAL NOT NULL,
+    timestamp DATETIME NOT NULL,
+    speed REAL DEFAULT 30.0,
+    status TEXT DEFAULT 'moving'
+);
+CREATE TABLE carbon_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    location TEXT NOT NULL,
+    co2_level REAL NOT NULL,
+    timestamp DATETIME NOT NULL,
+    source TEXT NOT NULL,
+    trend TEXT DEFAULT 'stable'
+);
+'''
+
+# Two readings either side of local midnight, ids with a gap
+READINGS = [
+    (3, 'Metro Station', 0.25, datetime(2026, 1, 1, 23, 59, 59, 500000)),
+    (7, 'Food Court', 0.75, datetime(2026, 1, 2, 0, 0, 0, 250000)),
+]
+
+
+def ms(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def connect(tmp_path, schema):
+    conn = sqlite3.connect(str(tmp_path / 'old.db'))
+    conn.executescript(schema)
+    return conn
+
+
+def check_migrated(conn):
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == migrate.SCHEMA_VERSION
+    assert partitions.days(conn, 'crowd_data') == [date(2026, 1, 1), date(2026, 1, 2)]
+    rows = conn.execute('SELECT id, location, density, ts, anomaly, category FROM crowd_data ORDER BY id').fetchall()
+    assert rows == [(id_, location, density, ms(moment), 0, 'normal')
+                    for id_, location, density, moment in READINGS]
+    # Each reading lands in the partition of its local day
+    assert conn.execute('SELECT id FROM crowd_data_p20260101').fetchall() == [(3,)]
+    assert conn.execute('SELECT id FROM crowd_data_p20260102').fetchall() == [(7,)]
+    # No flat tables are left behind, and new ids continue after the old ones
+    assert not conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%_flat'").fetchall()
+    assert partitions.reserve_ids(conn, 'crowd_data', 2) == 8
+
+
+def test_migrates_text_timestamps(tmp_path):
+    conn = connect(tmp_path, V0_SCHEMA)
+    conn.executemany('INSERT INTO crowd_data (id, location, density, timestamp) VALUES (?, ?, ?, ?)',
+                     [(id_, location, density, str(moment)) for id_, location, density, moment in READINGS])
+    conn.commit()
+
+    assert migrate.migrate(conn)
+    conn.commit()
+    check_migrated(conn)
+
+
+def test_migrates_flat_epoch_tables(tmp_path):
+    # Version 1: the same flat tables with ts in place of timestamp
+    conn = connect(tmp_path, V0_SCHEMA.replace('timestamp DATETIME NOT NULL', 'ts INTEGER NOT NULL'))
+    conn.execute('PRAGMA user_version = 1')
+    conn.executemany('INSERT INTO crowd_data (id, location, density, ts) VALUES (?, ?, ?, ?)',
+                     [(id_, location, density, ms(moment)) for id_, location, density, moment in READINGS])
+    conn.commit()
+
+    assert migrate.migrate(conn)
+    conn.commit()
+    check_migrated(conn)
+
+
+def test_current_and_empty_databases_are_left_alone(tmp_path):
+    conn = connect(tmp_path, '')
+    assert not migrate.migrate(conn)
+    migrate.create_tables(conn)
+    assert not migrate.migrate(conn)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == migrate.SCHEMA_VERSION
@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+import database
+import ingest
+import partitions
+
+MARCH_1 = date(2026, 3, 1)
+MARCH_2 = date(2026, 3, 2)
+
+
+def reading(day, hour, density=0.5, location='Metro Station'):
+    ts = int(datetime(day.year, day.month, day.day, hour).timestamp() * 1000)
+    return {'location': location, 'density': density, 'ts': ts, 'anomaly': 0, 'emotion_score': 0.5,
+            'category': 'normal'}
+
+
+def store(*rows):
+    with database.write_connection() as conn:
+        ingest.write_readings(conn, crowd=list(rows))
+
+
+def ids(conn, name):
+    return [row[0] for row in conn.execute(f'SELECT id FROM {name} ORDER BY id')]
+
+
+def test_rows_are_routed_to_their_local_day(db):
+    store(reading(MARCH_1, 23), reading(MARCH_2, 0), reading(MARCH_1, 0))
+
+    with database.read_connection() as conn:
+        assert partitions.days(conn, 'crowd_data') == [MARCH_1, MARCH_2]
+        # Ids are reserved across partitions, in submission order
+        assert ids(conn, 'crowd_data_p20260301') == [1, 3]
+        assert ids(conn, 'crowd_data_p20260302') == [2]
+        assert ids(conn, 'crowd_data') == [1, 2, 3]
+
+
+def test_expand_reads_only_the_days_in_range(db):
+    store(reading(MARCH_1, 12), reading(MARCH_2, 12, density=0.25))
+    since_ms = partitions.day_bounds(MARCH_2)[0]
+
+    with database.read_connection() as conn:
+        sql = partitions.expand(conn, 'SELECT AVG(density) FROM {crowd_data} WHERE ts >= ?', since_ms)
+        assert 'crowd_data_p20260301' not in sql
+        assert conn.execute(sql, (since_ms,)).fetchone()[0] == 0.25
+        # A range with no partitions still gives a valid, empty source
+        sql = partitions.expand(conn, 'SELECT COUNT(*) FROM {crowd_data} WHERE ts >= ?', since_ms + 86400000)
+        assert conn.execute(sql, (since_ms + 86400000,)).fetchone()[0] == 0
+
+
+def test_dropping_a_day(db):
+    store(reading(MARCH_1, 12), reading(MARCH_2, 12))
+
+    with database.write_connection() as conn:
+        partitions.drop_partition(conn, 'crowd_data', MARCH_1)
+
+    with database.read_connection() as conn:
+        assert partitions.days(conn, 'crowd_data') == [MARCH_2]
+        assert ids(conn, 'crowd_data') == [2]
+        assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'crowd_data_p20260301'").fetchone()
+
+    # A reading for the dropped day recreates it without reusing ids
+    store(reading(MARCH_1, 13))
+    with database.read_connection() as conn:
+        assert ids(conn, 'crowd_data_p20260301') == [3]
@@ -0,0 +1,80 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import database
+import ingest
+import partitions
+import retention
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def archive(db, tmp_path, monkeypatch):
+    """Archive directory for a two-day hot window"""
+    directory = str(tmp_path / 'archive')
+    monkeypatch.setattr(retention, 'HOT_DAYS', 2)
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', directory)
+    return directory
+
+
+def ms(day, hour=12):
+    return int(datetime(day.year, day.month, day.day, hour).timestamp() * 1000)
+
+
+def store(*days):
+    rows = [{'location': 'Metro Station', 'density': 0.5, 'ts': ms(day), 'anomaly': 0, 'emotion_score': 0.5,
+             'category': 'normal'} for day in days]
+    with database.write_connection() as conn:
+        ingest.write_readings(conn, crowd=rows)
+
+
+def archived_ids(directory, day):
+    conn = sqlite3.connect(os.path.join(directory, f'{day}.db'))
+    try:
+        name = partitions.partition_name('crowd_data', day)
+        return [row[0] for row in conn.execute(f'SELECT id FROM {name} ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def test_expired_days_are_archived_and_dropped(archive):
+    old, older = TODAY - timedelta(days=3), TODAY - timedelta(days=5)
+    store(older, old, TODAY - timedelta(days=2), TODAY)
+
+    summary = retention.run(TODAY)
+
+    assert summary['archived'] == summary['dropped'] == [
+        partitions.partition_name('crowd_data', older), partitions.partition_name('crowd_data', old)]
+    assert archived_ids(archive, older) == [1]
+    assert archived_ids(archive, old) == [2]
+    with database.read_connection() as conn:
+        assert partitions.days(conn, 'crowd_data') == [TODAY - timedelta(days=2), TODAY]
+        assert [row[0] for row in conn.execute('SELECT id FROM crowd_data ORDER BY id')] == [3, 4]
+
+
+def test_readings_for_archived_days_are_rejected(archive):
+    oldest_kept = TODAY - timedelta(days=retention.HOT_DAYS)
+    assert retention.oldest_kept_ms(TODAY) == partitions.day_bounds(oldest_kept)[0]
+
+    record = {'type': 'crowd', 'location': 'Metro Station', 'density': 0.5}
+    assert ingest.validate({**record, 'ts': ms(oldest_kept, 0)})[1]['ts'] == ms(oldest_kept, 0)
+    with pytest.raises(ValueError, match='ts must be within the last 2 days'):
+        ingest.validate({**record, 'ts': ms(oldest_kept, 0) - 1})
+
+
+def test_archiving_a_day_again_keeps_what_was_archived(archive):
+    old = TODAY - timedelta(days=3)
+    store(old)
+    retention.run(TODAY)
+
+    # A reading that reached the day after it was archived
+    store(old)
+    retention.run(TODAY)
+
+    assert archived_ids(archive, old) == [1, 2]
+    with database.read_connection() as conn:
+        assert partitions.days(conn, 'crowd_data') == []
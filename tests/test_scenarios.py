@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import scenarios
+
+VEHICLES = ['Car', 'Bus']
+ROUTES = ['Route A', 'Route B']
+
+# (vehicle, route, hour): trips, km, kg CO2
+CELLS = {
+    ('Car', 'Route A', 8): (10, 50.0, 10.0),
+    ('Car', 'Route B', 18): (4, 20.0, 4.0),
+    ('Bus', 'Route A', 8): (2, 30.0, 3.0),
+}
+
+
+def cube():
+    totals = [np.zeros((len(VEHICLES), len(ROUTES), 24)) for _ in range(3)]
+    for (vehicle, route, hour), values in CELLS.items():
+        for total, value in zip(totals, values):
+            total[VEHICLES.index(vehicle), ROUTES.index(route), hour] = value
+    return scenarios.Cube(VEHICLES, ROUTES, *totals, since_ms=0)
+
+
+def by_hour(**deltas):
+    hours = [0.0] * 24
+    for hour, delta in deltas.items():
+        hours[int(hour[1:])] = delta
+    return hours
+
+
+def evaluate(*batch):
+    return scenarios.evaluate(cube(), scenarios.parse_scenarios(list(batch)))
+
+
+def test_one_shift_on_one_route():
+    # Half the Car trips on Route B go by Metro: -0.5 * 4 kg + 0.5 * 20 km * 0.05 kg/km
+    [result] = evaluate({'name': 'metro', 'shifts': [{'from': 'Car', 'to': 'Metro', 'share': 0.5,
+                                                       'routes': 'Route B'}]})
+    assert result == {
+        'name': 'metro',
+        'co2': 15.5,
+        'delta': -1.5,
+        'delta_pct': -8.82,
+        'trips_moved': 2.0,
+        'by_route': {'Route A': 0.0, 'Route B': -1.5},
+        'by_vehicle': {'Car': -2.0, 'Metro': 0.5},
+        'by_hour': by_hour(h18=-1.5),
+    }
+
+
+def test_shifts_of_a_scenario_add_up():
+    # 20% of 8 o'clock Car trips to Bike (-2 + 0.2 * 50 * 0.01), every Bus trip to Walking (-3)
+    morning, untouched = evaluate(
+        {'name': 'morning', 'shifts': [{'from': 'Car', 'to': 'Bike', 'share': 0.2, 'hours': [8]},
+                                       {'from': 'Bus', 'to': 'Walking'}]},
+        {'name': 'taxis', 'shifts': [{'from': 'Taxi', 'to': 'Metro'}]},
+    )
+    assert morning['co2'] == 12.1
+    assert morning['delta'] == -4.9
+    assert morning['trips_moved'] == 4.0
+    assert morning['by_route'] == {'Route A': -4.9, 'Route B': 0.0}
+    assert morning['by_vehicle'] == {'Car': -2.0, 'Bus': -3.0, 'Bike': 0.1}
+    assert morning['by_hour'] == by_hour(h8=-4.9)
+    # No Taxi trips in the window, so nothing moves
+    assert untouched['delta'] == 0.0 and untouched['trips_moved'] == 0.0 and untouched['by_vehicle'] == {}
+
+
+def test_a_scenario_cannot_move_more_than_every_trip():
+    with pytest.raises(ValueError, match="'greedy' moves more than all of some trips"):
+        evaluate({'name': 'greedy', 'shifts': [{'from': 'Car', 'to': 'Bus', 'share': 0.6},
+                                               {'from': 'Car', 'to': 'Metro', 'share': 0.6}]})
+
+
+def test_cube_from_trip_columns():
+    trips = [('Car', 'Route A', 8, 5.0, 1.0)] * 10 + [('Car', 'Route B', 18, 5.0, 1.0)] * 4 \
+        + [('Bus', 'Route A', 8, 15.0, 1.5)] * 2
+    vehicle, route, hour, distance, co2 = zip(*trips)
+    ts = [int(datetime(2026, 3, 1, h, 30).timestamp() * 1000) for h in hour]
+    built = scenarios.Cube.from_columns(
+        np.array([VEHICLES.index(v) for v in vehicle]), VEHICLES, np.array([ROUTES.index(r) for r in route]),
+        ROUTES, np.array(distance), np.array(co2), np.array(ts, dtype=np.int64), since_ms=0)
+    expected = cube()
+    for name in ('trips', 'distance', 'co2'):
+        assert np.allclose(getattr(built, name), getattr(expected, name))
@@ -0,0 +1,124 @@
+"""Time-bucketed series straight from the raw reading tables.
+
+One GROUP BY per series does the bucketing in SQLite; NumPy places the
+buckets on a regular grid and fills the gaps, so there is no per-point
+Python work between the query and the response. NumPy is imported on first
+use so an API worker that never draws a graph does not pay for it at boot.
+"""
+
+import math
+from datetime import datetime
+
+import partitions
+
+MAX_BUCKETS = 10000
+FILL_MODES = ('none', 'zero', 'ffill')
+
+# Series that may be bucketed: table, value column, aggregate, and the key
+# columns it can be filtered on (each has a covering (key, ts) index, see
+# partitions.py)
+SERIES = {
+    'density': {'table': 'crowd_data', 'column': 'density', 'aggregate': 'AVG', 'filters': ('location',)},
+    'co2': {'table': 'mobility_data', 'column': 'co2_emission', 'aggregate': 'SUM', 'filters': ('vehicle_type',)},
+    'co2_level': {'table': 'carbon_data', 'column': 'co2_level', 'aggregate': 'AVG',
+                  'filters': ('location', 'source')},
+}
+
+
+class Grid:
+    """Regular bucket grid covering [start, end), on epoch seconds"""
+
+    def __init__(self, end, minutes, step_seconds):
+        if step_seconds <= 0:
+            raise ValueError('step must be positive')
+        end_s = int(end)
+        self.end_ms = int(end * 1000)
+        start_s = (end_s - minutes * 60) // step_seconds * step_seconds
+        self.size = math.ceil((end_s - start_s) / step_seconds)
+        if self.size > MAX_BUCKETS:
+            raise ValueError(f'window needs {self.size} buckets (max {MAX_BUCKETS}); use a larger step')
+        self.step = step_seconds
+        self.start_s = start_s
+        self.end_s = end_s
+
+    def utc_offset(self):
+        """Local UTC offset in seconds at the end of the window"""
+        return int(datetime.fromtimestamp(self.end_s).astimezone().utcoffset().total_seconds())
+
+    def labels(self, fmt='%H:%M'):
+        """Bucket start times as local wall-clock labels"""
+        # One UTC offset for the whole window (a DST switch inside it shifts
+        # the labels after it by an hour, not the data)
+        import numpy as np
+        offset = self.utc_offset()
+        stamps = np.datetime64(self.start_s + offset, 's') + np.arange(self.size) * np.timedelta64(self.step, 's')
+        if fmt == '%H:%M':
+            return [s[11:16] for s in np.datetime_as_string(stamps, unit='m')]
+        return [s.replace('T', ' ') for s in np.datetime_as_string(stamps, unit='s')]
+
+
+def check_filters(series, filters):
+    for column in filters or {}:
+        if column not in SERIES[series]['filters']:
+            raise ValueError(f"{series} cannot be filtered by {column}")
+
+
+def bucket_query(conn, grid, series, filters=None):
+    """SQL and parameters aggregating one series into the grid"""
+    spec = SERIES[series]
+    check_filters(series, filters)
+    clauses, values = [], []
+    for column, value in (filters or {}).items():
+        clauses.append(f'{column} = ?')
+        values.append(value)
+    clauses += ['ts >= ?', 'ts <= ?']
+    source = partitions.source(conn, spec['table'], (spec['column'],) + tuple(filters or ()),
+                               grid.start_s * 1000, grid.end_ms)
+    sql = f'''
+        SELECT (ts - ?) / ? AS bucket, {spec['aggregate']}({spec['column']}) AS value
+        FROM {source}
+        WHERE {' AND '.join(clauses)}
+        GROUP BY bucket
+    '''
+    return sql, (grid.start_s * 1000, grid.step * 1000, *values, grid.start_s * 1000, grid.end_ms)
+
+
+def bucketed(conn, grid, series, filters=None, hot=None):
+    """Aggregate one series into the grid; empty buckets are NaN.
+
+    A window the hot store (see hot_store.py) holds entirely is answered
+    from memory; one reaching further back runs against SQLite.
+    """
+    if hot is not None and hot.covers(grid.start_s * 1000):
+        check_filters(series, filters)
+        return hot.bucketed(grid, SERIES[series], filters)
+
+    import numpy as np
+    rows = conn.execute(*bucket_query(conn, grid, series, filters)).fetchall()
+
+    values = np.full(grid.size, np.nan)
+    if rows:
+        data = np.array(rows, dtype=float)
+        idx = data[:, 0].astype(np.int64)
+        keep = (idx >= 0) & (idx < grid.size)
+        values[idx[keep]] = data[keep, 1]
+    return values
+
+
+def fill_gaps(values, mode):
+    import numpy as np
+    if mode == 'zero':
+        return np.where(np.isnan(values), 0.0, values)
+    if mode == 'ffill':
+        idx = np.where(np.isnan(values), 0, np.arange(values.size))
+        np.maximum.accumulate(idx, out=idx)
+        return values[idx]
+    return values
+
+
+def to_json_list(values, decimals=2):
+    """NaN becomes None so gaps render as breaks in the chart"""
+    import numpy as np
+    rounded = np.round(values, decimals).astype(object)
+    rounded[np.isnan(values)] = None
+    return rounded.tolist()